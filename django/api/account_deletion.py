@@ -0,0 +1,209 @@
+"""
+Account deletion in the background.
+
+DeleteAccountView only deactivates the user, which rejects their tokens from
+the next request on, and queues an AccountDeletion job. The job removes the
+user's friendships, pings, check-ins, location trails, per-user ping
+rollups and sync log ACCOUNT_DELETION_BATCH_SIZE rows at a time, each batch
+in its own short transaction, so no lock is held for long and memory stays
+flat however long the history is. Friends get sync
+tombstones and fresh ETags for what disappeared. Audio files are removed
+once the batch that referenced them has committed.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import badges, blocks, etags
+from .models import (
+    AccountDeletion, ChangeLog, CheckInSession, Friendship, LocationTrail, LocationTrailChunk, Ping, PingUserDay,
+)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='account-deletion')
+
+
+def schedule(job):
+    """Run `job` on the background worker once the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_run_in_thread, job.pk))
+
+
+def _run_in_thread(job_id):
+    try:
+        run(job_id)
+    finally:
+        connection.close()
+
+
+def _delete_ids(model, ids):
+    # Plain DELETE by primary key: no collector, no per-row signals.
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+
+
+def _delete_friendships(user_id):
+    rows = list(
+        Friendship.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+        .order_by()
+        .values_list('id', 'sender_id', 'receiver_id', 'status')[:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if not rows:
+        return 0, 0
+    with transaction.atomic():
+        _delete_ids(Friendship, [pk for pk, _, _, _ in rows])
+        others = {pk: receiver_id if sender_id == user_id else sender_id for pk, sender_id, receiver_id, _ in rows}
+        badges.add({
+            receiver_id: {'pending_requests': -1}
+            for _, _, receiver_id, status in rows if status == 'pending' and receiver_id != user_id
+        })
+        ChangeLog.objects.bulk_create(
+            [ChangeLog(user_id=other_id, kind=ChangeLog.FRIENDSHIP, object_id=pk) for pk, other_id in others.items()]
+        )
+        etags.bump([etags.FRIENDS, etags.FRIEND_REQUESTS, etags.LIMITS], others.values())
+        blocks.invalidate([user_id, *others.values()])
+    return len(rows), 0
+
+
+def _delete_pings(user_id):
+    rows = list(
+        Ping.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+        .order_by()
+        .values_list('id', 'sender_id', 'receiver_id', 'audio_file')[:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if not rows:
+        return 0, 0
+    with transaction.atomic():
+        # Counted before the rows go, while they can still be read.
+        received = (
+            Ping.objects.filter(pk__in=[pk for pk, _, _, _ in rows]).exclude(receiver_id=user_id)
+            .values('receiver_id').order_by()
+            .annotate(
+                undelivered=Count('id', filter=Q(delivered_at__isnull=True)),
+                unanswered=Count('id', filter=Q(ping_type='emergency', response_at__isnull=True)),
+            )
+            .values_list('receiver_id', 'undelivered', 'unanswered')
+        )
+        deltas = {
+            receiver_id: {'undelivered_pings': -undelivered, 'unanswered_pings': -unanswered}
+            for receiver_id, undelivered, unanswered in received
+        }
+        _delete_ids(Ping, [pk for pk, _, _, _ in rows])
+        badges.add(deltas)
+        others = {pk: receiver_id if sender_id == user_id else sender_id for pk, sender_id, receiver_id, _ in rows}
+        ChangeLog.objects.bulk_create(
+            [ChangeLog(user_id=other_id, kind=ChangeLog.PING, object_id=pk) for pk, other_id in others.items()]
+        )
+        etags.bump([etags.PING_HISTORY, etags.LIMITS], others.values())
+
+    storage = Ping._meta.get_field('audio_file').storage
+    files = 0
+    for name in {audio_file for _, _, _, audio_file in rows if audio_file}:
+        try:
+            storage.delete(name)
+            files += 1
+        except OSError:
+            logger.warning('could not delete %s for user %s', name, user_id, exc_info=True)
+    return len(rows), files
+
+
+def _delete_checkins(user_id):
+    ids = list(
+        CheckInSession.objects.filter(user_id=user_id).order_by().values_list('id', flat=True)
+        [:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if ids:
+        _delete_ids(CheckInSession, ids)
+    return len(ids), 0
+
+
+def _delete_trails(user_id):
+    ids = list(
+        LocationTrailChunk.objects.filter(trail__user_id=user_id).order_by().values_list('id', flat=True)
+        [:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if ids:
+        _delete_ids(LocationTrailChunk, ids)
+        return len(ids), 0
+    ids = list(
+        LocationTrail.objects.filter(user_id=user_id).order_by().values_list('id', flat=True)
+        [:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if ids:
+        _delete_ids(LocationTrail, ids)
+    return len(ids), 0
+
+
+def _delete_change_log(user_id):
+    ids = list(
+        ChangeLog.objects.filter(user_id=user_id).order_by().values_list('id', flat=True)
+        [:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if ids:
+        _delete_ids(ChangeLog, ids)
+    return len(ids), 0
+
+
+def _delete_ping_rollups(user_id):
+    # The per-type rollups are anonymous and keep counting the user's pings.
+    ids = list(
+        PingUserDay.objects.filter(user_id=user_id).order_by().values_list('id', flat=True)
+        [:settings.ACCOUNT_DELETION_BATCH_SIZE]
+    )
+    if ids:
+        _delete_ids(PingUserDay, ids)
+    return len(ids), 0
+
+
+# Friendships go first: once they are gone nobody can ping the user any more.
+STEPS = (
+    (_delete_friendships, 'friendships_deleted'),
+    (_delete_pings, 'pings_deleted'),
+    (_delete_checkins, 'checkins_deleted'),
+    (_delete_trails, None),
+    (_delete_ping_rollups, None),
+    (_delete_change_log, None),
+)
+
+
+def run(job_id):
+    claimed = AccountDeletion.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return
+    job = AccountDeletion.objects.get(pk=job_id)
+    logger.info('deleting account %s', job.user_id)
+    try:
+        for step, counter in STEPS:
+            while True:
+                deleted, files = step(job.user_id)
+                if not deleted:
+                    break
+                progress = {'files_deleted': F('files_deleted') + files}
+                if counter:
+                    progress[counter] = F(counter) + deleted
+                AccountDeletion.objects.filter(pk=job_id).update(**progress)
+
+        # Only the profile and a handful of auth rows are left, so the
+        # regular cascade is cheap now. Deleting the instance (not a
+        # queryset) tells the signals which user is going away.
+        with transaction.atomic():
+            user = User.objects.filter(pk=job.user_id).first()
+            if user is not None:
+                user.delete()
+    except Exception as exc:
+        logger.exception('deleting account %s failed', job.user_id)
+        AccountDeletion.objects.filter(pk=job_id).update(status='failed', error=repr(exc))
+        return
+    AccountDeletion.objects.filter(pk=job_id).update(status='done', finished_at=timezone.now())
+    logger.info('deleted account %s', job.user_id)
@@ -0,0 +1,197 @@
+"""
+Native async versions of the hot ping endpoints for ASGI deployments.
+
+DRF views are sync-only, so under ASGI every request to them is handed to the
+sync_to_async thread pool. These views are plain Django async views with the
+same URLs, payloads and validation rules (`check_ping_rules`) as their DRF
+counterparts in views.py. They are routed instead of the DRF views when
+settings.ASYNC_PING_VIEWS is enabled.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
+
+from . import blocks, etags, ingest
+from .authentication import AsyncJWTAuthentication
+from .idempotency import aidempotent
+from .models import Ping
+from .push_queue import anotify_ping
+from .routers import areplica_reads
+from .serializers import (
+    PingSerializer,
+    PingHistorySerializer,
+    HandshakeSerializer,
+    accepted_friendship,
+    emergency_pings_today,
+    check_ping_rules,
+)
+
+User = get_user_model()
+
+
+class PingInputSerializer(PingSerializer):
+    """
+    PingSerializer's field validation without the database work: the receiver
+    is taken as a plain id and the lookups happen in the view via the async ORM.
+    """
+    receiver = serializers.IntegerField()
+
+    def validate(self, attrs):
+        return attrs
+
+
+class AsyncAPIView(View):
+    authentication = AsyncJWTAuthentication()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token-authenticated like the DRF views, so no CSRF.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if getattr(request, '_force_auth_user', None) is not None:
+            # Forced as for DRF views: a /api/batch/ sub-request carries the batch's user.
+            auth = (request._force_auth_user, request._force_auth_token)
+        else:
+            try:
+                auth = await self.authentication.aauthenticate(request)
+            except exceptions.APIException as exc:
+                return self.auth_failed(exc)
+        if auth is None:
+            return self.auth_failed(exceptions.NotAuthenticated())
+        request.user, request.auth = auth
+        return await super().dispatch(request, *args, **kwargs)
+
+    def auth_failed(self, exc):
+        detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+        return JsonResponse(
+            detail,
+            status=status.HTTP_401_UNAUTHORIZED,
+            headers={'WWW-Authenticate': self.authentication.authenticate_header(None)},
+        )
+
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return {**request.POST.dict(), **request.FILES.dict()}
+
+    async def get_ping(self, pk):
+        return await Ping.objects.filter(pk=pk).afirst()
+
+
+def not_found():
+    return JsonResponse({'detail': 'No Ping matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+
+
+def create_ping(**fields):
+    # In one transaction with the receiver's badge counters (api/badges.py).
+    with transaction.atomic():
+        return Ping.objects.create(**fields)
+
+
+class SendPingView(AsyncAPIView):
+    @aidempotent
+    async def post(self, request):
+        try:
+            data = self.get_data(request)
+        except ValueError as exc:
+            return JsonResponse({'detail': f'JSON parse error - {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PingInputSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        attrs = dict(serializer.validated_data)
+        receiver_id = attrs.pop('receiver')
+
+        if not await User.objects.filter(pk=receiver_id).aexists():
+            message = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+            return JsonResponse({'receiver': [message.format(pk_value=receiver_id)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        sender = request.user
+        blocked = receiver_id in await blocks.ablocked_ids(sender.id)
+        friendship = None if blocked else await accepted_friendship(sender.id, receiver_id).afirst()
+        daily_pings = 0
+        if friendship and attrs.get('ping_type') == 'emergency':
+            daily_pings = await emergency_pings_today(sender.id, receiver_id).acount()
+        try:
+            check_ping_rules(sender, friendship, attrs.get('ping_type'), daily_pings, blocked=blocked)
+        except serializers.ValidationError as exc:
+            return JsonResponse({'non_field_errors': exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        if settings.PING_INGEST_BUFFER:
+            try:
+                ping = await ingest.asave(Ping(sender=sender, receiver_id=receiver_id, **attrs))
+            except ingest.IngestTimeout as exc:
+                return JsonResponse(
+                    {'detail': exc.detail}, status=exc.status_code, headers={'Retry-After': str(exc.wait)}
+                )
+        else:
+            ping = await sync_to_async(create_ping)(sender=sender, receiver_id=receiver_id, **attrs)
+        await anotify_ping(ping)
+        return JsonResponse({'message': 'Ping sent successfully.'}, status=status.HTTP_201_CREATED)
+
+
+class MarkPingDeliveredView(AsyncAPIView):
+    async def post(self, request, pk):
+        ping = await self.get_ping(pk)
+        if ping is None:
+            return not_found()
+
+        # Only the receiver can mark it as delivered
+        if ping.receiver_id != request.user.id:
+            return JsonResponse({'error': 'Not authorized.'}, status=status.HTTP_403_FORBIDDEN)
+
+        # The first delivery counts: delivered_at, the rollups and the badges keep it.
+        if ping.delivered_at is None:
+            await sync_to_async(ping.mark_delivered)()
+
+        return JsonResponse({'message': 'Ping marked as delivered.'}, status=status.HTTP_200_OK)
+
+
+class HandshakeView(AsyncAPIView):
+    @aidempotent
+    async def post(self, request, pk):
+        ping = await self.get_ping(pk)
+        if ping is None:
+            return not_found()
+
+        # Only receiver can handshake
+        if ping.receiver_id != request.user.id:
+            return JsonResponse({'error': 'Not authorized.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            data = self.get_data(request)
+        except ValueError as exc:
+            return JsonResponse({'detail': f'JSON parse error - {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = HandshakeSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        await sync_to_async(ping.respond)(serializer.validated_data['message'])
+        return JsonResponse({'message': 'Handshake sent.'}, status=status.HTTP_200_OK)
+
+
+class PingHistoryView(AsyncAPIView):
+    async def get(self, request):
+        user = request.user
+        etag = '"%s"' % await etags.aget_version(etags.PING_HISTORY, user.id)
+        if etags.etag_matches(request, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            queryset = Ping.objects.filter(
+                Q(sender=user) | Q(receiver=user)
+            ).select_related('sender', 'receiver').order_by('-created_at')[:50]
+            async with areplica_reads(user.id):
+                pings = [ping async for ping in queryset]
+            response = JsonResponse(PingHistorySerializer(pings, many=True).data, safe=False)
+        etags.patch_etag_headers(response, etag)
+        return response
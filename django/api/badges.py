@@ -0,0 +1,98 @@
+"""
+Badge counts for the app icon and tabs (BadgeCountersView): pending friend
+requests received, received pings not yet delivered, and received emergency
+pings not yet answered with a handshake.
+
+They live in one BadgeCounters row per user, so a badge poll is a single
+primary-key read. The model signals (and the bulk paths: broadcasts, ingest
+flushes, account deletion) add each change's difference to the row of the
+user it concerns, in the same transaction as the change, so a count can't
+drift from the rows it counts when either is rolled back. A missing row is
+created from an exact recount the first time it is read or changed.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import BadgeCounters, Friendship, Ping
+
+FIELDS = ('pending_requests', 'undelivered_pings', 'unanswered_pings')
+
+
+def recount(user_id):
+    received = Ping.objects.filter(receiver_id=user_id)
+    return {
+        'pending_requests': Friendship.objects.filter(receiver_id=user_id, status='pending').count(),
+        'undelivered_pings': received.filter(delivered_at__isnull=True).count(),
+        'unanswered_pings': received.filter(ping_type='emergency', response_at__isnull=True).count(),
+    }
+
+
+def _ensure(user_id):
+    """The user's row, from a recount if it is missing, and whether this call created it."""
+    return BadgeCounters.objects.get_or_create(user_id=user_id, defaults=recount(user_id))
+
+
+def get(user_id):
+    counters = BadgeCounters.objects.filter(pk=user_id).values(*FIELDS).first()
+    if counters is None:
+        row, _ = _ensure(user_id)
+        counters = {field: getattr(row, field) for field in FIELDS}
+    return counters
+
+
+def add(deltas):
+    """Applies {user_id: {field: difference}}; users in id order so concurrent writers lock rows alike."""
+    with transaction.atomic():
+        for user_id in sorted(deltas):
+            changes = {field: F(field) + value for field, value in deltas[user_id].items() if value}
+            if changes and not BadgeCounters.objects.filter(pk=user_id).update(**changes):
+                # No row yet. A recount here sees this transaction's change, but
+                # one by another transaction that created the row meanwhile did not.
+                _, created = _ensure(user_id)
+                if not created:
+                    BadgeCounters.objects.filter(pk=user_id).update(**changes)
+
+
+def _pending(status):
+    return int(status == 'pending')
+
+
+def friendship_saved(friendship, created):
+    before = 0 if created else _pending(friendship.loaded_status())
+    difference = _pending(friendship.status) - before
+    if difference:
+        add({friendship.receiver_id: {'pending_requests': difference}})
+
+
+def friendship_deleted(friendship):
+    if _pending(friendship.loaded_status()):
+        add({friendship.receiver_id: {'pending_requests': -1}})
+
+
+def _ping_counts(ping, delivered_at, response_at):
+    return {
+        'undelivered_pings': int(delivered_at is None),
+        'unanswered_pings': int(ping.ping_type == 'emergency' and response_at is None),
+    }
+
+
+def ping_saved(ping, created):
+    after = _ping_counts(ping, ping.delivered_at, ping.response_at)
+    before = dict.fromkeys(after, 0) if created else _ping_counts(ping, *ping.loaded_milestones())
+    add({ping.receiver_id: {field: after[field] - before[field] for field in after}})
+
+
+def ping_deleted(ping):
+    counts = _ping_counts(ping, *ping.loaded_milestones())
+    add({ping.receiver_id: {field: -value for field, value in counts.items()}})
+
+
+def pings_created(pings):
+    """What the post_save signal does, for pings inserted with bulk_create."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for ping in pings:
+        for field, value in _ping_counts(ping, ping.delivered_at, ping.response_at).items():
+            deltas[ping.receiver_id][field] += value
+    add(deltas)
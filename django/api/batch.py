@@ -0,0 +1,143 @@
+"""
+/api/batch/: several API calls in one round trip.
+
+The batch is authenticated once; each sub-request is resolved with the URL
+resolver and handed straight to its view with the batch's user forced onto
+it, so there is no extra HTTP, TLS or JWT work per call. Sub-requests run in
+order, except that consecutive reads (GET) run concurrently.
+"""
+import asyncio
+import json
+import logging
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.urls import Resolver404, resolve, reverse
+from rest_framework import status
+
+from . import throttling
+from .async_views import AsyncAPIView
+from .serializers import BatchSerializer
+
+logger = logging.getLogger(__name__)
+
+# Never taken from a sub-request: the batch itself carries the identity.
+BLOCKED_HEADERS = {'authorization', 'cookie', 'host', 'content-length', 'content-type'}
+
+
+def build_request(request, sub):
+    url = urlsplit(sub['path'])
+    body = json.dumps(sub['body']).encode() if 'body' in sub else b''
+    environ = {
+        'REQUEST_METHOD': sub['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'SERVER_NAME': request.get_host().split(':')[0],
+        'SERVER_PORT': request.get_port(),
+        'REMOTE_ADDR': request.META.get('REMOTE_ADDR', ''),
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+        'wsgi.url_scheme': request.scheme,
+    }
+    for name, value in sub.get('headers', {}).items():
+        if name.lower() not in BLOCKED_HEADERS:
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    sub_request = WSGIRequest(environ)
+    # DRF views and AsyncAPIView pick these up instead of authenticating again.
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def encode_response(response):
+    if hasattr(response, 'render'):
+        response.render()
+    body = None
+    if response.content:
+        if response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(response.content)
+        else:
+            body = response.content.decode(response.charset)
+    headers = {name: response[name] for name in ('ETag', 'Location', 'Idempotent-Replayed', 'Retry-After') if response.has_header(name)}
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def error(status_code, detail):
+    return {'status': status_code, 'headers': {}, 'body': {'detail': detail}}
+
+
+class BatchView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            data = self.get_data(request)
+        except ValueError as exc:
+            return JsonResponse({'detail': f'JSON parse error - {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = BatchSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results, reads = [], []
+        for sub in serializer.validated_data['requests']:
+            if sub['method'] == 'GET':
+                reads.append(sub)
+                continue
+            results += await self.run_reads(request, reads)
+            reads = []
+            results.append(await self.run(request, sub, concurrent=False))
+        results += await self.run_reads(request, reads)
+        return JsonResponse({'responses': results})
+
+    async def run_reads(self, request, subs):
+        return await asyncio.gather(*(self.run(request, sub, concurrent=True) for sub in subs))
+
+    async def run(self, request, sub, concurrent):
+        path = urlsplit(sub['path']).path
+        if path == reverse('batch'):
+            return error(status.HTTP_400_BAD_REQUEST, 'Batches cannot be nested.')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return error(status.HTTP_404_NOT_FOUND, 'Not found.')
+
+        sub_request = build_request(request, sub)
+        sub_request.resolver_match = match
+        if settings.THROTTLE_ENABLED:
+            # Each call counts against its own route, as if sent on its own.
+            throttled = await throttling.acheck(sub_request, match.url_name, request.user.id)
+            if throttled is not None:
+                return encode_response(throttled)
+        try:
+            if iscoroutinefunction(match.func):
+                response = await match.func(sub_request, *match.args, **match.kwargs)
+            else:
+                # Reads get their own worker threads so they overlap; writes
+                # stay on the shared thread, in order.
+                response = await sync_to_async(self.call_view, thread_sensitive=not concurrent)(
+                    match, sub_request, concurrent
+                )
+        except Http404:
+            return error(status.HTTP_404_NOT_FOUND, 'Not found.')
+        except Exception:
+            logger.exception('batch sub-request %s %s failed', sub['method'], sub['path'])
+            return error(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal server error.')
+        return encode_response(response)
+
+    def call_view(self, match, sub_request, own_thread):
+        if own_thread:
+            close_old_connections()
+        try:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            if own_thread:
+                close_old_connections()
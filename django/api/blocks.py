@@ -0,0 +1,58 @@
+"""
+Per-user blocked sets: the ids of the users someone has blocked or been
+blocked by, cached so search, friend requests and ping admission can check
+a block in memory instead of adding an OR-query on Friendship each.
+
+A block is a Friendship with status 'blocked', and it works both ways: the
+set of each side holds the other. The Friendship signals invalidate both
+sets once the change commits; BLOCKS_CACHE_SECONDS bounds how long a set
+refilled by a request racing that commit can stay stale.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Friendship
+
+
+def _key(user_id):
+    return f'blocks:{user_id}'
+
+
+def _query(user_id):
+    # From the primary: a replica could still show a pair that was just blocked as friends.
+    return (
+        Friendship.objects.using('default')
+        .filter(Q(sender_id=user_id) | Q(receiver_id=user_id), status='blocked')
+        .values_list('sender_id', 'receiver_id')
+    )
+
+
+def _others(user_id, rows):
+    return frozenset(receiver_id if sender_id == user_id else sender_id for sender_id, receiver_id in rows)
+
+
+def blocked_ids(user_id):
+    key = _key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _others(user_id, _query(user_id))
+        cache.set(key, ids, timeout=settings.BLOCKS_CACHE_SECONDS)
+    return ids
+
+
+async def ablocked_ids(user_id):
+    key = _key(user_id)
+    ids = await cache.aget(key)
+    if ids is None:
+        ids = _others(user_id, [row async for row in _query(user_id)])
+        await cache.aset(key, ids, timeout=settings.BLOCKS_CACHE_SECONDS)
+    return ids
+
+
+def invalidate(user_ids):
+    """Drop the sets of `user_ids` once the current transaction commits."""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
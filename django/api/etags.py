@@ -0,0 +1,97 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import pin_to_primary
+
+# Per-user resources the mobile client polls. Each one carries an opaque
+# version token in the cache that is replaced whenever something it renders
+# changes, so answering If-None-Match costs one cache read and no SQL.
+FRIENDS = 'friends'
+FRIEND_REQUESTS = 'friend_requests'
+PING_HISTORY = 'ping_history'
+PROFILE = 'profile'
+LIMITS = 'limits'
+
+
+def _key(resource, user_id):
+    return f'etag:{resource}:{user_id}'
+
+
+def get_version(resource, user_id):
+    key = _key(resource, user_id)
+    version = cache.get(key)
+    if version is None:
+        # add() so that concurrent workers agree on a single token.
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(resource, user_id):
+    key = _key(resource, user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump(resources, user_ids):
+    """Invalidate `resources` for every user in `user_ids` once the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    keys = [_key(resource, user_id) for resource in resources for user_id in user_ids]
+    if not keys:
+        return
+
+    # Bumping before commit would let a concurrent poll tag pre-commit data
+    # with the new token and then keep serving it as 304. For the same reason
+    # the users are pinned to the primary for a while: a lagging replica
+    # would return old rows under the new token.
+    def _bump():
+        version = uuid4().hex
+        cache.set_many({key: version for key in keys}, timeout=None)
+        pin_to_primary(*user_ids)
+
+    transaction.on_commit(_bump)
+
+
+def etag_matches(request, etag):
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in client_etags or etag in {tag.removeprefix('W/') for tag in client_etags}
+
+
+def patch_etag_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET with 304 Not Modified when the client's If-None-Match still
+    matches the resource version, before the queryset is evaluated.
+    """
+    etag_resource = None
+
+    def get_etag(self, request):
+        return '"%s"' % get_version(self.etag_resource, request.user.id)
+
+    def get(self, request, *args, **kwargs):
+        # Read the version before running the query: a write that lands in
+        # between only makes the returned tag stale, never the data.
+        etag = self.get_etag(request)
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = self.get_fresh_response(request, *args, **kwargs)
+        patch_etag_headers(response, etag)
+        return response
+
+    def get_fresh_response(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
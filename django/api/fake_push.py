@@ -0,0 +1,77 @@
+"""
+A local stand-in for the FCM HTTP v1 send endpoint, for exercising
+FCMPushBackend without Firebase:
+
+    python manage.py fake_push_server --port 9099
+    PUSH_BACKEND=api.push.FCMPushBackend \
+    FCM_ENDPOINT=http://127.0.0.1:9099/v1/projects/fake/messages:send python manage.py runserver
+
+Tokens starting with STALE_PREFIX get the answer FCM gives for uninstalled
+apps (404 UNREGISTERED), so pruning can be observed end to end. `latency`
+delays every answer, to stand in for the real provider under load.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STALE_PREFIX = 'stale-'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        token = body.get('message', {}).get('token', '')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.record(token, body)
+        if token.startswith(STALE_PREFIX):
+            self._reply(404, {'error': {
+                'code': 404,
+                'status': 'NOT_FOUND',
+                'message': 'Requested entity was not found.',
+                'details': [{'@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError', 'errorCode': 'UNREGISTERED'}],
+            }})
+        else:
+            self._reply(200, {'name': f'projects/fake/messages/{self.server.count}'})
+
+    def _reply(self, status_code, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePushServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every lane worker opens PUSH_CONCURRENCY connections at once.
+    request_queue_size = 256
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.messages = []  # (token, body, time received)
+
+    @property
+    def count(self):
+        return len(self.messages)
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1/projects/fake/messages:send'
+
+    def record(self, token, body):
+        with self._lock:
+            self.messages.append((token, body, time.time()))
+
+    def start(self):
+        """Serves from a background thread; returns self."""
+        threading.Thread(target=self.serve_forever, name='fake-push', daemon=True).start()
+        return self
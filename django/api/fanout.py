@@ -0,0 +1,58 @@
+"""
+Fan-out of a user's public profile changes (status, nickname) to friends.
+
+Runs once per change: one query for the counterparts, one batched cache
+write to invalidate their friend-list and friend-request ETags, and, after
+commit and off the request thread, one compact status event pushed to the
+friends that are currently online.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import etags, presence, push_queue
+from .models import Friendship
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='fanout')
+
+
+def status_event(profile):
+    return {
+        'type': 'status',
+        'user_id': profile.user_id,
+        'status': profile.status,
+        'nickname': profile.nickname,
+    }
+
+
+def profile_changed(profile):
+    counterparts = Friendship.objects.filter(
+        Q(sender_id=profile.user_id) | Q(receiver_id=profile.user_id)
+    ).values_list('sender_id', 'receiver_id', 'status')
+
+    other_ids, friend_ids = [], []
+    for sender_id, receiver_id, status in counterparts:
+        other_id = receiver_id if sender_id == profile.user_id else sender_id
+        other_ids.append(other_id)
+        if status == 'accepted':
+            friend_ids.append(other_id)
+
+    etags.bump([etags.FRIENDS, etags.FRIEND_REQUESTS], other_ids)
+    if friend_ids:
+        event = status_event(profile)
+        transaction.on_commit(lambda: _executor.submit(_emit, friend_ids, event))
+
+
+def _emit(friend_ids, event):
+    try:
+        online_ids = presence.online_user_ids(friend_ids)
+        if online_ids:
+            push_queue.enqueue(online_ids, event, 'status')
+    except Exception:
+        logger.exception('status fan-out for user %s failed', event['user_id'])
+    finally:
+        connection.close()
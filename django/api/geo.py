@@ -0,0 +1,201 @@
+"""
+Geohash cells for Ping locations and the "friends near a point" query.
+
+A location is stored as a 52-bit integer geohash (26 bits of longitude and
+26 of latitude, interleaved as in the usual base32 geohash, so about 0.6 m
+precision). Every cell at every level is then a contiguous range of
+integers, which a plain B-tree index answers on SQLite and PostgreSQL alike,
+without PostGIS and without depending on the column collation as a text
+prefix would.
+
+friends_near() looks up the cell around the point and its eight neighbours,
+at the finest level where a cell is still larger than the radius, keeps the
+friends whose latest recent location falls in them, and refines those with
+the haversine distance, vectorized with numpy when it is installed. It only
+uses the locations friends attached to pings they sent the user: a location
+shared with someone else is never used to place them for this user.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:  # Optional: fall back to a plain loop.
+    numpy = None
+
+AXIS_BITS = 26
+# Past this latitude cells are too narrow to size; circles reaching it get
+# whole rows of POLAR_BITS cells (22.5 degrees high) instead.
+POLAR_LATITUDE = 89.9
+POLAR_BITS = 3
+EARTH_RADIUS_M = 6_371_008.8
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+def _interleave(lon_bits, lat_bits, bits=AXIS_BITS):
+    value = 0
+    for i in range(bits - 1, -1, -1):
+        value = (value << 2) | ((lon_bits >> i) & 1) << 1 | ((lat_bits >> i) & 1)
+    return value
+
+
+def _quantize(value, low, span):
+    return min(int((float(value) - low) / span * (1 << AXIS_BITS)), (1 << AXIS_BITS) - 1)
+
+
+def encode(latitude, longitude):
+    return _interleave(_quantize(longitude, -180, 360), _quantize(latitude, -90, 180))
+
+
+class GeohashField(models.BigIntegerField):
+    """
+    The geohash of the model's latitude/longitude, set on every save and
+    bulk_create (like auto_now), or NULL when either is missing.
+    """
+
+    def __init__(self, *args, latitude_field='latitude', longitude_field='longitude', **kwargs):
+        self.latitude_field, self.longitude_field = latitude_field, longitude_field
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.latitude_field != 'latitude':
+            kwargs['latitude_field'] = self.latitude_field
+        if self.longitude_field != 'longitude':
+            kwargs['longitude_field'] = self.longitude_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        latitude = getattr(model_instance, self.latitude_field)
+        longitude = getattr(model_instance, self.longitude_field)
+        value = None if latitude is None or longitude is None else encode(latitude, longitude)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def _level(latitude, radius_m):
+    """
+    Bits per axis of the smallest cells still at least radius_m high and wide
+    around latitude, or None when the circle reaches POLAR_LATITUDE.
+    """
+    # Cells narrow towards the poles: size them for the edge of the circle nearest one.
+    edge = abs(float(latitude)) + radius_m / METERS_PER_DEGREE
+    if edge >= POLAR_LATITUDE:
+        return None
+    for bits in range(AXIS_BITS, 0, -1):
+        height = 180 / (1 << bits) * METERS_PER_DEGREE
+        width = 360 / (1 << bits) * METERS_PER_DEGREE * math.cos(math.radians(edge))
+        if height >= radius_m and width >= radius_m:
+            return bits
+    return 1
+
+
+def cover(latitude, longitude, radius_m):
+    """
+    Geohash ranges (inclusive, merged where adjacent) of the 3x3 cells around
+    the point, or of the three rows of cells around it near a pole; together
+    they contain every point within radius_m.
+    """
+    bits = _level(latitude, radius_m)
+    if bits is None:
+        bits, lon_offsets = POLAR_BITS, range(1 << POLAR_BITS)
+    else:
+        lon_offsets = (-1, 0, 1)
+    shift = AXIS_BITS - bits
+    lat_cell = _quantize(latitude, -90, 180) >> shift
+    lon_cell = _quantize(longitude, -180, 360) >> shift
+    cells = 1 << bits
+    prefixes = sorted({
+        _interleave((lon_cell + dlon) % cells, lat_cell + dlat, bits)
+        for dlat in (-1, 0, 1) if 0 <= lat_cell + dlat < cells
+        for dlon in lon_offsets
+    })
+    ranges = []
+    for prefix in prefixes:
+        low, high = prefix << 2 * shift, ((prefix + 1) << 2 * shift) - 1
+        if ranges and ranges[-1][1] + 1 == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def haversine_m(latitude, longitude, latitudes, longitudes):
+    """Distances in meters from one point to each of the given points."""
+    if numpy is not None:
+        lat1, lon1 = numpy.radians(float(latitude)), numpy.radians(float(longitude))
+        lat2 = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        lon2 = numpy.radians(numpy.asarray(longitudes, dtype=float))
+        a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+        return (2 * EARTH_RADIUS_M * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+    lat1, lon1 = math.radians(float(latitude)), math.radians(float(longitude))
+    distances = []
+    for lat, lon in zip(latitudes, longitudes):
+        lat2, lon2 = math.radians(float(lat)), math.radians(float(lon))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+def round_up(distance_m):
+    """Up to the next PROXIMITY_DISTANCE_STEP_M, so answers can't be narrowed down to a point."""
+    step = settings.PROXIMITY_DISTANCE_STEP_M
+    return max(1, math.ceil(distance_m / step)) * step
+
+
+def friends_near(user_id, latitude, longitude, radius_m):
+    """
+    Accepted friends whose latest location sent to user_id in the last
+    PROXIMITY_LOCATION_MAX_AGE_MINUTES is within radius_m of the point,
+    nearest first, as (friend_id, distance_m, located_at).
+
+    Three queries: the friend ids, the senders of recent pings to the user
+    located in the covering cells, and the latest location of the friends
+    among them, who may have left the cells since.
+    """
+    from .models import Friendship, Ping
+
+    friend_ids = {
+        receiver_id if sender_id == user_id else sender_id
+        for sender_id, receiver_id in Friendship.objects.filter(
+            (Q(sender_id=user_id) | Q(receiver_id=user_id)) & Q(status='accepted')
+        ).values_list('sender_id', 'receiver_id')
+    }
+    if not friend_ids:
+        return []
+    since = timezone.now() - timedelta(minutes=settings.PROXIMITY_LOCATION_MAX_AGE_MINUTES)
+    received = (
+        Ping.objects.filter(receiver_id=user_id, created_at__gte=since).order_by().values_list('sender_id', flat=True)
+    )
+    # One range scan of the received-pings index per merged range: with the
+    # ranges OR-ed, SQLite would walk all of the user's received pings instead.
+    # Friends are matched here rather than in SQL, where the planner would
+    # rather walk every ping of every friend through the sender index.
+    first, *rest = [received.filter(geohash__range=cell) for cell in cover(latitude, longitude, radius_m)]
+    candidates = friend_ids.intersection(first.union(*rest))
+    if not candidates:
+        return []
+
+    latest = (
+        Ping.objects.filter(receiver_id=user_id, sender_id=OuterRef('pk'), geohash__isnull=False)
+        .order_by('-created_at')
+    )
+    ping_ids = get_user_model().objects.filter(pk__in=candidates).values(ping_id=Subquery(latest.values('pk')[:1]))
+    rows = list(
+        Ping.objects.filter(pk__in=ping_ids, created_at__gte=since)
+        .order_by().values_list('sender_id', 'latitude', 'longitude', 'created_at')
+    )
+    distances = haversine_m(latitude, longitude, [row[1] for row in rows], [row[2] for row in rows])
+    return sorted(
+        ((row[0], distance, row[3]) for row, distance in zip(rows, distances) if distance <= radius_m),
+        key=lambda friend: friend[1],
+    )
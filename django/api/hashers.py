@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count taken from PASSWORD_PBKDF2_ITERATIONS
+    (Django's default when unset). It keeps the `pbkdf2_sha256` algorithm name,
+    so existing hashes still verify; a hash made with a different count is
+    re-encoded with the configured one the next time its user logs in.
+    """
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
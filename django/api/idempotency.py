@@ -0,0 +1,150 @@
+"""
+Idempotency-Key support for mutating endpoints.
+
+The first request with a given key (per user and endpoint) claims it with an
+atomic cache.add, runs, and stores its response for IDEMPOTENCY_TTL_SECONDS.
+Retries with the same key replay that response without running the view;
+retries that arrive while the first one is still running wait for it instead
+of racing it. Reusing a key with a different body is rejected with 422.
+Only successful responses are kept: after a 4xx or 5xx the key is released,
+so a retry with the same key runs again and sees the current state.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+PENDING = 'pending'
+POLL_SECONDS = 0.05
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{request.user.id}:{request.method}:{request.path}:{digest}'
+
+
+def _fingerprint(request):
+    # Multipart bodies (audio uploads) can be large; their length will do.
+    if request.content_type.startswith('multipart/'):
+        return request.META.get('CONTENT_LENGTH', '')
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _error(detail, status_code, response_class):
+    if response_class is Response:
+        return Response({'detail': detail}, status=status_code)
+    return JsonResponse({'detail': detail}, status=status_code)
+
+
+def _replay(stored, fingerprint, response_class):
+    if stored['fingerprint'] != fingerprint:
+        return _error(
+            f'{HEADER} was already used with a different request body.',
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            response_class,
+        )
+    if response_class is Response:
+        response = Response(stored['data'], status=stored['status'])
+    else:
+        response = JsonResponse(stored['data'], status=stored['status'], safe=False)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(request, response_class):
+    """Returns (cache_key, fingerprint), or an error response for a malformed key."""
+    key = request.headers.get(HEADER)
+    if len(key) > 255:
+        return _error(f'{HEADER} must be at most 255 characters.', status.HTTP_400_BAD_REQUEST, response_class)
+    return _cache_key(request, key), _fingerprint(request)
+
+
+def _result(fingerprint, response):
+    """What to keep for replays; None for errors, which the client may retry for real."""
+    if response.status_code >= 400:
+        return None
+    data = response.data if isinstance(response, Response) else json.loads(response.content or b'null')
+    return {'fingerprint': fingerprint, 'status': response.status_code, 'data': data}
+
+
+def idempotent(method):
+    """Decorator for DRF view handlers (`post`, `patch`, ...)."""
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if HEADER not in request.headers:
+            return method(self, request, *args, **kwargs)
+        claim = _claim(request, Response)
+        if isinstance(claim, Response):
+            return claim
+        cache_key, fingerprint = claim
+
+        if cache.add(cache_key, PENDING, timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            try:
+                response = method(self, request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            result = _result(fingerprint, response)
+            if result is None:
+                cache.delete(cache_key)
+            else:
+                cache.set(cache_key, result, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+            return response
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        stored = cache.get(cache_key)
+        while stored == PENDING and time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+            stored = cache.get(cache_key)
+        if stored == PENDING:
+            return _error(f'A request with this {HEADER} is still in progress.', status.HTTP_409_CONFLICT, Response)
+        if stored is None:
+            # The first request failed and released the key; run this one.
+            return wrapper(self, request, *args, **kwargs)
+        return _replay(stored, fingerprint, Response)
+    return wrapper
+
+
+def aidempotent(method):
+    """Decorator for the handlers of the native async views (api/async_views.py)."""
+    @wraps(method)
+    async def wrapper(self, request, *args, **kwargs):
+        if HEADER not in request.headers:
+            return await method(self, request, *args, **kwargs)
+        claim = _claim(request, JsonResponse)
+        if isinstance(claim, JsonResponse):
+            return claim
+        cache_key, fingerprint = claim
+
+        if await cache.aadd(cache_key, PENDING, timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            try:
+                response = await method(self, request, *args, **kwargs)
+            except Exception:
+                await cache.adelete(cache_key)
+                raise
+            result = _result(fingerprint, response)
+            if result is None:
+                await cache.adelete(cache_key)
+            else:
+                await cache.aset(cache_key, result, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+            return response
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        stored = await cache.aget(cache_key)
+        while stored == PENDING and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            stored = await cache.aget(cache_key)
+        if stored == PENDING:
+            return _error(f'A request with this {HEADER} is still in progress.', status.HTTP_409_CONFLICT, JsonResponse)
+        if stored is None:
+            return await wrapper(self, request, *args, **kwargs)
+        return _replay(stored, fingerprint, JsonResponse)
+    return wrapper
@@ -0,0 +1,144 @@
+"""
+Group-commit ingestion for ping bursts (PING_INGEST_BUFFER).
+
+Validated pings are handed to a per-process buffer instead of being inserted
+one by one. A flusher thread writes whatever has accumulated with a single
+bulk_create and commit once PING_INGEST_BATCH_SIZE pings are waiting or the
+oldest has waited PING_INGEST_MAX_DELAY_MS, and each request then gets its
+saved ping (with id) back.
+
+Durability: a request only answers 201 after the batch holding its ping has
+committed, so an acknowledged ping is exactly as durable as before. What
+changes:
+- Pings in a batch commit together. If the batch fails, each ping is retried
+  on its own, so one bad row only fails its own request.
+- If the process dies, the pings lost are the ones whose requests had not
+  been answered yet. Those clients see a dropped connection and retry; with
+  an Idempotency-Key the retry is safe.
+- A ping still queued after PING_INGEST_TIMEOUT is taken off the queue and
+  its request answers 503 with Retry-After: it was not stored, so a plain
+  retry is safe. A ping whose batch is already being written is waited for,
+  so no request is answered before its ping's outcome is known.
+- Requests wait up to PING_INGEST_MAX_DELAY_MS longer. The daily emergency
+  limit is checked before the wait, so a sender racing themselves can get
+  a ping or two past it within that window (as with concurrent requests today).
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from rest_framework import exceptions, status
+
+from . import signals
+from .models import Ping
+
+logger = logging.getLogger(__name__)
+
+
+class IngestTimeout(exceptions.APIException):
+    """The ping was taken off the queue unsaved, so the client may just retry."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The ping could not be stored in time, please retry.'
+    default_code = 'ingest_timeout'
+    # Sent as Retry-After (by DRF's exception handler for the DRF views).
+    wait = 1
+
+
+class PingIngestBuffer:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = []  # (ping, future)
+        self._flusher = None
+
+    def submit(self, ping):
+        """Queues an unsaved Ping; the returned future resolves to it once committed."""
+        future = concurrent.futures.Future()
+        with self._cond:
+            self._pending.append((ping, future))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='ping-ingest', daemon=True)
+                self._flusher.start()
+            if len(self._pending) == 1 or len(self._pending) >= settings.PING_INGEST_BATCH_SIZE:
+                self._cond.notify()
+        return future
+
+    def _next_batch(self):
+        batch_size = settings.PING_INGEST_BATCH_SIZE
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give the batch until the first ping has waited long enough.
+            deadline = time.monotonic() + settings.PING_INGEST_MAX_DELAY_MS / 1000
+            while len(self._pending) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending = self._pending[:batch_size], self._pending[batch_size:]
+        # From here on a ping can't be cancelled; ones whose request gave up are dropped.
+        return [(ping, future) for ping, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            try:
+                self.flush(batch)
+            except Exception:
+                logger.exception('ping ingest flush failed')
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError('Ping could not be stored.'))
+
+    def flush(self, batch):
+        if not batch:
+            return
+        pings = [ping for ping, _ in batch]
+        try:
+            with transaction.atomic():
+                Ping.objects.bulk_create(pings)
+                signals.pings_created(pings)
+        except Exception:
+            logger.warning('bulk insert of %d pings failed, inserting one by one', len(pings), exc_info=True)
+            for ping, future in batch:
+                ping.pk = None
+                try:
+                    # With its signal writes, like the bulk path: a ping is
+                    # never stored while its request is told it failed.
+                    with transaction.atomic():
+                        ping.save()
+                except Exception as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(ping)
+            return
+        for ping, future in batch:
+            future.set_result(ping)
+
+
+buffer = PingIngestBuffer()
+
+
+def save(ping):
+    future = buffer.submit(ping)
+    try:
+        return future.result(timeout=settings.PING_INGEST_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        if future.cancel():
+            raise IngestTimeout
+    # Its batch is being written: wait for the outcome instead of leaving it unknown.
+    return future.result()
+
+
+async def asave(ping):
+    future = buffer.submit(ping)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), settings.PING_INGEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        if future.cancel():
+            raise IngestTimeout
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,72 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import rollups
+from api.models import Ping, PingLatencyDay, PingTypeDay, PingUserDay
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the ping rollups (api/rollups.py) for a range of days from the pings themselves, "
+        "streaming them in chunks. Each day's rollups are replaced in one transaction. Meant for days that "
+        "are over: a ping of the range delivered while the command runs can be counted twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.fromisoformat, help="First day (YYYY-MM-DD); default: the first ping.")
+        parser.add_argument('--until', type=datetime.fromisoformat, help="Last day (YYYY-MM-DD); default: yesterday.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        until = options['until'].date() if options['until'] else timezone.localdate() - timedelta(days=1)
+        if options['since']:
+            since = options['since'].date()
+        else:
+            first = Ping.objects.order_by('id').values_list('created_at', flat=True).first()
+            if first is None:
+                self.stdout.write("No pings.")
+                return
+            since = timezone.localdate(first)
+        if since > until:
+            raise CommandError(f"--since {since} is after --until {until}.")
+
+        total = 0
+        day = since
+        while day <= until:
+            # One transaction per day: reports keep showing the old counts
+            # until the new ones are complete.
+            with transaction.atomic():
+                for model in (PingTypeDay, PingLatencyDay, PingUserDay):
+                    model.objects.filter(day=day).delete()
+                total += self.rebuild(day, options['chunk_size'])
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {since} to {until} from {total} pings."))
+
+    def rebuild(self, day, chunk_size):
+        pings = Ping.objects.filter(
+            created_at__gte=timezone.make_aware(datetime.combine(day, time.min)),
+            created_at__lt=timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)),
+        ).only('id', 'sender_id', 'receiver_id', 'ping_type', 'created_at', 'delivered_at', 'response_at')
+
+        # Keyset pagination on the primary key: constant memory, no OFFSET.
+        last_id, total = 0, 0
+        while True:
+            chunk = list(pings.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not chunk:
+                break
+            deltas = rollups.Deltas()
+            for ping in chunk:
+                deltas.created(ping)
+                if ping.delivered_at is not None:
+                    deltas.delivered(ping)
+                if ping.response_at is not None:
+                    deltas.responded(ping)
+            deltas.write()
+            last_id = chunk[-1].id
+            total += len(chunk)
+            self.stdout.write(f"{day}: {total} pings rolled up")
+        return total
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema into OPENAPI_SCHEMA_PATH so workers serve it as a static file."
+
+    def handle(self, *args, **options):
+        path = settings.OPENAPI_SCHEMA_PATH
+        path.parent.mkdir(parents=True, exist_ok=True)
+        call_command('spectacular', file=str(path), validate=True)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.fake_push import FakePushServer
+
+
+class Command(BaseCommand):
+    help = "Serve a fake FCM v1 endpoint for testing push delivery locally (see api/fake_push.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9099)
+        parser.add_argument('--latency', type=float, default=0, help="Seconds to wait before answering each message.")
+
+    def handle(self, *args, **options):
+        server = FakePushServer(options['host'], options['port'], options['latency'])
+        self.stdout.write(f'Set FCM_ENDPOINT={server.endpoint}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'{server.count} messages received')
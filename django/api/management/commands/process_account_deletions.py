@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api import account_deletion
+from api.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    help = "Run queued account deletions, e.g. ones left behind by a restarted worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry', action='store_true',
+            help="Also restart failed and interrupted (running) jobs. Only use when no worker is processing them.",
+        )
+
+    def handle(self, *args, **options):
+        jobs = AccountDeletion.objects.filter(status='pending')
+        if options['retry']:
+            AccountDeletion.objects.filter(status__in=['failed', 'running']).update(status='pending', error='')
+        for job_id in jobs.order_by('requested_at').values_list('id', flat=True):
+            account_deletion.run(job_id)
+            job = AccountDeletion.objects.get(pk=job_id)
+            style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+            self.stdout.write(style(
+                f'user {job.user_id}: {job.status}, {job.friendships_deleted} friendships, {job.pings_deleted} pings, '
+                f'{job.checkins_deleted} check-ins, {job.files_deleted} files'
+            ))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync log entries (api/sync.py) older than SYNC_RETENTION_DAYS. Clients whose token "
+        "predates what is left get a full snapshot on their next sync. Meant to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        deleted = sync.prune(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} change log entries older than {settings.SYNC_RETENTION_DAYS} days."
+        ))
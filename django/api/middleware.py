@@ -0,0 +1,120 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import profiling, throttling
+from .routers import pin_to_primary
+
+try:
+    import brotli
+except ImportError:  # Optional: fall back to gzip only.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware with a configurable size threshold (COMPRESSION_MIN_SIZE)
+    that prefers brotli when the `brotli` package is installed and the client
+    accepts it.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if brotli is None or response.has_header('Content-Encoding'):
+            return super().process_response(request, response)
+
+        if not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class ReadYourWritesMiddleware(MiddlewareMixin):
+    """
+    Pins a user to the primary database after a successful write request so
+    their next reads don't come from a lagging replica. DRF views copy the
+    token-authenticated user onto the Django request, so it is visible here.
+    """
+
+    def process_response(self, request, response):
+        if (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and getattr(request, 'user', None) is not None
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.id)
+        return response
+
+
+class ThrottleMiddleware(MiddlewareMixin):
+    """
+    Applies the per-route rate limits in api.throttling once the URL is
+    resolved, so a throttled request never reaches authentication or the view.
+    Admin routes (namespaced) are left alone.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if not settings.THROTTLE_ENABLED or match.namespace or not match.url_name:
+            return None
+        return throttling.check(request, match.url_name)
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Runs the rest of the chain under api.profiling.Recorder for staff
+    requests sent with `X-Profile: 1` and a PROFILING_SAMPLE_RATE sample of
+    the others. Everything else passes straight through.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not profiling.wanted(request) or not profiling.busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            with profiling.Recorder(request) as recorder:
+                response = self.get_response(request)
+            self.save(recorder, response)
+        finally:
+            profiling.busy.release()
+        return response
+
+    async def __acall__(self, request):
+        if not await profiling.awanted(request) or not profiling.busy.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            with profiling.Recorder(request) as recorder:
+                response = await self.get_response(request)
+            await sync_to_async(self.save)(recorder, response)
+        finally:
+            profiling.busy.release()
+        return response
+
+    def save(self, recorder, response):
+        try:
+            recorder.save(response)
+        except OSError:
+            logger.warning('could not store profile %s', recorder.id, exc_info=True)
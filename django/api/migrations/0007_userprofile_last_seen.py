@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_friendship_ringtone_ping_audio_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 09:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_userprofile_last_seen'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ping',
+            index=models.Index(fields=['sender', 'ping_type', 'created_at'], name='ping_sender_type_created_idx'),
+        ),
+    ]
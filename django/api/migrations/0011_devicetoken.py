@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-19 09:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_profile_tokens(apps, schema_editor):
+    UserProfile = apps.get_model('api', 'UserProfile')
+    DeviceToken = apps.get_model('api', 'DeviceToken')
+    # A token registered by several accounts belongs to the last one.
+    owners = dict(
+        UserProfile.objects.exclude(fcm_token__isnull=True).exclude(fcm_token='')
+        .order_by('id').values_list('fcm_token', 'user_id')
+    )
+    DeviceToken.objects.bulk_create(
+        [DeviceToken(token=token, user_id=user_id) for token, user_id in owners.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_accountdeletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255, unique=True)),
+                ('platform', models.CharField(blank=True, choices=[('android', 'Android'), ('ios', 'iOS'), ('web', 'Web')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_profile_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='fcm_token',
+        ),
+    ]
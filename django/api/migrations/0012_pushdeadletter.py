@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-19 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_devicetoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+                ('lane', models.CharField(max_length=20)),
+                ('payload', models.JSONField()),
+                ('attempts', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 6.0 on 2026-10-19 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import Upper
+
+
+def clear_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    ClearedEmail = apps.get_model('api', 'ClearedEmail')
+    users = User.objects.exclude(email='')
+
+    # Logging in with an email several accounts had exactly failed
+    # (MultipleObjectsReturned). The account used most recently keeps it; the
+    # others lose it, recorded in ClearedEmail.
+    duplicated = users.values('email').annotate(accounts=Count('id')).filter(accounts__gt=1)
+    for email in list(duplicated.values_list('email', flat=True)):
+        _, *others = users.filter(email=email).order_by(F('last_login').desc(nulls_last=True), 'id')
+        ClearedEmail.objects.bulk_create(ClearedEmail(user=user, email=email) for user in others)
+        User.objects.filter(pk__in=[user.pk for user in others]).update(email='')
+
+    # Emails that differ only in case belong to accounts that could each log
+    # in, so which one keeps the address is left to an operator.
+    keyed = users.annotate(email_key=Upper('email'))
+    conflicting = keyed.values('email_key').annotate(accounts=Count('id')).filter(accounts__gt=1)
+    groups = [
+        ', '.join(f'{user.pk} ({user.email})' for user in keyed.filter(email_key=email_key).order_by('id'))
+        for email_key in conflicting.order_by('email_key').values_list('email_key', flat=True)
+    ]
+    if groups:
+        raise RuntimeError(
+            'These accounts have emails that differ only in case: %s. Change the '
+            'email of all but one account in each group, then migrate again.' % '; '.join(groups)
+        )
+
+
+def restore_cleared_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    ClearedEmail = apps.get_model('api', 'ClearedEmail')
+    for cleared in ClearedEmail.objects.all():
+        User.objects.filter(pk=cleared.user_id, email='').update(email=cleared.email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_pushdeadletter'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClearedEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('cleared_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(clear_duplicate_emails, restore_cleared_emails),
+        # auth_user belongs to django.contrib.auth, so the index is created
+        # here. Login looks users up by this exact expression and condition
+        # (api.serializers.users_by_email).
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_upper_uniq ON auth_user (UPPER(email)) WHERE email <> ''",
+            'DROP INDEX auth_user_email_upper_uniq',
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-19 10:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_user_email_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PingLatencyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('ping_type', models.CharField(max_length=20)),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('pings', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'ping_type', 'bucket'), name='pinglatencyday_day_type_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PingTypeDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('ping_type', models.CharField(max_length=20)),
+                ('sent', models.BigIntegerField(default=0)),
+                ('delivered', models.BigIntegerField(default=0)),
+                ('delivery_seconds', models.FloatField(default=0)),
+                ('responded', models.BigIntegerField(default=0)),
+                ('response_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'ping_type'), name='pingtypeday_day_type_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PingUserDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sent', models.BigIntegerField(default=0)),
+                ('received', models.BigIntegerField(default=0)),
+                ('delivered', models.BigIntegerField(default=0)),
+                ('responded', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='pinguserday_user_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'user'), name='pinguserday_day_user_uniq')],
+            },
+        ),
+    ]
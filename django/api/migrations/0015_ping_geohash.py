@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-19 10:10
+
+import api.geo
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_geohashes(apps, schema_editor):
+    Ping = apps.get_model('api', 'Ping')
+    located = Ping.objects.filter(latitude__isnull=False, longitude__isnull=False).order_by('pk')
+    last_pk = 0
+    while True:
+        pings = list(located.filter(pk__gt=last_pk).only('pk', 'latitude', 'longitude')[:2000])
+        if not pings:
+            break
+        for ping in pings:
+            ping.geohash = api.geo.encode(ping.latitude, ping.longitude)
+        Ping.objects.bulk_update(pings, ['geohash'])
+        last_pk = pings[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_ping_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ping',
+            name='geohash',
+            field=api.geo.GeohashField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ping',
+            index=models.Index(condition=models.Q(('geohash__isnull', False)), fields=['receiver', 'geohash', 'created_at', 'sender'], name='ping_received_geohash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ping',
+            index=models.Index(condition=models.Q(('geohash__isnull', False)), fields=['receiver', 'sender', '-created_at'], name='ping_shared_location_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-19 10:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_ping_geohash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationTrail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('last_time', models.BigIntegerField(default=0)),
+                ('last_latitude', models.IntegerField(default=0)),
+                ('last_longitude', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_trails', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationTrailChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_index', models.PositiveIntegerField()),
+                ('count', models.PositiveSmallIntegerField()),
+                ('data', models.BinaryField()),
+                ('trail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.locationtrail')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='locationtrail',
+            index=models.Index(fields=['user', '-started_at'], name='trail_user_started_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='locationtrailchunk',
+            constraint=models.UniqueConstraint(fields=('trail', 'first_index'), name='trail_chunk_unique'),
+        ),
+    ]
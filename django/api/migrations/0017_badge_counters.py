@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-19 10:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_location_trails'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_requests', models.IntegerField(default=0)),
+                ('undelivered_pings', models.IntegerField(default=0)),
+                ('unanswered_pings', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from .geo import GeohashField
 
 User = get_user_model()
 
@@ -7,11 +9,68 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     nickname = models.CharField(max_length=50, blank=True)
     status = models.CharField(max_length=50, default='available')
-    fcm_token = models.CharField(max_length=255, blank=True, null=True)
+    # Flushed periodically from the presence buffer (api/presence.py).
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    # Shown to friends; changes are fanned out to them (api/fanout.py).
+    PUBLIC_FIELDS = ('nickname', 'status')
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.mark_public_fields_clean()
+        return instance
+
+    def mark_public_fields_clean(self):
+        self._loaded_public = {field: self.__dict__.get(field) for field in self.PUBLIC_FIELDS}
+
+    def public_fields_changed(self):
+        loaded = getattr(self, '_loaded_public', {})
+        return any(loaded.get(field) != self.__dict__.get(field) for field in self.PUBLIC_FIELDS)
+
+class DeviceToken(models.Model):
+    """A push token for one of the user's devices (api/push.py)."""
+    PLATFORM_CHOICES = (
+        ('android', 'Android'),
+        ('ios', 'iOS'),
+        ('web', 'Web'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='device_tokens')
+    # Unique: when another account signs in on the device, the token moves.
+    token = models.CharField(max_length=255, unique=True)
+    platform = models.CharField(max_length=20, choices=PLATFORM_CHOICES, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.platform or 'device'} token of {self.user}"
+
+class PushDeadLetter(models.Model):
+    """A push that still failed after PUSH_MAX_ATTEMPTS (api/push_queue.py)."""
+    token = models.CharField(max_length=255)
+    lane = models.CharField(max_length=20)
+    payload = models.JSONField()
+    attempts = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.lane} push to {self.token} after {self.attempts} attempts"
+
+class ClearedEmail(models.Model):
+    """
+    An email taken from an account that had it exactly like another one
+    (migration 0013); kept so the change can be audited and reversed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    email = models.EmailField()
+    cleared_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.email} cleared from {self.user_id}"
+
 class Friendship(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -39,6 +98,19 @@ class Friendship(models.Model):
     def __str__(self):
         return f"{self.sender} -> {self.receiver} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.mark_status_clean()
+        return instance
+
+    def mark_status_clean(self):
+        self._loaded_status = self.__dict__.get('status')
+
+    def loaded_status(self):
+        """The status as last read from or written to the database (api/badges.py)."""
+        return getattr(self, '_loaded_status', None)
+
 class Ping(models.Model):
     STATUS_CHOICES = (
         ('sent', 'Sent'),
@@ -55,6 +127,7 @@ class Ping(models.Model):
     # Advanced / Pro features
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = GeohashField()  # From latitude/longitude on write (api/geo.py)
     audio_file = models.FileField(upload_to='pings/audio/', null=True, blank=True)
     battery_level = models.IntegerField(null=True, blank=True)
     
@@ -64,10 +137,66 @@ class Ping(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Daily emergency limit checks and per-friend usage (UserLimitsView)
+            models.Index(fields=['sender', 'ping_type', 'created_at'], name='ping_sender_type_created_idx'),
+            # Proximity lookups (api.geo.friends_near): a user's received pings in a cell,
+            # and the latest location one user sent another
+            models.Index(
+                fields=['receiver', 'geohash', 'created_at', 'sender'], name='ping_received_geohash_idx',
+                condition=models.Q(geohash__isnull=False),
+            ),
+            models.Index(
+                fields=['receiver', 'sender', '-created_at'], name='ping_shared_location_idx',
+                condition=models.Q(geohash__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Ping from {self.sender} to {self.receiver} at {self.created_at}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.mark_milestones_clean()
+        return instance
+
+    def mark_milestones_clean(self):
+        self._loaded_milestones = (self.__dict__.get('delivered_at'), self.__dict__.get('response_at'))
+
+    def loaded_milestones(self):
+        """delivered_at and response_at as last read from or written to the database."""
+        return getattr(self, '_loaded_milestones', (None, None))
+
+    def first_delivered(self):
+        """True if this save delivers the ping for the first time (api/rollups.py)."""
+        return self.loaded_milestones()[0] is None and self.delivered_at is not None
+
+    def first_responded(self):
+        return self.loaded_milestones()[1] is None and self.response_at is not None
+
+    def mark_delivered(self):
+        """
+        Delivers the ping unless that already happened; the row lock makes
+        concurrent acks count the first delivery once. Returns the ping as saved.
+        """
+        with transaction.atomic():
+            ping = Ping.objects.select_for_update().get(pk=self.pk)
+            if ping.delivered_at is None:
+                ping.status = 'delivered'
+                ping.delivered_at = timezone.now()
+                ping.save()
+        return ping
+
+    def respond(self, message):
+        """Stores a handshake answer; response_at keeps the first one (row-locked like mark_delivered)."""
+        with transaction.atomic():
+            ping = Ping.objects.select_for_update().get(pk=self.pk)
+            ping.response_message = message
+            ping.response_at = ping.response_at or timezone.now()
+            ping.save()
+        return ping
+
 class CheckInSession(models.Model):
     STATUS_CHOICES = (
         ('active', 'Active'),
@@ -83,5 +212,176 @@ class CheckInSession(models.Model):
     def __str__(self):
         return f"CheckIn by {self.user} until {self.expires_at} ({self.status})"
 
+class LocationTrail(models.Model):
+    """
+    Location fixes a user streams during an emergency or check-in
+    (api/trails.py), packed into LocationTrailChunk blobs rather than one row
+    per fix. The last fix is kept here so an append can continue the delta
+    encoding of the last chunk without decoding it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location_trails')
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    point_count = models.PositiveIntegerField(default=0)
+    # The last fix: milliseconds since the epoch and microdegrees.
+    last_time = models.BigIntegerField(default=0)
+    last_latitude = models.IntegerField(default=0)
+    last_longitude = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-started_at'], name='trail_user_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trail of {self.user} from {self.started_at} ({self.point_count} points)"
+
+class LocationTrailChunk(models.Model):
+    """Points first_index to first_index + count - 1 of a trail, delta-encoded (api/trails.py)."""
+    trail = models.ForeignKey(LocationTrail, on_delete=models.CASCADE, related_name='chunks')
+    first_index = models.PositiveIntegerField()
+    count = models.PositiveSmallIntegerField()
+    data = models.BinaryField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trail', 'first_index'], name='trail_chunk_unique'),
+        ]
+
+class BadgeCounters(models.Model):
+    """
+    Per-user badge counts (api/badges.py), changed in the same transaction as
+    the friendships and pings they count.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    pending_requests = models.IntegerField(default=0)
+    undelivered_pings = models.IntegerField(default=0)
+    unanswered_pings = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Badges of {self.user_id}"
+
+class ChangeLog(models.Model):
+    """
+    One row per change visible to `user`, in commit-ish order. Backs the
+    "changes since" sync feed (api/sync.py); written by the model signals.
+    """
+    FRIENDSHIP = 'friendship'
+    PING = 'ping'
+    PROFILE = 'profile'
+    CHECKIN = 'checkin'
+    KIND_CHOICES = (
+        (FRIENDSHIP, 'Friendship'),
+        (PING, 'Ping'),
+        (PROFILE, 'Profile'),
+        (CHECKIN, 'Check-In'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # The record's pk; the user id for profiles.
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changelog_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} changed for {self.user_id}"
+
+    @classmethod
+    def record(cls, kind, object_id, user_ids):
+        cls.objects.bulk_create([cls(user_id=user_id, kind=kind, object_id=object_id) for user_id in set(user_ids) if user_id])
+
+    @classmethod
+    def record_many(cls, kind, object_ids, user_id):
+        """For queryset.update() calls, which send no signals."""
+        cls.objects.bulk_create([cls(user_id=user_id, kind=kind, object_id=object_id) for object_id in object_ids])
+
+class AccountDeletion(models.Model):
+    """A queued or running account deletion (api/account_deletion.py) and its progress."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    # Not a foreign key: the job outlives the user.
+    user_id = models.BigIntegerField(db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    friendships_deleted = models.PositiveIntegerField(default=0)
+    pings_deleted = models.PositiveIntegerField(default=0)
+    checkins_deleted = models.PositiveIntegerField(default=0)
+    files_deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Deletion of user {self.user_id} ({self.status})"
+
+class PingTypeDay(models.Model):
+    """
+    Pings created on `day` of one type and what became of them, maintained
+    incrementally by api/rollups.py. Deliveries and responses count on the
+    day the ping was sent, so the rates are per cohort.
+    """
+    day = models.DateField()
+    ping_type = models.CharField(max_length=20)
+    sent = models.BigIntegerField(default=0)
+    delivered = models.BigIntegerField(default=0)
+    delivery_seconds = models.FloatField(default=0)
+    responded = models.BigIntegerField(default=0)
+    response_seconds = models.FloatField(default=0)
+
+    COUNTERS = ('sent', 'delivered', 'delivery_seconds', 'responded', 'response_seconds')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'ping_type'], name='pingtypeday_day_type_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.ping_type} pings on {self.day}"
+
+class PingLatencyDay(models.Model):
+    """Histogram of delivery latencies (api.rollups.LATENCY_BUCKETS) per day and ping type."""
+    day = models.DateField()
+    ping_type = models.CharField(max_length=20)
+    bucket = models.PositiveSmallIntegerField()
+    pings = models.BigIntegerField(default=0)
+
+    COUNTERS = ('pings',)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'ping_type', 'bucket'], name='pinglatencyday_day_type_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.ping_type} latency bucket {self.bucket} on {self.day}"
+
+class PingUserDay(models.Model):
+    """A user's pings on `day`: sent, received, and of those received, delivered and answered."""
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    sent = models.BigIntegerField(default=0)
+    received = models.BigIntegerField(default=0)
+    delivered = models.BigIntegerField(default=0)
+    responded = models.BigIntegerField(default=0)
+
+    COUNTERS = ('sent', 'received', 'delivered', 'responded')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='pinguserday_day_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day'], name='pinguserday_user_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pings of {self.user_id} on {self.day}"
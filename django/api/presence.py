@@ -0,0 +1,114 @@
+"""
+Write-coalesced presence ("last seen") tracking.
+
+Every authenticated request calls `touch()`, which is a dict lookup in the
+common case. At most once per PRESENCE_RESOLUTION_SECONDS per user and worker
+it writes the timestamp to the cache (the store friends read from) and queues
+it for the database. A background thread writes the queue to
+UserProfile.last_seen with a single bulk UPDATE every PRESENCE_FLUSH_SECONDS.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _key(user_id):
+    return f'presence:{user_id}'
+
+
+class PresenceBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> last seen datetime, not yet in the DB
+        self._recent = {}  # user_id -> monotonic time of the last recorded touch
+        self._flusher = None
+
+    def touch(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._recent.get(user_id, float('-inf')) < settings.PRESENCE_RESOLUTION_SECONDS:
+                return
+            self._recent[user_id] = now
+            seen = timezone.now()
+            self._pending[user_id] = seen
+            if self._flusher is None:
+                self._start_flusher()
+        cache.set(_key(user_id), seen, timeout=settings.PRESENCE_CACHE_SECONDS)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._recent.clear()
+        if not pending:
+            return 0
+        try:
+            return UserProfile.objects.filter(user_id__in=pending).update(
+                last_seen=Case(
+                    *[When(user_id=user_id, then=Value(seen)) for user_id, seen in pending.items()],
+                    output_field=DateTimeField(),
+                )
+            )
+        except Exception:
+            # Requeue for the next flush; a touch since then is newer and wins.
+            with self._lock:
+                for user_id, seen in pending.items():
+                    self._pending.setdefault(user_id, seen)
+            raise
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(settings.PRESENCE_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                # The thread must outlive a failed write, or last_seen stops being saved for good.
+                logger.exception('presence flush failed')
+            finally:
+                connection.close()
+
+
+buffer = PresenceBuffer()
+touch = buffer.touch
+flush = buffer.flush
+
+
+def annotate_last_seen(users):
+    """
+    Sets `last_seen_at` and `is_online` on each user, preferring the cache over
+    the flushed DB value and falling back to last_login. Expects profiles to
+    be loaded (select_related) so this costs a single cache round trip.
+    """
+    cached = cache.get_many([_key(user.id) for user in users])
+    online_since = timezone.now() - timedelta(seconds=settings.PRESENCE_ONLINE_SECONDS)
+    for user in users:
+        user.last_seen_at = cached.get(_key(user.id)) or user.profile.last_seen or user.last_login
+        user.is_online = user.last_seen_at is not None and user.last_seen_at >= online_since
+    return users
+
+
+def online_user_ids(user_ids):
+    online_since = timezone.now() - timedelta(seconds=settings.PRESENCE_ONLINE_SECONDS)
+    cached = cache.get_many([_key(user_id) for user_id in user_ids])
+    return [user_id for user_id in user_ids if cached.get(_key(user_id), online_since) > online_since]
+
+
+def online_bucket():
+    """Changes every PRESENCE_ONLINE_SECONDS; folded into ETags of responses that show presence."""
+    return int(time.time() // settings.PRESENCE_ONLINE_SECONDS)
@@ -0,0 +1,164 @@
+"""
+On-demand profiling of single requests (api.middleware.ProfilingMiddleware).
+
+A request is profiled when a staff user sends `X-Profile: 1`, or when it
+falls in the PROFILING_SAMPLE_RATE sample. The rest of the middleware chain
+and the view then run under cProfile, and every SQL statement is timed.
+The result goes to PROFILING_DIR in two files:
+- <id>.json: the request, its timings, its queries and the top functions;
+- <id>.prof: the raw stats, for pstats or snakeviz.
+The response carries the id in X-Profile-Id.
+
+The directory is a ring: once it holds more than PROFILING_MAX_PROFILES
+profiles, the oldest are deleted. A request that is not profiled costs one
+header lookup, plus one random() call when sampling is on.
+
+Only one request per process is profiled at a time; others that ask while
+it runs are served unprofiled. Under ASGI the profiler sees the whole event
+loop thread, so concurrent requests show up in it, and SQL run in worker
+threads is not captured.
+"""
+import cProfile
+import io
+import json
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+
+HEADER = 'HTTP_X_PROFILE'
+# <milliseconds since the epoch>-<random>, so names sort oldest first.
+PROFILE_ID = re.compile(r'^\d{13}-[0-9a-f]{8}$')
+MAX_QUERIES = 1000
+TOP_FUNCTIONS = 40
+
+# cProfile cannot run twice at once (on 3.12+ it is interpreter-wide).
+busy = threading.Lock()
+
+
+def requested_by_staff(request):
+    from .authentication import PresenceJWTAuthentication
+
+    try:
+        result = PresenceJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and result[0].is_staff
+
+
+def sampled():
+    return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def wanted(request):
+    if request.META.get(HEADER) == '1':
+        return requested_by_staff(request)
+    return sampled()
+
+
+async def awanted(request):
+    if request.META.get(HEADER) == '1':
+        return await sync_to_async(requested_by_staff)(request)
+    return sampled()
+
+
+class Recorder:
+    """Profiles what runs inside `with Recorder(request):` and times its SQL."""
+
+    def __init__(self, request):
+        self.request = request
+        self.id = f'{time.time_ns() // 1_000_000:013d}-{uuid.uuid4().hex[:8]}'
+        self.profiler = cProfile.Profile()
+        self.queries = []
+        self._stack = ExitStack()
+
+    def _time_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                # Statements only: parameters can hold personal data.
+                self.queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'many': many,
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                })
+
+    def __enter__(self):
+        # Every alias, not only those this thread has used so far: the
+        # wrappers are created without connecting.
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._time_query))
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        self._stack.close()
+
+    def save(self, response):
+        directory = settings.PROFILING_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        match = self.request.resolver_match
+        profile = {
+            'id': self.id,
+            'created_at': time.time(),
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'url_name': match.url_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(self.elapsed * 1000, 3),
+            'query_count': len(self.queries),
+            'query_ms': round(sum(query['ms'] for query in self.queries), 3),
+            'queries': self.queries,
+            'top_functions': stream.getvalue(),
+        }
+        self.profiler.dump_stats(directory / f'{self.id}.prof')
+        (directory / f'{self.id}.json').write_text(json.dumps(profile))
+        response['X-Profile-Id'] = self.id
+        prune()
+
+
+def prune():
+    profiles = sorted(settings.PROFILING_DIR.glob('*.json'))
+    for path in profiles[:-settings.PROFILING_MAX_PROFILES]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.prof').unlink(missing_ok=True)
+
+
+SUMMARY_FIELDS = ('id', 'created_at', 'method', 'path', 'url_name', 'status', 'total_ms', 'query_count', 'query_ms')
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    summaries = []
+    for path in sorted(settings.PROFILING_DIR.glob('*.json'), reverse=True):
+        try:
+            profile = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # Pruned or still being written by another worker.
+        summaries.append({field: profile[field] for field in SUMMARY_FIELDS})
+    return summaries
+
+
+def path_of(profile_id, suffix):
+    """The file of a stored profile, or None; never a path outside PROFILING_DIR."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = settings.PROFILING_DIR / f'{profile_id}{suffix}'
+    return path if path.exists() else None
@@ -0,0 +1,152 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .models import DeviceToken
+
+try:
+    import httpx
+except ImportError:  # Only required by FCMPushBackend.
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Per-token outcome of a send. Tokens reported INVALID are pruned.
+SENT = 'sent'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+
+class BasePushBackend:
+    """
+    Delivers data messages to device tokens. Backends implement `send`,
+    which returns SENT, INVALID or FAILED. `send_many` takes up to
+    PUSH_MULTICAST_LIMIT tokens and returns one outcome per token; backends
+    with a real multicast call override it. Called from the push lanes'
+    worker threads (api/push_queue.py).
+    """
+
+    def send(self, token, data):
+        raise NotImplementedError
+
+    def send_many(self, tokens, data):
+        return [self.send(token, data) for token in tokens]
+
+
+class LoggingPushBackend(BasePushBackend):
+    """Development backend: logs the message instead of delivering it."""
+
+    def send(self, token, data):
+        logger.info('push to %s: %s', token, data)
+        return SENT
+
+    def send_many(self, tokens, data):
+        logger.info('push to %d devices: %s', len(tokens), data)
+        return [SENT] * len(tokens)
+
+
+class FCMPushBackend(BasePushBackend):
+    """
+    Firebase Cloud Messaging HTTP v1 backend. FCM_ENDPOINT may point at a
+    local fake server for testing (`manage.py fake_push_server`).
+
+    The v1 API takes one token per message, so `send_many` sends a batch as
+    concurrent requests over one pooled client instead of one after another.
+    """
+
+    # FCM errorCodes that mean the token will never work again.
+    INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+    def __init__(self):
+        if httpx is None:
+            raise ImproperlyConfigured('FCMPushBackend requires the httpx package.')
+        self.endpoint = settings.FCM_ENDPOINT
+        # The fake server (api/fake_push.py) needs no credentials.
+        self.headers = {'Authorization': f'Bearer {settings.FCM_ACCESS_TOKEN}'} if settings.FCM_ACCESS_TOKEN else {}
+        limits = httpx.Limits(max_connections=settings.PUSH_CONCURRENCY)
+        self.client = httpx.Client(timeout=settings.PUSH_TIMEOUT, limits=limits)
+        self.executor = ThreadPoolExecutor(max_workers=settings.PUSH_CONCURRENCY, thread_name_prefix='fcm')
+
+    def _message(self, token, data):
+        # FCM data payloads only accept string values.
+        return {
+            'message': {
+                'token': token,
+                'data': {key: str(value) for key, value in data.items()},
+                'android': {'priority': 'high'},
+            }
+        }
+
+    def _outcome(self, token, response):
+        if response.is_success:
+            return SENT
+        try:
+            details = response.json()['error'].get('details', [])
+        except (ValueError, KeyError, AttributeError):
+            details = []
+        if any(detail.get('errorCode') in self.INVALID_TOKEN_ERRORS for detail in details):
+            return INVALID
+        logger.warning('push to %s failed with %s', token, response.status_code)
+        return FAILED
+
+    def send(self, token, data):
+        try:
+            response = self.client.post(self.endpoint, json=self._message(token, data), headers=self.headers)
+        except httpx.HTTPError:
+            logger.exception('push to %s failed', token)
+            return FAILED
+        return self._outcome(token, response)
+
+    def send_many(self, tokens, data):
+        return list(self.executor.map(lambda token: self.send(token, data), tokens))
+
+
+@lru_cache(maxsize=None)
+def get_push_backend(lane=None):
+    """One instance per push lane (api/push_queue.py), so lanes share no connections."""
+    return import_string(settings.PUSH_BACKEND)()
+
+
+def register_device(user, token, platform=''):
+    """Adds `token` to the user's devices, taking it over from any other account."""
+    device, _ = DeviceToken.objects.update_or_create(token=token, defaults={'user': user, 'platform': platform})
+    return device
+
+
+def device_tokens(user_ids):
+    return list(DeviceToken.objects.filter(user_id__in=user_ids).values_list('token', flat=True))
+
+
+def deliver(tokens, data, backend=None):
+    """
+    Sends `data` to `tokens`, PUSH_MULTICAST_LIMIT per backend call. Prunes
+    the tokens reported invalid and returns the ones that failed.
+    """
+    backend = backend or get_push_backend()
+    invalid, failed = [], []
+    limit = settings.PUSH_MULTICAST_LIMIT
+    for i in range(0, len(tokens), limit):
+        batch = tokens[i:i + limit]
+        for token, outcome in zip(batch, backend.send_many(batch, data)):
+            if outcome == INVALID:
+                invalid.append(token)
+            elif outcome == FAILED:
+                failed.append(token)
+    if invalid:
+        DeviceToken.objects.filter(token__in=invalid).delete()
+        logger.info('pruned %d invalid device tokens', len(invalid))
+    return failed
+
+
+def ping_payload(ping):
+    return {
+        'type': 'ping',
+        'ping_id': ping.id,
+        'ping_type': ping.ping_type,
+        'sender_id': ping.sender_id,
+        'message': ping.message,
+    }
@@ -0,0 +1,186 @@
+"""
+Background push dispatch with priority lanes, retries and dead-lettering.
+
+Pushes are queued on a lane picked from the ping type (PUSH_LANES) and sent
+by that lane's own worker threads and push backend, so emergency pings never
+wait behind a backlog of status or battery notifications. Tokens that fail
+are retried on their lane with exponential backoff and full jitter; after
+PUSH_MAX_ATTEMPTS they are written to PushDeadLetter. Queues live in the
+worker process; `depth()` reports them.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import DeviceToken, PushDeadLetter
+from .push import deliver, device_tokens, get_push_backend, ping_payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANE = 'low'
+
+
+class PushJob:
+    """A payload for a set of users; after a failure, for the tokens that failed."""
+
+    def __init__(self, data, user_ids=None, tokens=None, attempt=1):
+        self.data = data
+        self.user_ids = user_ids
+        self.tokens = tokens
+        self.attempt = attempt
+
+
+def backoff(attempt):
+    """Seconds to wait before retrying after `attempt` failed ("full jitter")."""
+    ceiling = min(settings.PUSH_RETRY_MAX_SECONDS, settings.PUSH_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+class Lane:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._heap = []  # (due, seq, job)
+        self._seq = itertools.count()
+        self._threads = []
+        self.in_flight = 0
+
+    def put(self, job, delay=0):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+            if not self._threads:
+                self._start()
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    self.in_flight += 1
+                    return heapq.heappop(self._heap)[2]
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def done(self):
+        with self._cond:
+            self.in_flight -= 1
+
+    def depth(self):
+        now = time.monotonic()
+        with self._cond:
+            ready = sum(1 for due, _, _ in self._heap if due <= now)
+            return {'ready': ready, 'delayed': len(self._heap) - ready, 'in_flight': self.in_flight}
+
+    def _start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'push-{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        # Each lane has its own backend: its connections and send threads
+        # are never tied up by another lane's traffic.
+        backend = get_push_backend(self.name)
+        while True:
+            job = self.get()
+            try:
+                close_old_connections()
+                self._process(job, backend)
+            except Exception:
+                logger.exception('push job on lane %s failed', self.name)
+            finally:
+                self.done()
+
+    def _process(self, job, backend):
+        try:
+            tokens = device_tokens(job.user_ids) if job.tokens is None else job.tokens
+        except Exception:
+            logger.exception('looking up devices on lane %s failed', self.name)
+            return self._retry(job, None)
+        try:
+            failed = deliver(tokens, job.data, backend)
+        except Exception:
+            # Nothing is known to have been sent.
+            logger.exception('push on lane %s failed', self.name)
+            failed = tokens
+        if failed:
+            self._retry(job, failed)
+
+    def _retry(self, job, tokens):
+        """Retries `tokens`, or the whole job when they are None."""
+        if job.attempt >= settings.PUSH_MAX_ATTEMPTS:
+            dead_letter(self.name, job, tokens)
+            return
+        user_ids = job.user_ids if tokens is None else None
+        self.put(PushJob(job.data, user_ids, tokens, job.attempt + 1), delay=backoff(job.attempt))
+
+
+def dead_letter(lane, job, tokens):
+    if tokens is None:
+        tokens = device_tokens(job.user_ids)
+    PushDeadLetter.objects.bulk_create([
+        PushDeadLetter(token=token, lane=lane, payload=job.data, attempts=job.attempt) for token in tokens
+    ])
+    logger.warning('dead-lettered %d pushes on lane %s after %d attempts', len(tokens), lane, job.attempt)
+
+
+class PushScheduler:
+    def __init__(self, lane_workers, lanes_by_type):
+        self.lanes = {name: Lane(name, workers) for name, workers in lane_workers.items()}
+        self.lanes_by_type = lanes_by_type
+
+    def lane_for(self, ping_type):
+        return self.lanes[self.lanes_by_type.get(ping_type, DEFAULT_LANE)]
+
+    def enqueue(self, user_ids, data, ping_type=None):
+        self.lane_for(ping_type).put(PushJob(data, user_ids=list(user_ids)))
+
+    def depth(self):
+        return {name: lane.depth() for name, lane in self.lanes.items()}
+
+
+@lru_cache(maxsize=None)
+def get_scheduler():
+    return PushScheduler(settings.PUSH_LANE_WORKERS, settings.PUSH_LANES)
+
+
+def enqueue(user_ids, data, ping_type=None):
+    get_scheduler().enqueue(user_ids, data, ping_type)
+
+
+def depth():
+    return get_scheduler().depth()
+
+
+def notify_ping(ping):
+    # Only once the ping is committed; the push must not announce a rollback.
+    transaction.on_commit(lambda: enqueue([ping.receiver_id], ping_payload(ping), ping.ping_type))
+
+
+def notify_pings(pings):
+    """notify_ping for many pings, with the devices of all receivers looked up in one query."""
+    def _enqueue():
+        tokens = {}
+        for user_id, token in DeviceToken.objects.filter(
+            user_id__in={ping.receiver_id for ping in pings}
+        ).values_list('user_id', 'token'):
+            tokens.setdefault(user_id, []).append(token)
+        scheduler = get_scheduler()
+        for ping in pings:
+            if ping.receiver_id in tokens:
+                scheduler.lane_for(ping.ping_type).put(PushJob(ping_payload(ping), tokens=tokens[ping.receiver_id]))
+
+    transaction.on_commit(_enqueue)
+
+
+async def anotify_ping(ping):
+    # The async views run in autocommit, and enqueueing never blocks.
+    enqueue([ping.receiver_id], ping_payload(ping), ping.ping_type)
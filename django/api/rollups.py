@@ -0,0 +1,182 @@
+"""
+Ping analytics rollups, kept up to date as pings change.
+
+Pings are summed into three tables:
+- PingTypeDay: per (day, ping_type), the pings sent, delivered and answered,
+  with summed latencies.
+- PingLatencyDay: the delivery latency histogram behind the medians.
+- PingUserDay: per (day, user).
+
+Events add to these tables as they happen: a ping is created (the model
+signals, ingest flushes, broadcasts), or delivered or answered for the first
+time. Each transaction's changes are summed in memory and written with one
+INSERT ... ON CONFLICT DO UPDATE per table once it commits, so the ping
+transaction never waits on the shared per-day rows. Reports then read a
+few rows per day and never scan Ping.
+
+Counts for a day can be recomputed exactly from the pings with
+`manage.py backfill_ping_rollups`.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PingLatencyDay, PingTypeDay, PingUserDay
+
+# Upper bounds (seconds) of the delivery latency buckets; the last bucket
+# holds everything slower.
+LATENCY_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 3 * 3600, 12 * 3600, 24 * 3600)
+
+
+def latency_bucket(seconds):
+    for bucket, bound in enumerate(LATENCY_BUCKETS):
+        if seconds < bound:
+            return bucket
+    return len(LATENCY_BUCKETS)
+
+
+def median_latency(histogram):
+    """Median seconds from {bucket: pings}, interpolated within its bucket; None if empty."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        if seen + histogram[bucket] >= total / 2:
+            if bucket == len(LATENCY_BUCKETS):
+                return float(LATENCY_BUCKETS[-1])
+            lower = LATENCY_BUCKETS[bucket - 1] if bucket else 0
+            upper = LATENCY_BUCKETS[bucket]
+            return lower + (upper - lower) * (total / 2 - seen) / histogram[bucket]
+        seen += histogram[bucket]
+
+
+class Deltas:
+    """Counter changes per rollup row, summed before they are written."""
+
+    def __init__(self):
+        self.rows = {model: defaultdict(lambda: defaultdict(int)) for model in (PingTypeDay, PingLatencyDay, PingUserDay)}
+
+    def add(self, model, key, **counters):
+        row = self.rows[model][key]
+        for counter, value in counters.items():
+            row[counter] += value
+
+    def created(self, ping):
+        day = timezone.localdate(ping.created_at)
+        self.add(PingTypeDay, (day, ping.ping_type), sent=1)
+        self.add(PingUserDay, (day, ping.sender_id), sent=1)
+        self.add(PingUserDay, (day, ping.receiver_id), received=1)
+
+    def delivered(self, ping):
+        day = timezone.localdate(ping.created_at)
+        seconds = max((ping.delivered_at - ping.created_at).total_seconds(), 0)
+        self.add(PingTypeDay, (day, ping.ping_type), delivered=1, delivery_seconds=seconds)
+        self.add(PingLatencyDay, (day, ping.ping_type, latency_bucket(seconds)), pings=1)
+        self.add(PingUserDay, (day, ping.receiver_id), delivered=1)
+
+    def responded(self, ping):
+        day = timezone.localdate(ping.created_at)
+        seconds = max((ping.response_at - ping.created_at).total_seconds(), 0)
+        self.add(PingTypeDay, (day, ping.ping_type), responded=1, response_seconds=seconds)
+        self.add(PingUserDay, (day, ping.receiver_id), responded=1)
+
+    def __bool__(self):
+        return any(self.rows.values())
+
+    def write(self):
+        for model, rows in self.rows.items():
+            if rows:
+                _upsert(model, rows)
+
+
+def _upsert(model, rows):
+    # One statement per table; PostgreSQL and SQLite share this syntax.
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    # The unique constraint on the row key is the conflict target.
+    keys = [model._meta.get_field(name).column for name in model._meta.constraints[0].fields]
+    counters = list(model.COUNTERS)
+    columns = ', '.join(quote(column) for column in keys + counters)
+    placeholders = ', '.join(['(%s)' % ', '.join(['%s'] * (len(keys) + len(counters)))] * len(rows))
+    updates = ', '.join(f'{quote(c)} = {table}.{quote(c)} + excluded.{quote(c)}' for c in counters)
+    # Sorted, so concurrent writers lock shared rows in the same order.
+    params = [
+        value
+        for key, row in sorted(rows.items())
+        for value in (*key, *(row.get(counter, 0) for counter in counters))
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+            f'ON CONFLICT ({", ".join(quote(k) for k in keys)}) DO UPDATE SET {updates}',
+            params,
+        )
+
+
+def _write_on_commit(deltas):
+    if deltas:
+        # The pings are committed by then; a failure here is only logged.
+        transaction.on_commit(deltas.write, robust=True)
+
+
+def pings_created(pings):
+    deltas = Deltas()
+    for ping in pings:
+        deltas.created(ping)
+    _write_on_commit(deltas)
+
+
+def ping_saved(ping, created):
+    deltas = Deltas()
+    if created:
+        deltas.created(ping)
+    # A ping can be created already delivered or answered.
+    if ping.first_delivered():
+        deltas.delivered(ping)
+    if ping.first_responded():
+        deltas.responded(ping)
+    _write_on_commit(deltas)
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def _mean(total, count):
+    return round(total / count, 1) if count else None
+
+
+def type_report(since, until):
+    """Per day and ping type: counts, delivery and response rates and latencies. Reads only the rollups."""
+    histograms = defaultdict(dict)
+    for day, ping_type, bucket, pings in PingLatencyDay.objects.filter(day__range=(since, until)).values_list(
+        'day', 'ping_type', 'bucket', 'pings'
+    ):
+        histograms[day, ping_type][bucket] = pings
+    report = []
+    for row in PingTypeDay.objects.filter(day__range=(since, until)).order_by('day', 'ping_type'):
+        median = median_latency(histograms[row.day, row.ping_type])
+        report.append({
+            'day': row.day,
+            'ping_type': row.ping_type,
+            'sent': row.sent,
+            'delivered': row.delivered,
+            'delivery_rate': _rate(row.delivered, row.sent),
+            'median_delivery_seconds': None if median is None else round(median, 1),
+            'mean_delivery_seconds': _mean(row.delivery_seconds, row.delivered),
+            'responded': row.responded,
+            'response_rate': _rate(row.responded, row.sent),
+            'mean_response_seconds': _mean(row.response_seconds, row.responded),
+        })
+    return report
+
+
+def user_report(user_id, since, until):
+    return [
+        {**row, 'response_rate': _rate(row['responded'], row['received'])}
+        for row in PingUserDay.objects.filter(user_id=user_id, day__range=(since, until)).order_by('day').values(
+            'day', 'sent', 'received', 'delivered', 'responded'
+        )
+    ]
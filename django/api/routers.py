@@ -0,0 +1,67 @@
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA = 'replica'
+
+# Alias that reads inside the current `replica_reads()` block go to.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f'primary-pin:{user_id}'
+
+
+def pin_to_primary(*user_ids):
+    """Keep these users' replica-eligible reads on the primary for REPLICA_PIN_SECONDS."""
+    if REPLICA in settings.DATABASES:
+        cache.set_many({_pin_key(user_id): True for user_id in user_ids}, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def _enter(alias):
+    return _read_alias.set(alias if REPLICA in settings.DATABASES else None)
+
+
+@contextmanager
+def replica_reads(user_id):
+    """
+    Send reads in this block to the replica, unless `user_id` wrote recently
+    (read-your-writes). The pin is checked once on entry, not per query.
+    """
+    token = _enter(None if cache.get(_pin_key(user_id)) else REPLICA)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(user_id):
+    token = _enter(None if await cache.aget(_pin_key(user_id)) else REPLICA)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaReadMixin:
+    """Runs a read-only view's GET handler inside `replica_reads()` for the requesting user."""
+
+    def get(self, request, *args, **kwargs):
+        with replica_reads(request.user.id):
+            return super().get(request, *args, **kwargs)
+
+
+class PrimaryReplicaRouter:
+    """Everything goes to `default` unless a view opted in via `replica_reads()`."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,61 @@
+"""
+Keeps drf-spectacular off the worker start-up and request paths.
+
+The schema is generated at build time by `manage.py build_openapi_schema` and
+served from OPENAPI_SCHEMA_PATH. drf-spectacular's views and schema generator
+are only imported when the docs UIs are opened or no prebuilt schema exists,
+and view annotations are recorded by a lazy `extend_schema` instead of
+building schema classes at import time.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse
+
+_deferred = []
+
+
+def extend_schema(**kwargs):
+    """
+    Stand-in for drf_spectacular.utils.extend_schema on view methods. The real
+    decorator (which imports the schema generator) is applied by
+    `apply_deferred_schemas` right before a schema is generated.
+    """
+    def decorator(f):
+        _deferred.append((f, kwargs))
+        return f
+    return decorator
+
+
+def apply_deferred_schemas(endpoints):
+    """drf-spectacular preprocessing hook; see SPECTACULAR_SETTINGS."""
+    from drf_spectacular.utils import extend_schema
+
+    from . import schema_extensions  # noqa: F401 (registers the extensions)
+
+    while _deferred:
+        f, kwargs = _deferred.pop()
+        extend_schema(**kwargs)(f)
+    return endpoints
+
+
+@lru_cache(maxsize=None)
+def _spectacular_view(name, **initkwargs):
+    from drf_spectacular import views
+
+    return getattr(views, name).as_view(**initkwargs)
+
+
+def schema_view(request, *args, **kwargs):
+    path = settings.OPENAPI_SCHEMA_PATH
+    if path.exists():
+        return FileResponse(path.open('rb'), content_type='application/vnd.oai.openapi')
+    return _spectacular_view('SpectacularAPIView')(request, *args, **kwargs)
+
+
+def swagger_view(request, *args, **kwargs):
+    return _spectacular_view('SpectacularSwaggerView', url_name='schema')(request, *args, **kwargs)
+
+
+def redoc_view(request, *args, **kwargs):
+    return _spectacular_view('SpectacularRedocView', url_name='schema')(request, *args, **kwargs)
@@ -0,0 +1,11 @@
+"""
+drf-spectacular extensions. Imported by api.schema.apply_deferred_schemas
+right before a schema is generated, like the deferred view annotations.
+"""
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class PresenceJWTScheme(SimpleJWTScheme):
+    """Documents PresenceJWTAuthentication (and AsyncJWTAuthentication) as simplejwt's bearer scheme."""
+    target_class = 'api.authentication.PresenceJWTAuthentication'
+    match_subclasses = True
@@ -1,17 +1,53 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Q, Count
-from .models import UserProfile, Friendship, Ping, CheckInSession
+from django.db import IntegrityError, transaction
+from django.db.models import F, Lookup, Q, Count, Value
+from django.db.models.functions import Upper
+from .models import UserProfile, DeviceToken, Friendship, Ping, CheckInSession, ChangeLog
+from . import blocks, geo, ingest, signals, tokens
 
 User = get_user_model()
 
+class NotEqual(Lookup):
+    """`lhs <> rhs`. ~Q(field=value) renders NOT (lhs = rhs), which SQLite won't match to a partial index."""
+    lookup_name = 'ne'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} <> {rhs}', (*lhs_params, *rhs_params)
+
+def users_by_email(email):
+    """
+    Users whose email matches case-insensitively. Spelled exactly like the
+    auth_user_email_upper_uniq index (migration 0013), expression and
+    condition, so that the lookup is answered from it.
+    """
+    return User.objects.alias(email_key=Upper('email')).filter(
+        NotEqual(F('email'), Value('')),
+        email_key=Upper(Value(email)),
+    )
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ['status', 'fcm_token']
+        fields = ['status']
+
+class DeviceTokenSerializer(serializers.Serializer):
+    fcm_token = serializers.CharField(max_length=255)
+    platform = serializers.ChoiceField(choices=DeviceToken.PLATFORM_CHOICES, required=False, default='')
+
+class LogoutSerializer(serializers.Serializer):
+    # The device logging out; its token stops receiving pushes.
+    fcm_token = serializers.CharField(max_length=255, required=False)
+    # The device's refresh token, revoked along with the access token.
+    refresh = serializers.CharField(required=False)
+    # Revoke the tokens of every device, not just this one.
+    everywhere = serializers.BooleanField(required=False, default=False)
 
 class RegisterSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=150)
@@ -19,17 +55,32 @@ class RegisterSerializer(serializers.Serializer):
     phone_number = serializers.CharField(max_length=20, required=False, allow_blank=True)
     password = serializers.CharField(write_only=True, min_length=6)
 
+    def validate_name(self, value):
+        # The name is the username, which is unique too.
+        if User.objects.filter(username=value).exists():
+            raise serializers.ValidationError("This name is already taken.")
+        return value
+
     def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
+        if users_by_email(value).exists():
             raise serializers.ValidationError("This email is already registered.")
         return value
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['name'],  # Use name as username
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=validated_data['name'],  # Use name as username
+                    email=validated_data['email'],
+                    password=validated_data['password']
+                )
+        except IntegrityError:
+            # Registered concurrently since validation ran; say which of the two was taken.
+            if users_by_email(validated_data['email']).exists():
+                raise serializers.ValidationError({'email': ["This email is already registered."]})
+            if User.objects.filter(username=validated_data['name']).exists():
+                raise serializers.ValidationError({'name': ["This name is already taken."]})
+            raise
         # Store phone number in profile if needed
         if hasattr(user, 'profile') and validated_data.get('phone_number'):
             user.profile.phone_number = validated_data.get('phone_number')
@@ -37,8 +88,7 @@ class RegisterSerializer(serializers.Serializer):
         return user
     
     def to_representation(self, instance):
-        from rest_framework_simplejwt.tokens import RefreshToken
-        refresh = RefreshToken.for_user(instance)
+        refresh = tokens.for_user(instance)
         return {
             'access': str(refresh.access_token),
             'refresh': str(refresh),
@@ -63,17 +113,20 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         email = attrs.get('email')
         password = attrs.get('password')
         
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        # The profile is needed for the response; fetch it in the same query.
+        user = users_by_email(email).select_related('profile').first()
+        if user is None:
+            # Hash anyway, as ModelBackend does, so that response times
+            # do not tell which emails have an account.
+            User().set_password(password)
             raise serializers.ValidationError({'detail': 'Invalid email or password'})
-        
-        if not user.check_password(password):
+
+        # Re-encodes the stored hash if PASSWORD_PBKDF2_ITERATIONS changed.
+        if not user.check_password(password) or not user.is_active:
             raise serializers.ValidationError({'detail': 'Invalid email or password'})
         
         # Get tokens
-        from rest_framework_simplejwt.tokens import RefreshToken
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens.for_user(user)
         
         data = {
             'access': str(refresh.access_token),
@@ -91,11 +144,23 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         self.user = user
         return data
 
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Single-use refresh tokens: the one presented is revoked and a new one is
+    returned with the access token. No database query; an account that is
+    deactivated has its tokens revoked instead (see api.tokens).
+    """
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        refresh = tokens.rotate(self.token_class(attrs['refresh']))
+        return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
 class FriendRequestSerializer(serializers.Serializer):
     receiver_id = serializers.IntegerField()
 
     def validate_receiver_id(self, value):
-        if not User.objects.filter(id=value).exists():
+        if not User.objects.filter(id=value, is_active=True).exists():
             raise serializers.ValidationError("User not found.")
         return value
 
@@ -107,6 +172,10 @@ class FriendRequestSerializer(serializers.Serializer):
         if sender.id == receiver_id:
             raise serializers.ValidationError("You cannot add yourself as a friend.")
 
+        # Either side may have blocked the other; don't tell which.
+        if receiver_id in blocks.blocked_ids(sender.id):
+            raise serializers.ValidationError("User not found.")
+
         # Check existing friendship
         if Friendship.objects.filter(
             Q(sender=sender, receiver_id=receiver_id) | 
@@ -122,6 +191,60 @@ class FriendshipActionSerializer(serializers.Serializer):
 class VIPSerializer(serializers.Serializer):
     is_vip = serializers.BooleanField()
 
+def accepted_friendship(user_id, other_id):
+    return Friendship.objects.filter(
+        (Q(sender_id=user_id, receiver_id=other_id) | Q(sender_id=other_id, receiver_id=user_id)) &
+        Q(status='accepted')
+    )
+
+EMERGENCY_DAILY_LIMIT = 3
+
+def today_range():
+    # A half-open created_at range can use the (sender, ping_type, created_at)
+    # index; created_at__date wraps the column in a function and can't.
+    start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+def emergency_pings_today(sender_id, receiver_id=None):
+    start, end = today_range()
+    pings = Ping.objects.filter(
+        sender_id=sender_id,
+        ping_type='emergency',
+        created_at__gte=start,
+        created_at__lt=end
+    )
+    if receiver_id is not None:
+        pings = pings.filter(receiver_id=receiver_id)
+    return pings
+
+def check_ping_rules(sender, friendship, ping_type, daily_pings, blocked=False):
+    """
+    Admission rules for a new ping, shared by PingSerializer and the async
+    ping views. The callers do the lookups (sync or async ORM); `blocked`
+    says the receiver is in the sender's blocked set (api/blocks.py), in
+    which case they may skip the others.
+    """
+    # 1. Friendship Check (a block looks the same to the sender)
+    if blocked or not friendship:
+        raise serializers.ValidationError("You can only ping accepted friends.")
+
+    # 2. VIP Check (Only if ping_type is 'emergency' or 'battery')
+    if ping_type in ['emergency', 'battery']:
+        # If Friendship(Sender=Bob, Receiver=Alice) and Bob pings Alice, we check
+        # if Alice marked Bob as VIP: `receiver_is_vip`.
+        # If Alice pings Bob, we check if Bob marked Alice as VIP: `sender_is_vip`.
+        if friendship.sender_id == sender.id:
+            is_vip = friendship.receiver_is_vip
+        else:
+            is_vip = friendship.sender_is_vip
+        if not is_vip:
+            raise serializers.ValidationError("You are not a VIP for this user.")
+
+    # 3. Rate Limit (Simple implementation)
+    # Limit 'emergency' pings to EMERGENCY_DAILY_LIMIT per day per pair
+    if ping_type == 'emergency' and daily_pings >= EMERGENCY_DAILY_LIMIT:
+        raise serializers.ValidationError("Daily emergency limit reached for this friend.")
+
 class PingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ping
@@ -134,56 +257,102 @@ class PingSerializer(serializers.ModelSerializer):
         sender = request.user
         receiver = attrs['receiver']
         
-        # 1. Friendship Check
-        friendship = Friendship.objects.filter(
-            (Q(sender=sender, receiver=receiver) | Q(sender=receiver, receiver=sender)) &
-            Q(status='accepted')
-        ).first()
+        blocked = receiver.id in blocks.blocked_ids(sender.id)
+        friendship = None if blocked else accepted_friendship(sender.id, receiver.id).first()
 
-        if not friendship:
-            raise serializers.ValidationError("You can only ping accepted friends.")
-        
-        # 2. VIP Check (Only if ping_type is 'emergency' or 'battery')
-        if attrs.get('ping_type') in ['emergency', 'battery']:
-            is_vip = False
-            if friendship.sender == sender:
-                is_vip = friendship.receiver_is_vip # Receiver considers ME a VIP?
-            else:
-                is_vip = friendship.sender_is_vip # Sender (ME) considers ME a VIP (wait, no).
-                                                  # If I am receiver in friendship, then I check if SENDER (Me) is VIP? 
-                                                  # No. If Friendship(Sender=Bob, Receiver=Alice). 
-                                                  # Bob Pings Alice. Bob is Sender. 
-                                                  # We check if Alice marked Bob as VIP. That is `receiver_is_vip`.
-                                                  # If Alice Pings Bob. Alice is Sender (in Ping).
-                                                  # We check if Bob marked Alice as VIP. That is `sender_is_vip`.
-            if not is_vip:
-                raise serializers.ValidationError("You are not a VIP for this user.")
-
-        # 3. Rate Limit (Simple implementation)
-        # Limit 'emergency' pings to 3 per day per pair (or sender)
-        if attrs.get('ping_type') == 'emergency':
-            today = timezone.now().date()
-            daily_pings = Ping.objects.filter(
-                sender=sender, 
-                receiver=receiver, 
-                ping_type='emergency',
-                created_at__date=today
-            ).count()
-            
-            if daily_pings >= 3:
-                 raise serializers.ValidationError("Daily emergency limit reached for this friend.")
+        daily_pings = 0
+        if friendship and attrs.get('ping_type') == 'emergency':
+            daily_pings = emergency_pings_today(sender.id, receiver.id).count()
 
+        check_ping_rules(sender, friendship, attrs.get('ping_type'), daily_pings, blocked=blocked)
         return attrs
 
     def create(self, validated_data):
         sender = self.context['request'].user
         receiver = validated_data['receiver']
-        return Ping.objects.create(
+        ping = Ping(
             sender=sender,
+            receiver=receiver,
             
             # Pass all validated fields (lat, lon, audio, battery etc.)
              **{k: v for k, v in validated_data.items() if k != 'receiver'}
         )
+        if settings.PING_INGEST_BUFFER:
+            return ingest.save(ping)
+        with transaction.atomic():
+            ping.save()
+        return ping
+
+class BroadcastPingSerializer(serializers.ModelSerializer):
+    # Omitted: every friend the ping may reach, i.e. for emergency and
+    # battery pings the friends who have made the sender a VIP.
+    receivers = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        min_length=1,
+        max_length=settings.BROADCAST_MAX_RECIPIENTS
+    )
+
+    class Meta:
+        model = Ping
+        fields = ['receivers', 'ping_type', 'message', 'latitude', 'longitude', 'battery_level']
+
+    def create(self, validated_data):
+        """
+        Checks every recipient with one friendship query and one daily-count
+        aggregate, then inserts the accepted pings with one bulk_create.
+        Returns the new pings; per-recipient outcomes are left in `results`.
+        """
+        sender = self.context['request'].user
+        receiver_ids = validated_data.pop('receivers', None)
+        ping_type = validated_data.setdefault('ping_type', Ping._meta.get_field('ping_type').default)
+
+        friendships = Friendship.objects.filter(
+            Q(sender=sender) | Q(receiver=sender), status='accepted'
+        ).only('sender_id', 'receiver_id', 'sender_is_vip', 'receiver_is_vip')
+        if receiver_ids is not None:
+            friendships = friendships.filter(
+                Q(sender=sender, receiver_id__in=receiver_ids) | Q(receiver=sender, sender_id__in=receiver_ids)
+            )
+        by_friend = {f.receiver_id if f.sender_id == sender.id else f.sender_id: f for f in friendships}
+        if receiver_ids is None:
+            needs_vip = ping_type in ['emergency', 'battery']
+            receiver_ids = [
+                friend_id for friend_id, f in by_friend.items()
+                if not needs_vip or (f.receiver_is_vip if f.sender_id == sender.id else f.sender_is_vip)
+            ]
+
+        sent_today = {}
+        if ping_type == 'emergency' and receiver_ids:
+            sent_today = dict(
+                emergency_pings_today(sender.id).filter(receiver_id__in=receiver_ids)
+                .values_list('receiver_id')
+                .annotate(count=Count('id'))
+                .order_by()
+            )
+
+        blocked = blocks.blocked_ids(sender.id)
+        self.results, pings = [], []
+        for receiver_id in dict.fromkeys(receiver_ids):
+            try:
+                check_ping_rules(
+                    sender, by_friend.get(receiver_id), ping_type, sent_today.get(receiver_id, 0),
+                    blocked=receiver_id in blocked,
+                )
+            except serializers.ValidationError as exc:
+                self.results.append({'receiver': receiver_id, 'status': 'rejected', 'error': str(exc.detail[0])})
+                continue
+            ping = Ping(sender=sender, receiver_id=receiver_id, **validated_data)
+            pings.append(ping)
+            self.results.append({'receiver': receiver_id, 'status': 'sent', 'ping': ping})
+
+        with transaction.atomic():
+            Ping.objects.bulk_create(pings)
+            signals.pings_created(pings)
+        for result in self.results:
+            if 'ping' in result:
+                result['ping_id'] = result.pop('ping').pk
+        return pings
 
 class HandshakeSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=255)
@@ -205,12 +374,18 @@ class CheckInSerializer(serializers.ModelSerializer):
         expires_at = timezone.now() + timedelta(minutes=duration)
         
         # Deactivate previous active sessions
-        CheckInSession.objects.filter(user=user, status='active').update(status='safe')
+        with transaction.atomic():
+            ids = list(
+                CheckInSession.objects.filter(user=user, status='active')
+                .select_for_update().values_list('id', flat=True)
+            )
+            CheckInSession.objects.filter(id__in=ids).update(status='safe')
+            ChangeLog.record_many(ChangeLog.CHECKIN, ids, user.id)
 
         return CheckInSession.objects.create(
             user=user,
             expires_at=expires_at,
-            message=validated_data.get('message', ''),
+            message=validated_data.pop('message', ''),
             **validated_data
         )
 
@@ -225,12 +400,14 @@ class UserSearchSerializer(serializers.ModelSerializer):
 class FriendListSerializer(serializers.ModelSerializer):
     nickname = serializers.CharField(source='profile.nickname', read_only=True)
     status = serializers.CharField(source='profile.status', read_only=True)
-    last_online = serializers.DateTimeField(source='last_login', read_only=True)
+    # Set on each friend by presence.annotate_last_seen()
+    last_online = serializers.DateTimeField(source='last_seen_at', read_only=True)
+    is_online = serializers.BooleanField(read_only=True)
     is_vip = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'nickname', 'status', 'is_vip', 'last_online']
+        fields = ['id', 'username', 'nickname', 'status', 'is_vip', 'last_online', 'is_online']
 
     def get_is_vip(self, obj):
         # Obj is the Friend (User).
@@ -272,5 +449,64 @@ class PingHistorySerializer(serializers.ModelSerializer):
         model = Ping
         fields = ['id', 'sender_name', 'receiver_name', 'ping_type', 'message', 'status', 'created_at', 'delivered_at']
 
+class SyncFriendshipSerializer(FriendRequestListSerializer):
+    class Meta(FriendRequestListSerializer.Meta):
+        fields = FriendRequestListSerializer.Meta.fields + ['sender_is_vip', 'receiver_is_vip', 'ringtone']
+
+class SyncPingSerializer(PingHistorySerializer):
+    class Meta(PingHistorySerializer.Meta):
+        fields = PingHistorySerializer.Meta.fields + [
+            'sender', 'receiver', 'latitude', 'longitude', 'battery_level', 'response_message', 'response_at'
+        ]
+
+class SyncProfileSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UserProfile
+        fields = ['user_id', 'nickname', 'status']
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    path = serializers.RegexField(r'^/api/', max_length=500)
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+class BatchSerializer(serializers.Serializer):
+    requests = serializers.ListField(
+        child=BatchSubRequestSerializer(),
+        min_length=1,
+        max_length=settings.BATCH_MAX_REQUESTS
+    )
+
+class AnalyticsRangeSerializer(serializers.Serializer):
+    # Inclusive; the last ANALYTICS_DEFAULT_DAYS days by default.
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('until', timezone.localdate())
+        attrs.setdefault('since', attrs['until'] - timedelta(days=settings.ANALYTICS_DEFAULT_DAYS - 1))
+        if attrs['since'] > attrs['until']:
+            raise serializers.ValidationError("since must not be after until.")
+        if (attrs['until'] - attrs['since']).days >= settings.ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError(f"At most {settings.ANALYTICS_MAX_DAYS} days at a time.")
+        return attrs
+
+class NearbyFriendsSerializer(serializers.Serializer):
+    radius_m = serializers.IntegerField(min_value=1, max_value=settings.PROXIMITY_MAX_RADIUS_M, default=5000)
+
+    def validate_radius_m(self, value):
+        return geo.round_up(value)
+
+class TrailPointSerializer(serializers.Serializer):
+    recorded_at = serializers.DateTimeField()
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
 
+class TrailAppendSerializer(serializers.Serializer):
+    points = TrailPointSerializer(many=True, min_length=1, max_length=settings.TRAIL_MAX_APPEND_POINTS)
 
+class TrailSinceSerializer(serializers.Serializer):
+    # Index of the first point wanted: the `next` of the previous response.
+    since = serializers.IntegerField(min_value=0, default=0)
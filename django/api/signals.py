@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from .models import UserProfile, Friendship, Ping, CheckInSession, ChangeLog
+from . import badges, blocks, etags, fanout, rollups
 
 User = get_user_model()
 
@@ -13,3 +14,73 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+@receiver(post_save, sender=UserProfile)
+def bump_profile_etags(sender, instance, created, **kwargs):
+    etags.bump([etags.PROFILE], [instance.user_id])
+    # Friends render our nickname/status in their own lists.
+    if created or instance.public_fields_changed():
+        ChangeLog.record(ChangeLog.PROFILE, instance.user_id, [instance.user_id])
+        if not created:
+            fanout.profile_changed(instance)
+    instance.mark_public_fields_clean()
+
+def _surviving(user_ids, kwargs):
+    # When a user is deleted their own log goes with them; only the other
+    # side needs to hear about the cascade.
+    origin = kwargs.get('origin')
+    if isinstance(origin, User):
+        return [user_id for user_id in user_ids if user_id != origin.pk]
+    return user_ids
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def bump_friendship_etags(sender, instance, **kwargs):
+    etags.bump([etags.FRIENDS, etags.FRIEND_REQUESTS, etags.LIMITS], [instance.sender_id, instance.receiver_id])
+    blocks.invalidate([instance.sender_id, instance.receiver_id])
+    ChangeLog.record(ChangeLog.FRIENDSHIP, instance.pk, _surviving([instance.sender_id, instance.receiver_id], kwargs))
+
+@receiver(post_save, sender=Friendship)
+def count_friendship_badges(sender, instance, created, **kwargs):
+    badges.friendship_saved(instance, created)
+    instance.mark_status_clean()
+
+@receiver(post_delete, sender=Friendship)
+def uncount_friendship_badges(sender, instance, **kwargs):
+    if _surviving([instance.receiver_id], kwargs):
+        badges.friendship_deleted(instance)
+
+@receiver(post_save, sender=Ping)
+@receiver(post_delete, sender=Ping)
+def bump_ping_etags(sender, instance, **kwargs):
+    etags.bump([etags.PING_HISTORY], [instance.sender_id, instance.receiver_id])
+    etags.bump([etags.LIMITS], [instance.sender_id])
+    ChangeLog.record(ChangeLog.PING, instance.pk, _surviving([instance.sender_id, instance.receiver_id], kwargs))
+
+@receiver(post_save, sender=Ping)
+def roll_up_ping(sender, instance, created, **kwargs):
+    rollups.ping_saved(instance, created)
+    badges.ping_saved(instance, created)
+    instance.mark_milestones_clean()
+
+@receiver(post_delete, sender=Ping)
+def uncount_ping_badges(sender, instance, **kwargs):
+    if _surviving([instance.receiver_id], kwargs):
+        badges.ping_deleted(instance)
+
+def pings_created(pings):
+    """What bump_ping_etags does, for pings inserted with bulk_create (which sends no signals)."""
+    etags.bump([etags.PING_HISTORY], {user_id for ping in pings for user_id in (ping.sender_id, ping.receiver_id)})
+    etags.bump([etags.LIMITS], {ping.sender_id for ping in pings})
+    ChangeLog.objects.bulk_create([
+        ChangeLog(user_id=user_id, kind=ChangeLog.PING, object_id=ping.pk)
+        for ping in pings
+        for user_id in {ping.sender_id, ping.receiver_id}
+    ])
+    rollups.pings_created(pings)
+    badges.pings_created(pings)
+
+@receiver(post_save, sender=CheckInSession)
+@receiver(post_delete, sender=CheckInSession)
+def log_checkin_change(sender, instance, **kwargs):
+    ChangeLog.record(ChangeLog.CHECKIN, instance.pk, _surviving([instance.user_id], kwargs))
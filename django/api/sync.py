@@ -0,0 +1,180 @@
+"""
+"Changes since" sync feed across friendships, pings, profiles and check-ins.
+
+Every change a user can see is appended to ChangeLog in the same transaction
+as the change (by the model signals, or by ChangeLog.record_many() next to
+queryset updates). A client keeps the opaque token from its last sync and
+gets back only the records touched since, plus tombstones for the ones that
+are gone or no longer visible to it. Profiles are logged once, for their
+owner; friends pick them up on read.
+
+prune() drops entries older than SYNC_RETENTION_DAYS, always as a prefix of
+the log, so a token from before the oldest remaining entry may have missed
+some; such a client gets a fresh snapshot (`reset`) instead of changes.
+"""
+from datetime import timedelta
+from itertools import takewhile
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChangeLog, CheckInSession, Friendship, Ping, UserProfile
+from .serializers import CheckInSerializer, SyncFriendshipSerializer, SyncPingSerializer, SyncProfileSerializer
+
+FRIENDSHIP, PING, PROFILE, CHECKIN = ChangeLog.FRIENDSHIP, ChangeLog.PING, ChangeLog.PROFILE, ChangeLog.CHECKIN
+
+# Declined and blocked friendships disappear from both users' lists.
+VISIBLE_FRIENDSHIP_STATUSES = ('pending', 'accepted')
+
+SNAPSHOT_PINGS = 50
+
+_SALT = 'api.sync'
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def encode_token(change_id):
+    return signing.dumps(change_id, salt=_SALT)
+
+
+def decode_token(token):
+    try:
+        change_id = signing.loads(token, salt=_SALT)
+    except signing.BadSignature:
+        raise InvalidToken
+    if not isinstance(change_id, int):
+        raise InvalidToken
+    return change_id
+
+
+def _friend_ids(user_id):
+    return [
+        receiver_id if sender_id == user_id else sender_id
+        for sender_id, receiver_id in Friendship.objects.filter(
+            (Q(sender_id=user_id) | Q(receiver_id=user_id)) & Q(status='accepted')
+        ).values_list('sender_id', 'receiver_id')
+    ]
+
+
+def _settle_cutoff():
+    # Log ids are allocated at insert but become visible at commit, so a
+    # slower transaction can still land below an id a client has already
+    # seen. Tokens only move past entries older than SYNC_SETTLE_SECONDS;
+    # newer ones are sent anyway and simply sent again next time.
+    return timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+
+def _payload(request, token, friendships, pings, profiles, checkins, deleted=None, reset=False, has_more=False):
+    context = {'request': request}
+    return {
+        'token': encode_token(token),
+        'reset': reset,
+        'has_more': has_more,
+        'friendships': SyncFriendshipSerializer(friendships, many=True, context=context).data,
+        'pings': SyncPingSerializer(pings, many=True, context=context).data,
+        'profiles': SyncProfileSerializer(profiles, many=True, context=context).data,
+        'checkins': CheckInSerializer(checkins, many=True, context=context).data,
+        'deleted': deleted or {'friendships': [], 'pings': [], 'profiles': [], 'checkins': []},
+    }
+
+
+def snapshot(request):
+    """Everything the client needs to start syncing, with `reset` set."""
+    user = request.user
+    # Taken first, so anything that commits while we read is sent again.
+    token = (
+        ChangeLog.objects.filter(created_at__lte=_settle_cutoff())
+        .order_by('-id')
+        .values_list('id', flat=True)
+        .first()
+    ) or 0
+    friend_ids = _friend_ids(user.id)
+    return _payload(
+        request,
+        token,
+        friendships=Friendship.objects.filter(
+            (Q(sender=user) | Q(receiver=user)) & Q(status__in=VISIBLE_FRIENDSHIP_STATUSES)
+        ).select_related('sender__profile', 'receiver__profile'),
+        pings=Ping.objects.filter(Q(sender=user) | Q(receiver=user))
+        .select_related('sender', 'receiver')
+        .order_by('-created_at')[:SNAPSHOT_PINGS],
+        profiles=UserProfile.objects.filter(user_id__in=[user.id, *friend_ids]),
+        checkins=CheckInSession.objects.filter(user=user, status='active'),
+        reset=True,
+    )
+
+
+def prune(batch_size=10000):
+    """Deletes the log entries older than SYNC_RETENTION_DAYS; returns how many."""
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    # The newest entry stays, so the oldest one left always shows how far pruning went.
+    newest = ChangeLog.objects.order_by('-id').values_list('id', flat=True).first()
+    deleted = 0
+    while newest is not None:
+        batch = list(
+            ChangeLog.objects.filter(id__lt=newest).order_by('id')
+            .values_list('id', 'created_at')[:batch_size]
+        )
+        # Up to the first entry that is recent enough: what goes must be a prefix by id.
+        expired = list(takewhile(lambda entry: entry[1] < cutoff, batch))
+        if not expired:
+            break
+        deleted += ChangeLog.objects.filter(id__lte=expired[-1][0]).delete()[0]
+        if len(expired) < batch_size:
+            break
+    return deleted
+
+
+def changes_since(request, since):
+    oldest = ChangeLog.objects.order_by('id').values_list('id', flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        # Entries after the token may have been pruned; start the client over.
+        return snapshot(request)
+
+    user = request.user
+    friend_ids = _friend_ids(user.id)
+    entries = list(
+        ChangeLog.objects.filter(id__gt=since)
+        .filter(Q(user=user) | Q(user_id__in=friend_ids, kind=PROFILE))
+        .order_by('id')
+        .values_list('id', 'kind', 'object_id', 'created_at')[:settings.SYNC_PAGE_SIZE + 1]
+    )
+    has_more = len(entries) > settings.SYNC_PAGE_SIZE
+    entries = entries[:settings.SYNC_PAGE_SIZE]
+
+    token, cutoff = since, _settle_cutoff()
+    for change_id, _, _, created_at in entries:
+        if created_at > cutoff:
+            break
+        token = change_id
+    has_more = has_more and token == entries[-1][0]
+
+    changed = {FRIENDSHIP: set(), PING: set(), PROFILE: set(), CHECKIN: set()}
+    for _, kind, object_id, _ in entries:
+        changed[kind].add(object_id)
+
+    # The log says what to look at; the tables say what it looks like now.
+    friendships = Friendship.objects.filter(
+        (Q(sender=user) | Q(receiver=user)) &
+        Q(id__in=changed[FRIENDSHIP], status__in=VISIBLE_FRIENDSHIP_STATUSES)
+    ).select_related('sender__profile', 'receiver__profile') if changed[FRIENDSHIP] else []
+    pings = Ping.objects.filter(
+        Q(sender=user) | Q(receiver=user), id__in=changed[PING]
+    ).select_related('sender', 'receiver') if changed[PING] else []
+    profiles = UserProfile.objects.filter(
+        user_id__in=changed[PROFILE] & {user.id, *friend_ids}
+    ) if changed[PROFILE] else []
+    checkins = CheckInSession.objects.filter(user=user, id__in=changed[CHECKIN]) if changed[CHECKIN] else []
+
+    friendships, pings, profiles, checkins = list(friendships), list(pings), list(profiles), list(checkins)
+    deleted = {
+        'friendships': sorted(changed[FRIENDSHIP] - {f.id for f in friendships}),
+        'pings': sorted(changed[PING] - {p.id for p in pings}),
+        'profiles': sorted(changed[PROFILE] - {p.user_id for p in profiles}),
+        'checkins': sorted(changed[CHECKIN] - {c.id for c in checkins}),
+    }
+    return _payload(request, token, friendships, pings, profiles, checkins, deleted=deleted, has_more=has_more)
@@ -1,3 +1,896 @@
-from django.test import TestCase
+import concurrent.futures
+import io
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, badges, blocks, geo, ingest, profiling, rollups, sync, throttling, trails, urls
+from .models import (
+    BadgeCounters, ChangeLog, Friendship, Ping, PingLatencyDay, PingTypeDay, PingUserDay, UserProfile,
+)
+from .presence import PresenceBuffer
+from .routers import REPLICA, PrimaryReplicaRouter, areplica_reads, pin_to_primary, replica_reads
+from .serializers import RegisterSerializer, users_by_email
+
+User = get_user_model()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BlockTests(TestCase):
+    """A block hides each side from the other, whoever blocked whom."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        self.friendship = Friendship.objects.create(
+            sender=self.alice, receiver=self.bob, status='accepted', sender_is_vip=True, receiver_is_vip=True,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def block(self, blocker, blocked):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(blocker).post(f'/api/friends/{blocked.id}/block/')
+        self.assertEqual(response.status_code, 200)
+
+    def search(self, user, query):
+        response = self.client_for(user).get('/api/user/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return {result['username'] for result in response.data}
+
+    def send_ping(self, sender, receiver, ping_type='status'):
+        return self.client_for(sender).post(
+            '/api/pings/send/', {'receiver': receiver.id, 'ping_type': ping_type, 'message': 'hi'}, format='json',
+        )
+
+    def test_blocked_sets_hold_both_sides(self):
+        self.block(self.alice, self.bob)
+        self.assertEqual(blocks.blocked_ids(self.alice.id), {self.bob.id})
+        self.assertEqual(blocks.blocked_ids(self.bob.id), {self.alice.id})
+        self.assertEqual(blocks.blocked_ids(self.carol.id), set())
+
+    def test_block_invalidates_cached_sets(self):
+        # Cache the sets before the block, as a search would.
+        self.assertEqual(self.search(self.bob, 'alice'), {'alice'})
+        self.assertEqual(blocks.blocked_ids(self.alice.id), set())
+
+        self.block(self.alice, self.bob)
+        self.assertEqual(self.search(self.bob, 'alice'), set())
+        self.assertEqual(self.search(self.alice, 'bob'), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.get(pk=self.friendship.pk).delete()
+        self.assertEqual(self.search(self.bob, 'alice'), {'alice'})
+
+    def test_search_hides_both_directions(self):
+        self.block(self.alice, self.bob)
+        self.assertEqual(self.search(self.alice, 'o'), {'carol'})
+        self.assertEqual(self.search(self.bob, 'a'), {'carol'})
+        self.assertEqual(self.search(self.carol, 'b'), {'bob'})
+        self.assertEqual(self.search(self.carol, 'alice'), {'alice'})
+
+    def test_search_fills_the_page_despite_blocks(self):
+        others = [
+            User.objects.create_user(username=f'bobby{i}', email=f'bobby{i}@example.com', password='pass')
+            for i in range(25)
+        ]
+        for other in others[:5]:
+            Friendship.objects.create(sender=other, receiver=self.carol, status='blocked', blocked_by=other)
+        results = self.search(self.carol, 'bobby')
+        self.assertEqual(len(results), 20)
+        self.assertFalse(results & {other.username for other in others[:5]})
+
+    def test_friend_request_rejected_both_directions(self):
+        Friendship.objects.create(sender=self.carol, receiver=self.bob, status='blocked', blocked_by=self.carol)
+        for sender, receiver in ((self.carol, self.bob), (self.bob, self.carol)):
+            response = self.client_for(sender).post('/api/friends/request/', {'receiver_id': receiver.id}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['non_field_errors'], ['User not found.'])
+        self.assertFalse(Friendship.objects.exclude(status='blocked').filter(receiver=self.bob, sender=self.carol).exists())
+
+    def test_ping_rejected_both_directions(self):
+        self.assertEqual(self.send_ping(self.alice, self.bob).status_code, 201)
+        self.block(self.bob, self.alice)
+        for sender, receiver in ((self.alice, self.bob), (self.bob, self.alice)):
+            for ping_type in ('status', 'emergency'):
+                response = self.send_ping(sender, receiver, ping_type)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_broadcast_skips_blocked_receivers(self):
+        Friendship.objects.create(sender=self.alice, receiver=self.carol, status='accepted')
+        self.block(self.bob, self.alice)
+        response = self.client_for(self.alice).post(
+            '/api/pings/broadcast/',
+            {'receivers': [self.bob.id, self.carol.id], 'ping_type': 'status', 'message': 'hi'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        outcomes = {result['receiver']: result['status'] for result in response.data['results']}
+        self.assertEqual(outcomes, {self.bob.id: 'rejected', self.carol.id: 'sent'})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ReplicaRoutingTests(TestCase):
+    """Reads go to the replica only inside replica_reads(), and not for a user who just wrote."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        # Only the alias's presence matters to the router; no connection is opened.
+        patcher = mock.patch.dict(settings.DATABASES, {REPLICA: settings.DATABASES['default']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_alias(self):
+        return self.router.db_for_read(Ping)
+
+    def test_reads_use_the_replica_only_inside_the_block(self):
+        self.assertIsNone(self.read_alias())
+        with replica_reads(1):
+            self.assertEqual(self.read_alias(), REPLICA)
+            self.assertEqual(self.router.db_for_write(Ping), 'default')
+        self.assertIsNone(self.read_alias())
+
+    def test_without_a_replica_reads_stay_on_the_primary(self):
+        del settings.DATABASES[REPLICA]
+        with replica_reads(1):
+            self.assertIsNone(self.read_alias())
+
+    def test_a_write_pins_the_writer_to_the_primary(self):
+        pin_to_primary(1)
+        with replica_reads(1):
+            self.assertIsNone(self.read_alias())
+        with replica_reads(2):
+            self.assertEqual(self.read_alias(), REPLICA)
+
+    def test_write_requests_pin_the_user(self):
+        alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        client = APIClient()
+        client.force_authenticate(alice)
+        response = client.post('/api/friends/request/', {'receiver_id': bob.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        with replica_reads(alice.id):
+            self.assertIsNone(self.read_alias())
+        with replica_reads(bob.id):
+            self.assertEqual(self.read_alias(), REPLICA)
+
+    async def test_async_block(self):
+        async with areplica_reads(1):
+            self.assertEqual(self.read_alias(), REPLICA)
+        self.assertIsNone(self.read_alias())
+        pin_to_primary(2)
+        async with areplica_reads(2):
+            self.assertIsNone(self.read_alias())
+
+
+class PresenceBufferTests(TestCase):
+    """A failed flush keeps its timestamps, and the flusher thread survives it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.buffer = PresenceBuffer()
+        self.buffer._start_flusher = lambda: None
+
+    def test_failed_flush_requeues_timestamps(self):
+        self.buffer.touch(self.user.id)
+        with mock.patch('api.presence.UserProfile.objects.filter', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertIsNotNone(UserProfile.objects.get(user=self.user).last_seen)
+
+    def test_flusher_survives_a_failed_flush(self):
+        flush = mock.Mock(side_effect=[DatabaseError, 1])
+        sleeps = mock.Mock(side_effect=[None, None, SystemExit])
+        with mock.patch.object(self.buffer, 'flush', flush), mock.patch('api.presence.time.sleep', sleeps), \
+                mock.patch('api.presence.connection.close'), self.assertLogs('api.presence', 'ERROR'):
+            with self.assertRaises(SystemExit):
+                self.buffer._run()
+        self.assertEqual(flush.call_count, 2)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class IdempotencyTests(TestCase):
+    """Only successful responses are replayed; a retry after an error runs again."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def send_ping(self, key='key-1'):
+        return self.client.post(
+            '/api/pings/send/', {'receiver': self.bob.id, 'ping_type': 'status', 'message': 'hi'},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_success_is_replayed(self):
+        Friendship.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        self.assertEqual(self.send_ping().status_code, 201)
+        response = self.send_ping()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_client_error_is_not_replayed(self):
+        self.assertEqual(self.send_ping().status_code, 400)
+        Friendship.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        response = self.send_ping()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Ping.objects.count(), 1)
+
+
+# The API as routed with ASYNC_PING_VIEWS on: the native async ping views ahead of the DRF ones.
+urlpatterns = [
+    path('api/', include([
+        path('pings/send/', async_views.SendPingView.as_view(), name='send_ping'),
+        path('pings/<int:pk>/delivered/', async_views.MarkPingDeliveredView.as_view(), name='mark_ping_delivered'),
+        path('pings/history/', async_views.PingHistoryView.as_view(), name='ping_history'),
+        *urls.urlpatterns,
+    ])),
+]
+
+
+@override_settings(ROOT_URLCONF='api.tests', PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BatchAsyncViewTests(TransactionTestCase):
+    """
+    Batch sub-requests reach the native async views as the batch's user.
+    Batched reads run on their own threads and connections, so rows are committed here.
+    """
+
+    def setUp(self):
+        cache.clear()
+        # Token authentication records presence; keep its flusher thread out of the test run.
+        patcher = mock.patch('api.authentication.presence.touch')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        Friendship.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.alice).access_token}')
+
+    def batch(self, *requests):
+        response = self.client.post('/api/batch/', {'requests': list(requests)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['responses']
+
+    def test_async_and_drf_reads(self):
+        responses = self.batch({'method': 'GET', 'path': '/api/pings/history/'}, {'method': 'GET', 'path': '/api/friends/'})
+        self.assertEqual([sub['status'] for sub in responses], [200, 200])
+
+    def test_async_writes(self):
+        responses = self.batch({
+            'method': 'POST', 'path': '/api/pings/send/',
+            'body': {'receiver': self.bob.id, 'ping_type': 'status', 'message': 'hi'},
+        })
+        self.assertEqual(responses[0]['status'], 201)
+        ping = Ping.objects.get()
+        self.assertEqual(ping.sender, self.alice)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.bob).access_token}')
+        responses = self.batch({'method': 'POST', 'path': f'/api/pings/{ping.pk}/delivered/'})
+        self.assertEqual(responses[0]['status'], 200)
+        ping.refresh_from_db()
+        self.assertIsNotNone(ping.delivered_at)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], SYNC_RETENTION_DAYS=30)
+class SyncRetentionTests(TestCase):
+    """Pruning keeps a suffix of the log; tokens from before it get a fresh snapshot."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        Friendship.objects.create(sender=self.alice, receiver=self.bob, status='pending')
+        self.first_id = ChangeLog.objects.order_by('id').values_list('id', flat=True).first()
+        self.old = ChangeLog.objects.update(created_at=timezone.now() - timedelta(days=40))
+        self.friendship = Friendship.objects.create(sender=self.carol, receiver=self.alice, status='pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def sync(self, since):
+        response = self.client.get('/api/sync/', {'token': sync.encode_token(since)})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prune_deletes_old_entries_only(self):
+        recent = ChangeLog.objects.count() - self.old
+        self.assertEqual(sync.prune(batch_size=2), self.old)
+        self.assertEqual(ChangeLog.objects.count(), recent)
+        self.assertEqual(sync.prune(), 0)
+
+    def test_prune_keeps_the_newest_entry(self):
+        ChangeLog.objects.update(created_at=timezone.now() - timedelta(days=40))
+        sync.prune()
+        self.assertEqual(ChangeLog.objects.count(), 1)
+
+    def test_token_before_the_pruned_entries_gets_a_snapshot(self):
+        sync.prune()
+        data = self.sync(self.first_id)
+        self.assertTrue(data['reset'])
+        self.assertEqual({friendship['id'] for friendship in data['friendships']}, set(Friendship.objects.values_list('id', flat=True)))
+
+    def test_token_at_the_retained_entries_gets_changes(self):
+        sync.prune()
+        oldest = ChangeLog.objects.order_by('id').values_list('id', flat=True).first()
+        data = self.sync(oldest - 1)
+        self.assertFalse(data['reset'])
+        self.assertEqual([friendship['id'] for friendship in data['friendships']], [self.friendship.id])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PING_INGEST_BUFFER=True, PING_INGEST_TIMEOUT=0.05, PING_INGEST_MAX_DELAY_MS=0,
+)
+class IngestTimeoutTests(TestCase):
+    """A ping that times out in the ingest queue is dropped, and the request is told to retry."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        Friendship.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        # A buffer whose flusher never runs, as if it were stuck behind a slow batch.
+        self.buffer = ingest.PingIngestBuffer()
+        self.buffer._flusher = mock.Mock()
+        patcher = mock.patch('api.ingest.buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timeout_answers_503_and_drops_the_ping(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.post(
+            '/api/pings/send/', {'receiver': self.bob.id, 'ping_type': 'status', 'message': 'hi'}, format='json',
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.buffer._next_batch(), [])
+        self.assertFalse(Ping.objects.exists())
+
+    def test_ping_being_written_is_waited_for(self):
+        def slow_flusher():
+            [(ping, future)] = self.buffer._next_batch()
+            time.sleep(0.1)
+            future.set_result(ping)
+
+        thread = threading.Thread(target=slow_flusher)
+        thread.start()
+        ping = Ping(sender_id=self.alice.id, receiver_id=self.bob.id, message='hi')
+        self.assertIs(ingest.save(ping), ping)
+        thread.join()
+
+    def test_ping_whose_signal_writes_fail_is_not_stored(self):
+        futures = [concurrent.futures.Future(), concurrent.futures.Future()]
+        pings = [Ping(sender_id=self.alice.id, receiver_id=self.bob.id, message=str(n)) for n in range(2)]
+        with mock.patch('api.badges.add', side_effect=DatabaseError('badge write failed')), \
+                self.assertLogs('api.ingest', 'WARNING'):
+            self.buffer.flush(list(zip(pings, futures)))
+        for future in futures:
+            self.assertIsInstance(future.exception(), DatabaseError)
+        self.assertFalse(Ping.objects.exists())
+        self.assertFalse(ChangeLog.objects.filter(kind=ChangeLog.PING).exists())
+
+    async def test_async_timeout_drops_the_ping(self):
+        with self.assertRaises(ingest.IngestTimeout):
+            await ingest.asave(Ping(sender_id=self.alice.id, receiver_id=self.bob.id, message='hi'))
+        self.assertEqual(self.buffer._next_batch(), [])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RegistrationTests(TestCase):
+    """A taken name and a taken email are told apart, also when registering concurrently."""
+
+    def setUp(self):
+        User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+
+    def register(self, name, email):
+        return APIClient().post(
+            '/api/auth/register/', {'name': name, 'email': email, 'password': 'secret1'}, format='json',
+        )
+
+    def test_taken_email_is_case_insensitive(self):
+        response = self.register('alice2', 'ALICE@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'email'})
+
+    def test_taken_name(self):
+        response = self.register('alice', 'other@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'name'})
+
+    def test_concurrently_taken_name(self):
+        # As if the name was registered between validation and the insert.
+        with mock.patch.object(RegisterSerializer, 'validate_name', side_effect=lambda value: value):
+            response = self.register('alice', 'other@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'name'})
+
+    @skipUnless(connection.vendor == 'sqlite', "other planners may prefer a scan on a tiny table")
+    def test_email_lookup_uses_the_partial_index(self):
+        self.assertIn('auth_user_email_upper_uniq', users_by_email('alice@example.com').explain())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PROXIMITY_DISTANCE_STEP_M=500)
+class NearbyFriendsTests(TestCase):
+    """Nearby friends start from the user's own emergency and only use locations shared with them."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        self.dave = User.objects.create_user(username='dave', email='dave@example.com', password='pass')
+        for friend in (self.bob, self.carol):
+            Friendship.objects.create(sender=self.alice, receiver=friend, status='accepted')
+        self.emergency = self.located_ping(self.alice, self.bob, '52.520000', ping_type='emergency')
+        # About 300 m north of it, sent to alice.
+        self.located_ping(self.bob, self.alice, '52.522700')
+        # Right next to it, but shared with someone else.
+        self.located_ping(self.carol, self.dave, '52.520100')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def located_ping(self, sender, receiver, latitude, ping_type='status'):
+        return Ping.objects.create(
+            sender=sender, receiver=receiver, ping_type=ping_type, message='hi',
+            latitude=latitude, longitude='13.405000',
+        )
+
+    def nearby(self, ping, **params):
+        return self.client.get(f'/api/pings/{ping.pk}/nearby/', params)
+
+    def test_only_locations_shared_with_the_user_are_used(self):
+        response = self.nearby(self.emergency, radius_m=2000)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(friend['username'], friend['within_m']) for friend in response.data], [('bob', 500)])
+        self.assertNotIn('latitude', response.data[0])
+
+    def test_radius_is_rounded_up(self):
+        response = self.nearby(self.emergency, radius_m=1)
+        self.assertEqual([friend['username'] for friend in response.data], ['bob'])
+
+    def test_only_the_users_own_recent_emergency(self):
+        status_ping = self.located_ping(self.alice, self.bob, '52.520000')
+        self.assertEqual(self.nearby(status_ping).status_code, 404)
+        bobs_emergency = self.located_ping(self.bob, self.alice, '52.520000', ping_type='emergency')
+        self.assertEqual(self.nearby(bobs_emergency).status_code, 404)
+        Ping.objects.filter(pk=self.emergency.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.nearby(self.emergency).status_code, 404)
+
+
+class GeohashTests(SimpleTestCase):
+    """Cells are contiguous ranges, and cover() holds every point of the circle, wherever it is."""
+
+    def destination(self, latitude, longitude, bearing, distance_m):
+        """The point distance_m away from the given one on a great circle."""
+        lat1, lon1, angle = math.radians(latitude), math.radians(longitude), distance_m / geo.EARTH_RADIUS_M
+        bearing = math.radians(bearing)
+        lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+        lon2 = lon1 + math.atan2(
+            math.sin(bearing) * math.sin(angle) * math.cos(lat1), math.cos(angle) - math.sin(lat1) * math.sin(lat2),
+        )
+        return math.degrees(lat2), (math.degrees(lon2) + 180) % 360 - 180
+
+    def test_encode_bounds(self):
+        self.assertEqual(geo.encode(-90, -180), 0)
+        self.assertEqual(geo.encode(90, 180), (1 << 2 * geo.AXIS_BITS) - 1)
+        # Longitude takes the top bit, as in base32 geohashes.
+        self.assertEqual(geo.encode(-90, 0), 1 << 2 * geo.AXIS_BITS - 1)
+
+    def test_cover_holds_every_point_within_the_radius(self):
+        rng = random.Random(0)
+        centers = [
+            (52.52, 13.405), (0, 179.999), (0, -179.999), (-45, 180 - 1e-9), (60, -179.95),
+            (89.9, 10), (89.999, 0), (-89.9, -170), (-89.9999, 45),
+        ]
+        for latitude, longitude in centers:
+            for radius_m in (1, 100, 5000, 50_000):
+                ranges = geo.cover(latitude, longitude, radius_m)
+                self.assertEqual(ranges, sorted(ranges))
+                for _ in range(300):
+                    point = self.destination(latitude, longitude, rng.uniform(0, 360), radius_m * rng.random() ** 0.5)
+                    value = geo.encode(*point)
+                    self.assertTrue(
+                        any(low <= value <= high for low, high in ranges),
+                        f'{point} is within {radius_m} m of {(latitude, longitude)} but not covered',
+                    )
+
+    def test_cover_is_tight_away_from_the_poles(self):
+        # 3x3 cells just larger than the radius: nothing a few radii away.
+        ranges = geo.cover(52.52, 13.405, 1000)
+        far = geo.encode(*self.destination(52.52, 13.405, 90, 10_000))
+        self.assertFalse(any(low <= far <= high for low, high in ranges))
+
+    def test_haversine(self):
+        # A degree of latitude, and a quarter of the equator.
+        self.assertAlmostEqual(geo.haversine_m(0, 0, [1], [0])[0], geo.METERS_PER_DEGREE, places=3)
+        self.assertAlmostEqual(geo.haversine_m(0, 0, [0], [90])[0], geo.METERS_PER_DEGREE * 90, places=3)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], TRAIL_CHUNK_POINTS=4, TRAIL_READ_MAX_POINTS=100,
+)
+class TrailTests(TestCase):
+    """Delta-encoded fixes survive a round trip, appends fill chunks across boundaries, reads start anywhere."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.start = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def points(self, first, count):
+        return [
+            {
+                'recorded_at': self.start + timedelta(seconds=5 * i),
+                'latitude': -33.856784 + 0.0001 * i,
+                'longitude': 151.215297 - 0.0002 * i,
+            }
+            for i in range(first, first + count)
+        ]
+
+    def read(self, trail, since):
+        return [trails.to_fix(point) for point in trails.points_since(trail, since)]
+
+    def read_expected(self, first, until):
+        return [trails.to_fix(point) for point in self.points(first, until - first)]
+
+    def test_round_trip(self):
+        fixes = [
+            (1_767_268_800_000, 52_520_000, 13_405_000),
+            (1_767_268_795_000, 52_519_000, 13_406_000),  # every delta negative
+            (1_767_268_795_000, -33_856_784, -180_000_000),
+            (0, 90_000_000, 180_000_000),
+            (0, 0, 0),
+        ]
+        self.assertEqual(trails.decode(trails.encode(fixes)), fixes)
+        head, tail = fixes[:2], fixes[2:]
+        self.assertEqual(trails.decode(trails.encode(head) + trails.encode(tail, head[-1])), fixes)
+        self.assertEqual(trails.decode(b''), [])
+
+    def test_fix_conversion(self):
+        point = self.points(0, 1)[0]
+        converted = trails.to_point(trails.to_fix(point))
+        self.assertEqual(converted['recorded_at'], point['recorded_at'])
+        self.assertAlmostEqual(converted['latitude'], point['latitude'], places=6)
+        self.assertAlmostEqual(converted['longitude'], point['longitude'], places=6)
+
+    def test_appends_straddle_chunk_boundaries(self):
+        trails.append(self.user.id, self.points(0, 3))
+        trails.append(self.user.id, self.points(3, 3))
+        trail = trails.append(self.user.id, self.points(6, 5))
+        self.assertEqual(trail.point_count, 11)
+        chunks = trail.chunks.order_by('first_index').values_list('first_index', 'count')
+        self.assertEqual(list(chunks), [(0, 4), (4, 4), (8, 3)])
+        self.assertEqual(self.read(trail, 0), self.read_expected(0, 11))
+
+    def test_points_since_inside_a_chunk(self):
+        trail = trails.append(self.user.id, self.points(0, 10))
+        self.assertEqual(self.read(trail, 5), self.read_expected(5, 10))
+        self.assertEqual(self.read(trail, 9), self.read_expected(9, 10))
+        self.assertEqual(self.read(trail, 10), [])
+
+    @override_settings(TRAIL_READ_MAX_POINTS=3)
+    def test_points_since_is_capped(self):
+        trail = trails.append(self.user.id, self.points(0, 10))
+        self.assertEqual(self.read(trail, 3), self.read_expected(3, 6))
+
+    def test_blocking_ends_access_to_a_trail(self):
+        bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        friendship = Friendship.objects.create(sender=self.user, receiver=bob, status='accepted')
+        Ping.objects.create(sender=self.user, receiver=bob, ping_type='emergency', message='help')
+        trails.append(self.user.id, self.points(0, 3))
+        client = APIClient()
+        client.force_authenticate(bob)
+        self.assertEqual(client.get(f'/api/location/trail/{self.user.id}/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            friendship.status, friendship.blocked_by = 'blocked', bob
+            friendship.save()
+        self.assertEqual(client.get(f'/api/location/trail/{self.user.id}/').status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BadgeCounterTests(TestCase):
+    """The counters follow the rows they count, also when their row is created concurrently."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+
+    def assertCounted(self, user):
+        self.assertEqual(badges.get(user.id), badges.recount(user.id))
+
+    def test_counters_follow_changes(self):
+        request = Friendship.objects.create(sender=self.alice, receiver=self.bob, status='pending')
+        ping = Ping.objects.create(sender=self.alice, receiver=self.bob, ping_type='emergency', message='help')
+        self.assertEqual(badges.get(self.bob.id), {'pending_requests': 1, 'undelivered_pings': 1, 'unanswered_pings': 1})
+        request.status = 'accepted'
+        request.save()
+        ping.mark_delivered()
+        ping.respond('on my way')
+        self.assertEqual(badges.get(self.bob.id), {'pending_requests': 0, 'undelivered_pings': 0, 'unanswered_pings': 0})
+        self.assertCounted(self.alice)
+
+    def test_row_created_concurrently_from_a_stale_recount(self):
+        get_or_create = BadgeCounters.objects.get_or_create
+
+        def racing(**kwargs):
+            # Another transaction recounted before this one's change and created the row first.
+            BadgeCounters.objects.create(user_id=kwargs['user_id'])
+            return get_or_create(**kwargs)
+
+        with mock.patch.object(BadgeCounters.objects, 'get_or_create', side_effect=racing):
+            Friendship.objects.create(sender=self.alice, receiver=self.bob, status='pending')
+        self.assertEqual(badges.get(self.bob.id)['pending_requests'], 1)
+
+
+class SchemaTests(SimpleTestCase):
+    def test_token_authentication_is_documented(self):
+        from drf_spectacular.generators import SchemaGenerator
+
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        self.assertEqual(schema['components']['securitySchemes']['jwtAuth']['scheme'], 'bearer')
+        self.assertIn({'jwtAuth': []}, schema['paths']['/api/friends/']['get']['security'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PROFILING_SAMPLE_RATE=0, PROFILING_MAX_PROFILES=2,
+)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+        # Token authentication records presence; keep its flusher thread out of the test run.
+        self.enterContext(mock.patch('api.authentication.presence.touch'))
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass', is_staff=True)
+        self.user = User.objects.create_user(username='user', email='user@example.com', password='pass')
+
+    def get(self, user, **extra):
+        token = RefreshToken.for_user(user).access_token
+        return self.client.get('/api/friends/', HTTP_AUTHORIZATION=f'Bearer {token}', **extra)
+
+    def store(self, *profile_ids):
+        for profile_id in profile_ids:
+            (self.directory / f'{profile_id}.json').write_text('{}')
+            (self.directory / f'{profile_id}.prof').write_bytes(b'')
+
+    def test_only_staff_can_ask_for_a_profile(self):
+        self.assertNotIn('X-Profile-Id', self.get(self.user, HTTP_X_PROFILE='1'))
+        self.assertNotIn('X-Profile-Id', self.get(self.staff))
+
+        response = self.get(self.staff, HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+        profile = json.loads(profiling.path_of(profile_id, '.json').read_text())
+        self.assertEqual((profile['url_name'], profile['status']), ('friend_list', 200))
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertGreater(profile['query_count'], 0)
+        self.assertIsNotNone(profiling.path_of(profile_id, '.prof'))
+
+    def test_oldest_profiles_are_pruned(self):
+        self.store('1760000000000-0000000a', '1760000000001-0000000b', '1760000000002-0000000c')
+        profiling.prune()
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            ['1760000000001-0000000b.json', '1760000000001-0000000b.prof',
+             '1760000000002-0000000c.json', '1760000000002-0000000c.prof'],
+        )
+
+    def test_profile_ids_stay_inside_the_directory(self):
+        self.store('1760000000000-0000000a')
+        (self.directory.parent / 'secret.json').touch()
+        self.addCleanup((self.directory.parent / 'secret.json').unlink)
+        self.assertEqual(profiling.path_of('1760000000000-0000000a', '.json'), self.directory / '1760000000000-0000000a.json')
+        for profile_id in ('../secret', '1760000000000-0000000a/../../secret', '/tmp/secret', '', '1760000000000-0000000a\n'):
+            self.assertIsNone(profiling.path_of(profile_id, '.json'))
+
+    def test_sql_is_captured_on_a_thread_without_connections(self):
+        recorded = []
+
+        def profiled_request():
+            try:
+                with profiling.Recorder(RequestFactory().get('/')) as recorder:
+                    with connections['default'].cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                recorded.extend(query['sql'] for query in recorder.queries)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=profiled_request)
+        thread.start()
+        thread.join()
+        self.assertEqual(recorded, ['SELECT 1'])
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    THROTTLE_ENABLED=True, THROTTLE_RATES={'default': '3/min'},
+)
+class ThrottleTests(TestCase):
+    """Sliding-window limits per route, counted before authentication and the view."""
+    START = 1_800_000_000  # The start of a minute window.
+
+    def setUp(self):
+        cache.clear()
+        self.now = self.START
+        self.enterContext(mock.patch('api.throttling.time.time', lambda: self.now))
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+
+    def get(self, user=None, **extra):
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+        with mock.patch('api.authentication.presence.touch'):
+            return self.client.get('/api/friends/', **extra)
+
+    def test_limit_boundary(self):
+        self.assertEqual([self.get(self.alice).status_code for _ in range(3)], [200, 200, 200])
+        response = self.get(self.alice)
+        self.assertEqual(response.status_code, 429)
+        # Four requests in this window: the next one fits once 30 seconds of
+        # the following window have weighed them down to 2.
+        self.assertEqual(response['Retry-After'], '90')
+
+    def test_retry_after_while_the_previous_window_slides_out(self):
+        for _ in range(4):
+            self.get(self.alice)
+        self.now = self.START + 60 + 15
+        # 4 * 3/4 of the previous window + 1 is over 3 ...
+        response = self.get(self.alice)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # ... and 4 * 1/4 + 2 fits when that wait is over.
+        self.now += 30
+        self.assertEqual(self.get(self.alice).status_code, 200)
+
+    def test_retry_after(self):
+        self.assertIsNone(throttling._retry_after(3, 60, 0, 0, 3))
+        self.assertEqual(throttling._retry_after(3, 60, 0, 0, 4), 90)
+        self.assertEqual(throttling._retry_after(3, 60, 15, 4, 1), 30)
+        self.assertEqual(throttling._retry_after(3, 60, 15, 4, 2), 45)
+        self.assertEqual(throttling._retry_after(3, 60, 44.9, 4, 2), 16)
+        # Never less than a second, for per-second rates.
+        self.assertEqual(throttling._retry_after(10, 1, 0.5, 20, 1), 1)
+
+    def test_limits_are_per_user_and_per_ip(self):
+        for _ in range(3):
+            self.get(self.alice)
+            self.get(REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.get(self.alice).status_code, 429)
+        self.assertEqual(self.get(self.bob).status_code, 200)
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_admin_routes_are_not_throttled(self):
+        statuses = {self.client.get('/admin/login/').status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+
+    def test_throttled_request_runs_no_queries(self):
+        for _ in range(3):
+            self.get(self.alice)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(self.alice).status_code, 429)
+
+    def test_counter_evicted_before_it_is_incremented(self):
+        request = RequestFactory().get('/api/friends/', REMOTE_ADDR='10.0.0.1')
+        with mock.patch.object(throttling.cache, 'add'):
+            self.assertIsNone(throttling.check(request, 'friend_list'))
+        self.assertEqual(cache.get(f'throttle:friend_list:ip:10.0.0.1:{self.START // 60}'), 1)
+
+    async def test_async_check_counts_like_check(self):
+        request = RequestFactory().get('/api/friends/', REMOTE_ADDR='10.0.0.1')
+        results = [await throttling.acheck(request, 'friend_list') for _ in range(4)]
+        self.assertEqual(results[:3], [None, None, None])
+        self.assertEqual(results[3]['Retry-After'], '90')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RollupTests(TestCase):
+    """The incremental rollups match what backfill_ping_rollups recounts from the pings."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        for friend in (self.bob, self.carol):
+            Friendship.objects.create(sender=self.alice, receiver=friend, status='accepted')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def rollups(self):
+        def row(values):
+            return tuple(round(value, 6) if isinstance(value, float) else value for value in values)
+        return {
+            model.__name__: sorted(row(values) for values in model.objects.values_list(
+                *[field.attname for field in model._meta.concrete_fields if not field.primary_key]
+            ))
+            for model in (PingTypeDay, PingLatencyDay, PingUserDay)
+        }
+
+    def backfill(self, *args):
+        today = timezone.localdate().isoformat()
+        call_command('backfill_ping_rollups', '--since', today, '--until', today, *args, stdout=io.StringIO())
+
+    def test_rollups_match_a_backfill(self):
+        alice, bob = self.client_for(self.alice), self.client_for(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = alice.post('/api/pings/send/', {'receiver': self.bob.id, 'ping_type': 'status', 'message': 'hi'})
+            self.assertEqual(response.status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = alice.post(
+                '/api/pings/broadcast/', {'receivers': [self.bob.id, self.carol.id], 'ping_type': 'checkin', 'message': 'ok?'},
+                format='json',
+            )
+            self.assertEqual(response.data['sent'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = [(Ping(sender=self.carol, receiver=self.alice, message='ingested'), concurrent.futures.Future())]
+            ingest.PingIngestBuffer().flush(batch)
+            self.assertIsNotNone(batch[0][1].result().pk)
+
+        first, second = Ping.objects.filter(receiver=self.bob).order_by('id')
+        for _ in range(2):  # The second delivery and answer do not count again.
+            with self.captureOnCommitCallbacks(execute=True):
+                bob.post(f'/api/pings/{first.pk}/delivered/')
+                bob.post(f'/api/pings/{second.pk}/delivered/')
+            with self.captureOnCommitCallbacks(execute=True):
+                bob.post(f'/api/pings/{first.pk}/handshake/', {'message': 'fine'})
+
+        incremental = self.rollups()
+        # (ping_type, sent, delivered, responded)
+        self.assertEqual(
+            [(row[1], row[2], row[3], row[5]) for row in incremental['PingTypeDay']],
+            [('checkin', 2, 1, 0), ('emergency', 1, 0, 0), ('status', 1, 1, 1)],
+        )
+        self.backfill()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_failed_backfill_keeps_the_day(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for message in ('one', 'two'):
+                Ping.objects.create(sender=self.alice, receiver=self.bob, ping_type='status', message=message)
+        before = self.rollups()
+        write = rollups.Deltas.write
+        calls = []
+
+        def failing_write(deltas):
+            calls.append(deltas)
+            if len(calls) == 2:
+                raise DatabaseError('write failed')
+            write(deltas)
+
+        with mock.patch.object(rollups.Deltas, 'write', failing_write), self.assertRaises(DatabaseError):
+            self.backfill('--chunk-size', '1')
+        self.assertEqual(self.rollups(), before)
@@ -0,0 +1,119 @@
+"""
+Per-route rate limits (THROTTLE_RATES), enforced before any view code runs.
+
+Every request to a named route counts against that route's limit. The
+limit is per user when the request carries a valid access token; the user
+comes from the JWT itself, not the database. Otherwise it is per client IP.
+
+A limit is a sliding window. The count is estimated from two fixed-window
+counters: the current window's count, plus the previous window's count
+weighted by how much of it still overlaps. Each request is then one atomic
+cache.incr and one read. A client costs two integers whatever its rate,
+where DRF's throttles keep a list with one timestamp per request.
+ThrottleMiddleware applies the limits to HTTP requests; the batch view
+applies them to each sub-request.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """'100/min' -> (100, 60), the same format as DRF's throttle rates."""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def get_rate(url_name):
+    return parse_rate(settings.THROTTLE_RATES.get(url_name, settings.THROTTLE_RATES['default']))
+
+
+def token_user_id(request):
+    """The user id in the request's access token, or None. No database access."""
+    parts = request.META.get(api_settings.AUTH_HEADER_NAME, '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(parts[1]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+def _key(request, url_name, user_id):
+    if user_id is None:
+        user_id = token_user_id(request)
+    if user_id is not None:
+        return f'throttle:{url_name}:user:{user_id}'
+    # Honours REST_FRAMEWORK['NUM_PROXIES'] for X-Forwarded-For.
+    return f'throttle:{url_name}:ip:{BaseThrottle().get_ident(request)}'
+
+
+def _window(url_name):
+    limit, period = get_rate(url_name)
+    window, elapsed = divmod(time.time(), period)
+    return limit, period, int(window), elapsed
+
+
+def _retry_after(limit, period, elapsed, previous, current):
+    """Seconds until the next request would be allowed, or None if this one is."""
+    if previous * (1 - elapsed / period) + current <= limit:
+        return None
+    if current + 1 <= limit:
+        # Wait for enough of the previous window to slide out.
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    else:
+        # This window alone is over; wait into the next one until it has
+        # slid out far enough.
+        wait = period - elapsed + period * (1 - (limit - 1) / current)
+    return max(1, math.ceil(wait))
+
+
+def throttled(retry_after):
+    response = JsonResponse(
+        {'detail': f'Request was throttled. Expected available in {retry_after} seconds.'},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def check(request, url_name, user_id=None):
+    """Counts the request; returns a 429 response if it is over its route's limit."""
+    limit, period, window, elapsed = _window(url_name)
+    key = _key(request, url_name, user_id)
+    current_key = f'{key}:{window}'
+    # The counter must outlive the next window, which weighs it in.
+    cache.add(current_key, 0, timeout=period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:  # Evicted in between.
+        current = 1
+        cache.set(current_key, current, timeout=period * 2)
+    previous = cache.get(f'{key}:{window - 1}', 0)
+    retry_after = _retry_after(limit, period, elapsed, previous, current)
+    return None if retry_after is None else throttled(retry_after)
+
+
+async def acheck(request, url_name, user_id=None):
+    limit, period, window, elapsed = _window(url_name)
+    key = _key(request, url_name, user_id)
+    current_key = f'{key}:{window}'
+    await cache.aadd(current_key, 0, timeout=period * 2)
+    try:
+        current = await cache.aincr(current_key)
+    except ValueError:
+        current = 1
+        await cache.aset(current_key, current, timeout=period * 2)
+    previous = await cache.aget(f'{key}:{window - 1}', 0)
+    retry_after = _retry_after(limit, period, elapsed, previous, current)
+    return None if retry_after is None else throttled(retry_after)
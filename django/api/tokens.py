@@ -0,0 +1,102 @@
+"""
+Refresh-token rotation and revocation without a token table.
+
+Every refresh is single-use: auth/refresh/ revokes the token it is given and
+returns a new refresh token alongside the access token. Revocation lives in
+the cache, in two compact forms:
+- A generation counter per user. Tokens carry the generation they were issued
+  in (the `gen` claim); bumping the counter revokes all of a user's tokens at
+  once (logout everywhere, account deletion, a refresh token used twice).
+- The JTIs of individually revoked tokens (rotated or logged out), each kept
+  only until the token would have expired anyway.
+
+Checking a token is therefore one cache round trip and no SQL, and nothing
+needs cleaning up: JTI entries expire on their own and the counters are one
+integer per user who ever revoked everything.
+"""
+import time
+
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+GENERATION_CLAIM = 'gen'
+
+
+def _generation_key(user_id):
+    return f'token:gen:{user_id}'
+
+
+def _revoked_key(jti):
+    return f'token:revoked:{jti}'
+
+
+def generation(user_id):
+    return cache.get(_generation_key(user_id), 0)
+
+
+def for_user(user):
+    """RefreshToken.for_user, stamped with the user's current generation."""
+    refresh = RefreshToken.for_user(user)
+    refresh[GENERATION_CLAIM] = generation(user.id)
+    return refresh
+
+
+def _keys(token):
+    return _generation_key(token.get(api_settings.USER_ID_CLAIM)), _revoked_key(token.get(api_settings.JTI_CLAIM))
+
+
+def _check(token, keys, values):
+    generation_key, revoked_key = keys
+    if revoked_key in values or token.get(GENERATION_CLAIM, 0) != values.get(generation_key, 0):
+        raise InvalidToken(_('Token has been revoked'))
+
+
+def check(token):
+    """Raises InvalidToken if `token` (already validated) has been revoked."""
+    keys = _keys(token)
+    _check(token, keys, cache.get_many(keys))
+
+
+async def acheck(token):
+    keys = _keys(token)
+    _check(token, keys, await cache.aget_many(keys))
+
+
+def revoke(token):
+    """
+    Revokes a single token until it expires. Returns False if it already was,
+    so that two concurrent rotations of the same token cannot both succeed.
+    """
+    timeout = max(1, int(token['exp'] - time.time()))
+    return cache.add(_revoked_key(token[api_settings.JTI_CLAIM]), 1, timeout=timeout)
+
+
+def revoke_user(user_id):
+    """Revokes every token issued to the user so far."""
+    key = _generation_key(user_id)
+    # Never expires: losing the counter would bring revoked tokens back.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def rotate(refresh):
+    """
+    Revokes `refresh` and returns its replacement. A refresh token presented
+    a second time was copied or leaked, so every token of its user is revoked.
+    """
+    user_id = refresh[api_settings.USER_ID_CLAIM]
+    if not revoke(refresh):
+        revoke_user(user_id)
+        raise InvalidToken(_('Token has been revoked'))
+    if refresh.get(GENERATION_CLAIM, 0) != generation(user_id):
+        raise InvalidToken(_('Token has been revoked'))
+    refresh.set_jti()
+    refresh.set_exp()
+    refresh.set_iat()
+    return refresh
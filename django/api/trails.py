@@ -0,0 +1,146 @@
+"""
+Live location trails: the fixes a phone streams while its user has an
+emergency or check-in going (LocationTrail, LocationTrailChunk).
+
+A fix is (milliseconds since the epoch, latitude and longitude in
+microdegrees). Chunks hold up to TRAIL_CHUNK_POINTS fixes, each stored as
+its difference from the previous one in zigzag varints, so a fix a few
+seconds and meters after the last takes 4-6 bytes. The first fix of a chunk
+is relative to zero, so every chunk decodes on its own and a "since N" read
+only loads the chunks that reach past N.
+
+An append goes to the user's latest trail unless it has been idle for
+TRAIL_IDLE_MINUTES, which starts a new one. It is refused unless the user
+sent an emergency ping in the last TRAIL_EMERGENCY_MINUTES or has a check-in
+running. A trail can be read by its owner and by anyone who received an
+emergency ping from them during it (or up to TRAIL_EMERGENCY_MINUTES before
+it started), unless one of the two has blocked the other since.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import blocks
+from .models import CheckInSession, LocationTrail, LocationTrailChunk, Ping
+
+
+def _put(out, value):
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode(fixes, previous=(0, 0, 0)):
+    out = bytearray()
+    for fix in fixes:
+        for value, last in zip(fix, previous):
+            _put(out, value - last)
+        previous = fix
+    return bytes(out)
+
+
+def decode(data):
+    fixes, fix, values, value, shift = [], (0, 0, 0), [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+        if len(values) == 3:
+            fix = tuple(last + delta for last, delta in zip(fix, values))
+            fixes.append(fix)
+            values = []
+    return fixes
+
+
+def to_fix(point):
+    return (
+        int(point['recorded_at'].timestamp() * 1000),
+        int(round(point['latitude'] * 1_000_000)),
+        int(round(point['longitude'] * 1_000_000)),
+    )
+
+
+def to_point(fix):
+    return {
+        'recorded_at': datetime.fromtimestamp(fix[0] / 1000, tz=dt_timezone.utc),
+        'latitude': fix[1] / 1_000_000,
+        'longitude': fix[2] / 1_000_000,
+    }
+
+
+def in_emergency(user_id):
+    since = timezone.now() - timedelta(minutes=settings.TRAIL_EMERGENCY_MINUTES)
+    return (
+        Ping.objects.filter(sender_id=user_id, ping_type='emergency', created_at__gte=since).exists()
+        or CheckInSession.objects.filter(user_id=user_id, status='active').exists()
+    )
+
+
+def append(user_id, points):
+    """Appends the points to the user's current trail; returns the trail."""
+    fixes = [to_fix(point) for point in points]
+    size = settings.TRAIL_CHUNK_POINTS
+    with transaction.atomic():
+        trail = LocationTrail.objects.select_for_update().filter(user_id=user_id).order_by('-started_at').first()
+        if trail is None or trail.updated_at < timezone.now() - timedelta(minutes=settings.TRAIL_IDLE_MINUTES):
+            trail = LocationTrail.objects.create(user_id=user_id)
+
+        room = -trail.point_count % size
+        if room:
+            head, fixes = fixes[:room], fixes[room:]
+            last = (trail.last_time, trail.last_latitude, trail.last_longitude)
+            chunk = LocationTrailChunk.objects.get(trail=trail, first_index=trail.point_count - (size - room))
+            chunk.data = bytes(chunk.data) + encode(head, last)
+            chunk.count += len(head)
+            chunk.save(update_fields=['data', 'count'])
+            trail.point_count += len(head)
+            trail.last_time, trail.last_latitude, trail.last_longitude = head[-1]
+
+        chunks = []
+        for start in range(0, len(fixes), size):
+            batch = fixes[start:start + size]
+            chunks.append(LocationTrailChunk(
+                trail=trail, first_index=trail.point_count, count=len(batch), data=encode(batch),
+            ))
+            trail.point_count += len(batch)
+            trail.last_time, trail.last_latitude, trail.last_longitude = batch[-1]
+        LocationTrailChunk.objects.bulk_create(chunks)
+        trail.save(update_fields=['point_count', 'last_time', 'last_latitude', 'last_longitude', 'updated_at'])
+    return trail
+
+
+def latest_readable(owner_id, reader_id):
+    """The owner's latest trail if reader_id may follow it, else None."""
+    trail = LocationTrail.objects.filter(user_id=owner_id).order_by('-started_at').first()
+    if trail is None or owner_id == reader_id:
+        return trail
+    if reader_id in blocks.blocked_ids(owner_id):
+        return None
+    alerted = Ping.objects.filter(
+        sender_id=owner_id, receiver_id=reader_id, ping_type='emergency',
+        created_at__gte=trail.started_at - timedelta(minutes=settings.TRAIL_EMERGENCY_MINUTES),
+    ).exists()
+    return trail if alerted else None
+
+
+def points_since(trail, since):
+    """Up to TRAIL_READ_MAX_POINTS points of the trail from index `since` on."""
+    until = min(trail.point_count, since + settings.TRAIL_READ_MAX_POINTS)
+    chunks = (
+        LocationTrailChunk.objects.filter(trail=trail, first_index__lt=until)
+        .alias(end=F('first_index') + F('count')).filter(end__gt=since)
+        .order_by('first_index').values_list('first_index', 'data')
+    )
+    points = []
+    for first_index, data in chunks:
+        fixes = decode(bytes(data))
+        points.extend(to_point(fix) for fix in fixes[max(0, since - first_index):until - first_index])
+    return points
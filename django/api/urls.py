@@ -3,13 +3,20 @@ from .views import (
     RegisterView, CustomTokenObtainPairView, UpdateStatusView, UpdateFCMTokenView,
     RegisterView, CustomTokenObtainPairView, UpdateStatusView, UpdateFCMTokenView,
     SendFriendRequestView, RespondToFriendRequestView, SetVIPStatusView,
-    SendPingView, MarkPingDeliveredView,
-    FriendListView, FriendRequestsListView, UnfriendView, BlockUserView,
-    UserSearchView, UserProfileView, DeleteAccountView, LogoutView,
-    PingHistoryView, UserLimitsView,
-    HandshakeView, SetRingtoneView, CheckInStartView, CheckInSafeView
+    SendPingView, BroadcastPingView, MarkPingDeliveredView,
+    FriendListView, NearbyFriendsView, FriendRequestsListView, UnfriendView, BlockUserView,
+    UserSearchView, UserProfileView, BadgeCountersView, DeleteAccountView, LogoutView,
+    PingHistoryView, UserLimitsView, HeartbeatView, SyncView, PushQueueView,
+    PingAnalyticsView, UserPingAnalyticsView, ProfileListView, ProfileDetailView, ProfileDownloadView,
+    HandshakeView, SetRingtoneView, CheckInStartView, CheckInSafeView, TrailAppendView, TrailView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
+from django.conf import settings
+from .batch import BatchView
+
+if settings.ASYNC_PING_VIEWS:
+    # Native async versions of the hot ping paths (see api/async_views.py).
+    from .async_views import SendPingView, MarkPingDeliveredView, HandshakeView, PingHistoryView
 
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
@@ -18,6 +25,7 @@ urlpatterns = [
     
     path('user/status/', UpdateStatusView.as_view(), name='update_status'),
     path('user/fcm-token/', UpdateFCMTokenView.as_view(), name='update_fcm_token'),
+    path('user/heartbeat/', HeartbeatView.as_view(), name='heartbeat'),
 
     path('friends/', FriendListView.as_view(), name='friend_list'),
     path('friends/requests/', FriendRequestsListView.as_view(), name='friend_requests'),
@@ -29,15 +37,29 @@ urlpatterns = [
 
     path('user/search/', UserSearchView.as_view(), name='user_search'),
     path('user/profile/', UserProfileView.as_view(), name='user_profile'),
+    path('user/badges/', BadgeCountersView.as_view(), name='badges'),
     path('user/me/', DeleteAccountView.as_view(), name='delete_account'),
     path('auth/logout/', LogoutView.as_view(), name='logout'),
 
     path('pings/send/', SendPingView.as_view(), name='send_ping'),
+    path('pings/broadcast/', BroadcastPingView.as_view(), name='broadcast_ping'),
     path('pings/<int:pk>/delivered/', MarkPingDeliveredView.as_view(), name='mark_ping_delivered'),
     path('pings/<int:pk>/handshake/', HandshakeView.as_view(), name='send_handshake'),
+    path('pings/<int:pk>/nearby/', NearbyFriendsView.as_view(), name='nearby_friends'),
     path('pings/history/', PingHistoryView.as_view(), name='ping_history'),
+    path('push/queue/', PushQueueView.as_view(), name='push_queue'),
+    path('analytics/pings/', PingAnalyticsView.as_view(), name='ping_analytics'),
+    path('analytics/users/<int:user_id>/', UserPingAnalyticsView.as_view(), name='user_ping_analytics'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile_detail'),
+    path('profiles/<str:profile_id>/download/', ProfileDownloadView.as_view(), name='profile_download'),
     
     path('user/limits/', UserLimitsView.as_view(), name='user_limits'),
     path('user/checkin/start/', CheckInStartView.as_view(), name='checkin_start'),
     path('user/checkin/safe/', CheckInSafeView.as_view(), name='checkin_safe'),
+    path('location/trail/', TrailAppendView.as_view(), name='append_trail'),
+    path('location/trail/<int:user_id>/', TrailView.as_view(), name='location_trail'),
+
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('batch/', BatchView.as_view(), name='batch'),
 ]
@@ -1,32 +1,59 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import (
     RegisterSerializer, 
     CustomTokenObtainPairSerializer, 
     UserProfileSerializer,
+    DeviceTokenSerializer,
+    LogoutSerializer,
     FriendRequestSerializer,
     FriendshipActionSerializer,
     VIPSerializer,
     PingSerializer,
+    BroadcastPingSerializer,
     UserSearchSerializer,
     FriendListSerializer,
     FriendRequestListSerializer,
     PingHistorySerializer,
     HandshakeSerializer,
     RingtoneSerializer,
-    CheckInSerializer
+    CheckInSerializer,
+    AnalyticsRangeSerializer,
+    NearbyFriendsSerializer,
+    TrailAppendSerializer,
+    TrailPointSerializer,
+    TrailSinceSerializer,
+    EMERGENCY_DAILY_LIMIT,
+    emergency_pings_today,
+    today_range,
 )
-from .models import UserProfile, Friendship, Ping, CheckInSession
+from .models import UserProfile, DeviceToken, Friendship, Ping, CheckInSession, ChangeLog, AccountDeletion, PushDeadLetter
+from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Count
+from django.http import FileResponse, Http404
 from rest_framework.generics import get_object_or_404
 from django.utils import timezone
+from . import account_deletion, badges, blocks, etags, geo, presence, profiling, push_queue, rollups, sync, tokens, trails
+from .etags import ConditionalGetMixin
+from .idempotency import idempotent
+from .push import register_device
+from .push_queue import notify_ping, notify_pings
+from .routers import ReplicaReadMixin
+from .schema import extend_schema
 
 User = get_user_model()
 
+USER_SEARCH_LIMIT = 20
+
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
@@ -71,17 +98,15 @@ class UpdateFCMTokenView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     @extend_schema(
-        request=UserProfileSerializer,
-        responses={200: UserProfileSerializer},
-        summary="Update FCM Token",
-        description="Updates the Firebase Cloud Messaging token for the authenticated user to enable push notifications."
+        request=DeviceTokenSerializer,
+        responses={200: DeviceTokenSerializer},
+        summary="Register FCM Token",
+        description="Registers the Firebase Cloud Messaging token of the calling device so it receives push notifications. Each of the user's devices registers its own token."
     )
     def put(self, request):
-        user_profile = request.user.profile
-        # We expect {'fcm_token': '...'}
-        serializer = UserProfileSerializer(user_profile, data=request.data, partial=True)
+        serializer = DeviceTokenSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            register_device(request.user, serializer.validated_data['fcm_token'], serializer.validated_data['platform'])
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -95,12 +120,14 @@ class SendFriendRequestView(APIView):
         summary="Send a friend request",
         description="Sends a friend request to another user. Cannot request self or duplicates."
     )
+    @idempotent
     def post(self, request):
         serializer = FriendRequestSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             receiver_id = serializer.validated_data['receiver_id']
             receiver = User.objects.get(id=receiver_id)
-            Friendship.objects.create(sender=request.user, receiver=receiver, status='pending')
+            with transaction.atomic():
+                Friendship.objects.create(sender=request.user, receiver=receiver, status='pending')
             return Response({'message': 'Friend request sent.'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -114,23 +141,21 @@ class RespondToFriendRequestView(APIView):
         description="Accept or Decline a pending friend request."
     )
     def patch(self, request, pk):
-        try:
-            friend_request = Friendship.objects.get(pk=pk, receiver=request.user, status='pending')
-        except Friendship.DoesNotExist:
-            return Response({'error': 'Friend request not found.'}, status=status.HTTP_404_NOT_FOUND)
-
         serializer = FriendshipActionSerializer(data=request.data)
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Locked so that two answers to one request can't both count (api/badges.py).
+        with transaction.atomic():
+            friend_request = Friendship.objects.select_for_update().filter(
+                pk=pk, receiver=request.user, status='pending'
+            ).first()
+            if friend_request is None:
+                return Response({'error': 'Friend request not found.'}, status=status.HTTP_404_NOT_FOUND)
             action = serializer.validated_data['action']
-            if action == 'accept':
-                friend_request.status = 'accepted'
-                friend_request.save()
-                return Response({'message': 'Friend request accepted.'}, status=status.HTTP_200_OK)
-            elif action == 'decline':
-                friend_request.status = 'declined'
-                friend_request.save()
-                return Response({'message': 'Friend request declined.'}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            friend_request.status = 'accepted' if action == 'accept' else 'declined'
+            friend_request.save()
+        return Response({'message': f'Friend request {friend_request.status}.'}, status=status.HTTP_200_OK)
 
 class SetVIPStatusView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
@@ -173,14 +198,40 @@ class SendPingView(APIView):
         summary="Send an Emergency Ping",
         description="Send a ping (emergency, battery, etc.) to a friend. Requires friendship, VIP status (for emergency), and checks daily limits."
     )
+    @idempotent
     def post(self, request):
         serializer = PingSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
-            # TODO: Here we will later trigger Firebase Cloud Messaging (FCM)
+            ping = serializer.save()
+            notify_ping(ping)
             return Response({'message': 'Ping sent successfully.'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BroadcastPingView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        request=BroadcastPingSerializer,
+        responses={201: None},
+        summary="Broadcast a Ping",
+        description=(
+            "Send the same ping to a list of friends (`receivers`), or without a list to every friend it may reach "
+            "(for emergency and battery pings, the friends who made you a VIP). The usual friendship, VIP and daily "
+            "limit rules apply per recipient; the response lists what happened for each one."
+        )
+    )
+    @idempotent
+    def post(self, request):
+        serializer = BroadcastPingSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            pings = serializer.save()
+            notify_pings(pings)
+            return Response(
+                {'sent': len(pings), 'results': serializer.results},
+                status=status.HTTP_201_CREATED if pings else status.HTTP_400_BAD_REQUEST
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 class MarkPingDeliveredView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -196,16 +247,21 @@ class MarkPingDeliveredView(APIView):
         if ping.receiver != request.user:
             return Response({'error': 'Not authorized.'}, status=status.HTTP_403_FORBIDDEN)
         
-        ping.status = 'delivered'
-        ping.delivered_at = timezone.now()
-        ping.save()
+        # The first delivery counts: delivered_at, the rollups and the badges keep it.
+        if ping.delivered_at is None:
+            ping.mark_delivered()
         
         return Response({'message': 'Ping marked as delivered.'}, status=status.HTTP_200_OK)
 
-class FriendListView(generics.ListAPIView):
+class FriendListView(ConditionalGetMixin, ReplicaReadMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
+    etag_resource = etags.FRIENDS
     serializer_class = FriendListSerializer
 
+    def get_etag(self, request):
+        # Presence changes without a write; let cached lists age out with it.
+        return '"%s-%s"' % (etags.get_version(self.etag_resource, request.user.id), presence.online_bucket())
+
     @extend_schema(
         summary="List Accepted Friends",
         description="Returns a list of all accepted friends, including their status, VIP status (outgoing), and online info."
@@ -219,20 +275,52 @@ class FriendListView(generics.ListAPIView):
         friendships = Friendship.objects.filter(
             (Q(sender=user) | Q(receiver=user)) & 
             Q(status='accepted')
-        )
+        ).select_related('sender__profile', 'receiver__profile')
         
         # Extract the 'other' user from each friendship
         friends = []
         for f in friendships:
-            if f.sender == user:
+            if f.sender_id == user.id:
                 friends.append(f.receiver)
             else:
                 friends.append(f.sender)
         
-        return friends
+        return presence.annotate_last_seen(friends)
+
+class NearbyFriendsView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
 
-class FriendRequestsListView(generics.ListAPIView):
+    @extend_schema(
+        parameters=[NearbyFriendsSerializer],
+        responses={200: None},
+        summary="Nearby Friends",
+        description=(
+            "Accepted friends near where the current user sent emergency ping `pk` (in the last "
+            "PROXIMITY_LOCATION_MAX_AGE_MINUTES), judged by the last location each friend sent them in that "
+            "time, nearest first. radius_m and the distances are rounded up to PROXIMITY_DISTANCE_STEP_M; "
+            "the friends' coordinates are never returned."
+        )
+    )
+    def get(self, request, pk):
+        serializer = NearbyFriendsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since = timezone.now() - timedelta(minutes=settings.PROXIMITY_LOCATION_MAX_AGE_MINUTES)
+        # Read from the primary: in an emergency a replica's lag matters.
+        ping = Ping.objects.filter(
+            pk=pk, sender=request.user, ping_type='emergency', geohash__isnull=False, created_at__gte=since,
+        ).first()
+        if ping is None:
+            return Response({'error': 'Emergency ping not found.'}, status=status.HTTP_404_NOT_FOUND)
+        nearby = geo.friends_near(request.user.id, ping.latitude, ping.longitude, serializer.validated_data['radius_m'])
+        usernames = dict(User.objects.filter(pk__in=[friend_id for friend_id, _, _ in nearby]).values_list('id', 'username'))
+        return Response([
+            {'id': friend_id, 'username': usernames.get(friend_id), 'within_m': geo.round_up(distance), 'located_at': located_at}
+            for friend_id, distance, located_at in nearby
+        ])
+
+class FriendRequestsListView(ConditionalGetMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
+    etag_resource = etags.FRIEND_REQUESTS
     serializer_class = FriendRequestListSerializer
 
     @extend_schema(
@@ -266,7 +354,8 @@ class UnfriendView(APIView):
         ).exclude(status='blocked').first()
 
         if friendship:
-            friendship.delete()
+            with transaction.atomic():
+                friendship.delete()
             return Response({'message': 'Friendship removed.'}, status=status.HTTP_200_OK)
         return Response({'error': 'Friendship not found.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -298,13 +387,14 @@ class BlockUserView(APIView):
             except User.DoesNotExist:
                 return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            friendship.status = 'blocked'
-            friendship.blocked_by = user
-            friendship.save()
+            with transaction.atomic():
+                friendship.status = 'blocked'
+                friendship.blocked_by = user
+                friendship.save()
             
         return Response({'message': 'User blocked.'}, status=status.HTTP_200_OK)
 
-class UserSearchView(generics.ListAPIView):
+class UserSearchView(ReplicaReadMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserSearchSerializer
 
@@ -320,13 +410,18 @@ class UserSearchView(generics.ListAPIView):
         if not query:
             return User.objects.none()
         
-        return User.objects.filter(
+        # Blocks are dropped in memory; fetch enough extra rows to still fill the page.
+        blocked = blocks.blocked_ids(self.request.user.id)
+        users = User.objects.filter(
             Q(username__icontains=query) | 
-            Q(profile__nickname__icontains=query)
-        ).exclude(id=self.request.user.id)[:20] # Limit results
+            Q(profile__nickname__icontains=query),
+            is_active=True
+        ).exclude(id=self.request.user.id)[:USER_SEARCH_LIMIT + len(blocked)]
+        return [user for user in users if user.id not in blocked][:USER_SEARCH_LIMIT]
 
-class UserProfileView(generics.RetrieveAPIView):
+class UserProfileView(ConditionalGetMixin, generics.RetrieveAPIView):
     permission_classes = (permissions.IsAuthenticated,)
+    etag_resource = etags.PROFILE
     serializer_class = UserProfileSerializer
 
     @extend_schema(
@@ -339,36 +434,77 @@ class UserProfileView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user.profile
 
+class BadgeCountersView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        responses={200: None},
+        summary="Badge Counters",
+        description=(
+            "Pending friend requests received, received pings not yet delivered and received "
+            "emergency pings not yet answered with a handshake."
+        )
+    )
+    def get(self, request):
+        return Response(badges.get(request.user.id))
+
 class DeleteAccountView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     @extend_schema(
         responses={200: None},
         summary="Delete Account",
-        description="Permanently delete the current user's account."
+        description="Deactivates the current user's account right away and permanently deletes it and its history in the background."
     )
     def delete(self, request):
         user = request.user
-        user.delete()
-        return Response({'message': 'Account deleted.'}, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            user.device_tokens.all().delete()
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            tokens.revoke_user(user.id)
+            job = AccountDeletion.objects.create(user_id=user.id)
+            account_deletion.schedule(job)
+        return Response({'message': 'Account deleted.'}, status=status.HTTP_202_ACCEPTED)
 
 class LogoutView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     @extend_schema(
+        request=LogoutSerializer,
         responses={200: None},
         summary="Logout",
-        description="Logs out the user and clears their FCM token."
+        description=(
+            "Logs out the calling device: revokes its access token and the given refresh token, and unregisters "
+            "its FCM token. The user's other devices stay logged in unless everywhere is true."
+        )
     )
     def post(self, request):
-        # Clear FCM token
-        if hasattr(request.user, 'profile'):
-            request.user.profile.fcm_token = None
-            request.user.profile.save()
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if data['everywhere']:
+            tokens.revoke_user(request.user.id)
+            request.user.device_tokens.all().delete()
+            return Response({'message': 'Logged out successfully.'}, status=status.HTTP_200_OK)
+
+        tokens.revoke(request.auth)
+        if data.get('refresh'):
+            try:
+                refresh = RefreshToken(data['refresh'])
+            except TokenError:
+                pass  # Expired or malformed: nothing left to revoke.
+            else:
+                if refresh[api_settings.USER_ID_CLAIM] == request.auth[api_settings.USER_ID_CLAIM]:
+                    tokens.revoke(refresh)
+        token = data.get('fcm_token')
+        if token:
+            DeviceToken.objects.filter(user=request.user, token=token).delete()
         return Response({'message': 'Logged out successfully.'}, status=status.HTTP_200_OK)
 
-class PingHistoryView(generics.ListAPIView):
+class PingHistoryView(ConditionalGetMixin, ReplicaReadMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
+    etag_resource = etags.PING_HISTORY
     serializer_class = PingHistorySerializer
 
     @extend_schema(
@@ -384,41 +520,181 @@ class PingHistoryView(generics.ListAPIView):
             Q(sender=user) | Q(receiver=user)
         ).order_by('-created_at')[:50] # Limit to last 50
 
-class UserLimitsView(APIView):
+class HeartbeatView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        request=None,
+        responses={204: None},
+        summary="Presence Heartbeat",
+        description="Keeps the user shown as online to friends while the app is open without other API traffic."
+    )
+    def post(self, request):
+        # Presence is recorded by the authentication class.
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class SyncView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     @extend_schema(
         responses={200: None},
-        summary="Daily Limits",
-        description="Check how many emergency pings have been sent today."
+        summary="Sync Changes",
+        description=(
+            "Returns the friendships, pings, profiles and check-ins changed since `token`, tombstones for deleted ones, "
+            "and a new token. Without a token, or with one older than SYNC_RETENTION_DAYS, returns a full snapshot "
+            "with `reset` set. Call again while `has_more`."
+        )
     )
     def get(self, request):
-        user = request.user
-        today = timezone.now().date()
-        
-        # Count emergency pings sent today by user
-        # Note: This is an approximation. Ideally we check per-friend limit.
-        # But for "User Limits" endpoint, maybe we show global usage or just general info.
-        # The prompt says: "how many emergency ping left for today (e.g. 3/1)".
-        # Wait, the limit is PER FRIEND. 
-        # So "User Limits" is a bit ambiguous if it aggregates everything.
-        # But let's return the count for the most frequent friend or just total count?
-        # Re-reading spec: "how many emergency ping left (e.g. 3/1)". 
-        # This implies a global limit OR it assumes context.
-        # Let's assume the spec meant "Global Limit" OR it meant "Show limits for all friends".
-        # Simplest interpretation: Return total pings sent today.
-        
-        pings_sent = Ping.objects.filter(
-            sender=user, 
-            ping_type='emergency', 
-            created_at__date=today
-        ).count()
-        
+        token = request.query_params.get('token')
+        if not token:
+            return Response(sync.snapshot(request))
+        try:
+            since = sync.decode_token(token)
+        except sync.InvalidToken:
+            return Response({'error': 'Invalid sync token.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(sync.changes_since(request, since))
+
+class PushQueueView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        responses={200: None},
+        summary="Push Queue Depth",
+        description="Staff only. Ready, delayed (awaiting retry) and in-flight pushes per lane in this worker process, and the number of dead-lettered pushes."
+    )
+    def get(self, request):
+        return Response({'lanes': push_queue.depth(), 'dead_letters': PushDeadLetter.objects.count()})
+
+class PingAnalyticsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        parameters=[AnalyticsRangeSerializer],
+        responses={200: None},
+        summary="Ping Analytics",
+        description=(
+            "Staff only. Per day and ping type: pings sent, delivery and handshake response rates, and median and "
+            "mean delivery latency, from the rollup tables (no scan of pings). Days run from since to until, inclusive."
+        )
+    )
+    def get(self, request):
+        serializer = AnalyticsRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since, until = serializer.validated_data['since'], serializer.validated_data['until']
+        return Response({'since': since, 'until': until, 'days': rollups.type_report(since, until)})
+
+class UserPingAnalyticsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        parameters=[AnalyticsRangeSerializer],
+        responses={200: None},
+        summary="User Ping Analytics",
+        description="Staff only. Pings a user sent and received per day, and how many of the received ones were delivered and answered."
+    )
+    def get(self, request, user_id):
+        serializer = AnalyticsRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since, until = serializer.validated_data['since'], serializer.validated_data['until']
         return Response({
-            'daily_emergency_pings_sent': pings_sent,
-            'limit_per_friend': 3
+            'user_id': user_id, 'since': since, 'until': until, 'days': rollups.user_report(user_id, since, until),
         })
 
+class ProfileListView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        responses={200: None},
+        summary="Request Profiles",
+        description=(
+            "Staff only. The request profiles stored by this host, newest first: path, status, total and SQL time. "
+            "A request is profiled when staff send it with `X-Profile: 1` or when it is sampled."
+        )
+    )
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+class ProfileDetailView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        responses={200: None, 404: None},
+        summary="Request Profile",
+        description="Staff only. One stored profile: its timings, every SQL statement with its duration, and the top functions by cumulative time."
+    )
+    def get(self, request, profile_id):
+        path = profiling.path_of(profile_id, '.json')
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'), content_type='application/json')
+
+class ProfileDownloadView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    @extend_schema(
+        responses={200: None, 404: None},
+        summary="Download Request Profile",
+        description="Staff only. The raw cProfile stats of a stored profile, for pstats or snakeviz."
+    )
+    def get(self, request, profile_id):
+        path = profiling.path_of(profile_id, '.prof')
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
+
+class UserLimitsView(ConditionalGetMixin, APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    etag_resource = etags.LIMITS
+
+    @extend_schema(
+        responses={200: None},
+        summary="Daily Limits",
+        description="Emergency pings sent today and remaining per accepted friend (the limit is per friend)."
+    )
+    def get(self, request):
+        return super().get(request)
+
+    def get_fresh_response(self, request):
+        user = request.user
+        etag = self.get_etag(request)
+        # The ETag changes with every ping this user sends, every friendship
+        # change and at midnight, so it doubles as the key of the cached body.
+        cache_key = f'limits:{user.id}:{etag}'
+        data = cache.get(cache_key)
+        if data is None:
+            friend_ids = [
+                receiver_id if sender_id == user.id else sender_id
+                for sender_id, receiver_id in Friendship.objects.filter(
+                    (Q(sender=user) | Q(receiver=user)) & Q(status='accepted')
+                ).values_list('sender_id', 'receiver_id')
+            ]
+            # One GROUP BY over today's range, whatever the number of friends
+            sent = dict(
+                emergency_pings_today(user.id)
+                .values_list('receiver_id')
+                .annotate(count=Count('id'))
+                .order_by()
+            )
+            data = {
+                'daily_emergency_pings_sent': sum(sent.values()),
+                'limit_per_friend': EMERGENCY_DAILY_LIMIT,
+                'friends': [
+                    {
+                        'friend_id': friend_id,
+                        'sent_today': sent.get(friend_id, 0),
+                        'remaining': max(EMERGENCY_DAILY_LIMIT - sent.get(friend_id, 0), 0),
+                    }
+                    for friend_id in friend_ids
+                ],
+            }
+            _, end = today_range()
+            cache.set(cache_key, data, timeout=(end - timezone.now()).total_seconds())
+        return Response(data)
+
+    def get_etag(self, request):
+        return '"%s-%s"' % (etags.get_version(self.etag_resource, request.user.id), today_range()[0].date())
+
 class HandshakeView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -428,6 +704,7 @@ class HandshakeView(APIView):
         summary="Send Handshake Response",
         description="Respond to an emergency ping with a predefined message (e.g., 'On my way')."
     )
+    @idempotent
     def post(self, request, pk):
         ping = get_object_or_404(Ping, pk=pk)
         
@@ -437,9 +714,7 @@ class HandshakeView(APIView):
             
         serializer = HandshakeSerializer(data=request.data)
         if serializer.is_valid():
-            ping.response_message = serializer.validated_data['message']
-            ping.response_at = timezone.now()
-            ping.save()
+            ping.respond(serializer.validated_data['message'])
             return Response({'message': 'Handshake sent.'}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -478,6 +753,7 @@ class CheckInStartView(APIView):
         summary="Start Check-In Timer",
         description="Start a 'Dead Man's Switch' timer. If not marked safe before expiration, an alert will be triggered (future impl)."
     )
+    @idempotent
     def post(self, request):
         serializer = CheckInSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -485,6 +761,59 @@ class CheckInStartView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class TrailAppendView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        request=TrailAppendSerializer,
+        responses={200: None, 409: None},
+        summary="Append Location Fixes",
+        description=(
+            "Adds location fixes, oldest first, to the sender's live trail while they have an emergency ping from the "
+            "last TRAIL_EMERGENCY_MINUTES or a check-in running (409 otherwise). Send an Idempotency-Key so a retried "
+            "batch is not stored twice."
+        )
+    )
+    @idempotent
+    def post(self, request):
+        serializer = TrailAppendSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not trails.in_emergency(request.user.id):
+            return Response({'error': 'No emergency or check-in is active.'}, status=status.HTTP_409_CONFLICT)
+        trail = trails.append(request.user.id, serializer.validated_data['points'])
+        return Response({'trail': trail.id, 'count': trail.point_count})
+
+class TrailView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        parameters=[TrailSinceSerializer],
+        responses={200: None, 404: None},
+        summary="Follow Location Trail",
+        description=(
+            "The user's latest live trail from point `since` on, up to TRAIL_READ_MAX_POINTS at a time; poll again "
+            "with `since` set to `next`. When `trail` changes, a new trail has started: restart from 0. Readable by "
+            "its owner and by friends who received an emergency ping from them during it, unless either has "
+            "blocked the other."
+        )
+    )
+    def get(self, request, user_id):
+        serializer = TrailSinceSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        trail = trails.latest_readable(user_id, request.user.id)
+        if trail is None:
+            return Response({'error': 'No trail.'}, status=status.HTTP_404_NOT_FOUND)
+        since = serializer.validated_data['since']
+        points = trails.points_since(trail, since)
+        return Response({
+            'trail': trail.id,
+            'started_at': trail.started_at,
+            'updated_at': trail.updated_at,
+            'count': trail.point_count,
+            'next': since + len(points),
+            'points': TrailPointSerializer(points, many=True).data,
+        })
+
 class CheckInSafeView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -495,10 +824,11 @@ class CheckInSafeView(APIView):
     )
     def post(self, request):
         # Mark all active sessions as safe
-        CheckInSession.objects.filter(
-            user=request.user, 
-            status='active'
-        ).update(status='safe')
+        sessions = CheckInSession.objects.filter(user=request.user, status='active')
+        with transaction.atomic():
+            ids = list(sessions.select_for_update().values_list('id', flat=True))
+            CheckInSession.objects.filter(id__in=ids).update(status='safe')
+            ChangeLog.record_many(ChangeLog.CHECKIN, ids, request.user.id)
         return Response({'message': 'You are marked safe.'}, status=status.HTTP_200_OK)
 
 
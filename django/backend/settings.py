@@ -49,12 +49,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'api.middleware.ThrottleMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +93,56 @@ DATABASES = {
     )
 }
 
+# Optional read replica. Heavy read endpoints are sent to it by
+# api.routers.PrimaryReplicaRouter; a user who has just written keeps
+# reading from the primary for REPLICA_PIN_SECONDS.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['DATABASE_REPLICA_URL'],
+        conn_max_age=600,
+        test_options={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Connection pooling (psycopg 3 pool, PostgreSQL only). Enabled by setting
+# DB_POOL_MAX_SIZE; persistent connections must be off when pooling.
+if os.environ.get('DB_POOL_MAX_SIZE'):
+    for db in DATABASES.values():
+        if db['ENGINE'] == 'django.db.backends.postgresql':
+            db['CONN_MAX_AGE'] = 0
+            db.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            }
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Holds the per-user ETag versions, token revocations and throttle counters,
+# so it must be shared between workers in production (set REDIS_URL). The
+# local-memory fallback is per process. With Redis, use a volatile-* eviction
+# policy (or none): the token generation counters never expire and must not
+# be evicted.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # The default of 300 would cull revoked tokens back to life.
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -109,6 +163,20 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (api.hashers). PBKDF2 cost is the bulk of a login's CPU
+# time; set PASSWORD_PBKDF2_ITERATIONS to trade it against brute-force
+# resistance. Stored hashes are upgraded or downgraded on their next login.
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0)) or None
+
+PASSWORD_HASHERS = [
+    'api.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -126,25 +194,153 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Route the ping send/ack/handshake/history endpoints to the native async
+# views in api/async_views.py. Only worth enabling when served by ASGI.
+ASYNC_PING_VIEWS = os.environ.get('ASYNC_PING_VIEWS', '').lower() in ('1', 'true')
+
+# Push notifications (api/push.py)
+PUSH_BACKEND = os.environ.get('PUSH_BACKEND', 'api.push.LoggingPushBackend')
+PUSH_TIMEOUT = 5
+# Tokens per send_many() call (FCM's multicast limit) and concurrent
+# requests per call for backends that send one message per token.
+PUSH_MULTICAST_LIMIT = 500
+PUSH_CONCURRENCY = 16
+# Push lanes (api/push_queue.py): worker threads per lane, the lane of each
+# ping type (anything else goes to 'low'), and retries with backoff.
+PUSH_LANE_WORKERS = {'high': 4, 'low': 2}
+PUSH_LANES = {'emergency': 'high'}
+PUSH_MAX_ATTEMPTS = 5
+PUSH_RETRY_BASE_SECONDS = 1
+PUSH_RETRY_MAX_SECONDS = 60
+FCM_ENDPOINT = os.environ.get(
+    'FCM_ENDPOINT',
+    f"https://fcm.googleapis.com/v1/projects/{os.environ.get('FCM_PROJECT_ID', '')}/messages:send",
+)
+FCM_ACCESS_TOKEN = os.environ.get('FCM_ACCESS_TOKEN', '')
+
+# Presence (api/presence.py): how often a user's last-seen timestamp is
+# recorded, how often the buffer is flushed to the DB, and how recent it
+# must be for a friend to show as online.
+PRESENCE_RESOLUTION_SECONDS = 15
+PRESENCE_FLUSH_SECONDS = int(os.environ.get('PRESENCE_FLUSH_SECONDS', 30))
+PRESENCE_ONLINE_SECONDS = 120
+PRESENCE_CACHE_SECONDS = 60 * 60 * 24
+
+# Idempotency-Key handling (api/idempotency.py): how long successful responses are kept
+# for replay, how long a claimed key may stay in progress, and how long a
+# concurrent duplicate waits for the first request to finish.
+IDEMPOTENCY_TTL_SECONDS = 60 * 60 * 24
+IDEMPOTENCY_LOCK_SECONDS = 30
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+# Maximum number of sub-requests in one /api/batch/ call (api/batch.py)
+BATCH_MAX_REQUESTS = 10
+
+# Sync feed (api/sync.py): log entries per response, how old an entry must
+# be before a token may move past it, and how long entries are kept
+# (`manage.py prune_change_log`); older tokens get a fresh snapshot.
+SYNC_PAGE_SIZE = 500
+SYNC_SETTLE_SECONDS = 5
+SYNC_RETENTION_DAYS = int(os.environ.get('SYNC_RETENTION_DAYS', 30))
+
+# Rows deleted per transaction by background account deletion (api/account_deletion.py)
+ACCOUNT_DELETION_BATCH_SIZE = 1000
+
+# Recipients accepted by one /api/pings/broadcast/ call
+BROADCAST_MAX_RECIPIENTS = 500
+
+# Group-commit ping ingestion (api/ingest.py): off by default. A batch is
+# written when it reaches PING_INGEST_BATCH_SIZE pings or its first ping has
+# waited PING_INGEST_MAX_DELAY_MS; a ping still queued after PING_INGEST_TIMEOUT
+# is dropped and its request answers 503.
+PING_INGEST_BUFFER = os.environ.get('PING_INGEST_BUFFER', '').lower() in ('1', 'true')
+PING_INGEST_BATCH_SIZE = 500
+PING_INGEST_MAX_DELAY_MS = int(os.environ.get('PING_INGEST_MAX_DELAY_MS', 5))
+PING_INGEST_TIMEOUT = 10
+
+# Nearby friends (api.geo): how old the emergency ping a query starts from
+# and a friend's last location may be, the largest radius a query may ask
+# for, and the step that radii and distances are rounded up to.
+PROXIMITY_LOCATION_MAX_AGE_MINUTES = 60
+PROXIMITY_MAX_RADIUS_M = 50_000
+PROXIMITY_DISTANCE_STEP_M = 500
+
+# Live location trails (api/trails.py): how recent an emergency ping must be
+# for its sender to stream a trail, how long a trail may go without fixes
+# before the next one starts a new trail, and the sizes of chunks, appends
+# and reads (in points).
+TRAIL_EMERGENCY_MINUTES = 60
+TRAIL_IDLE_MINUTES = 15
+TRAIL_CHUNK_POINTS = 256
+TRAIL_MAX_APPEND_POINTS = 500
+TRAIL_READ_MAX_POINTS = 2000
+
+# Blocked sets (api/blocks.py): the longest a cached set may outlive a change
+# it missed; changes normally invalidate it on commit.
+BLOCKS_CACHE_SECONDS = 60 * 10
+
+# Per-route rate limits (api.throttling), keyed by the url names in
+# api/urls.py; 'default' covers every other route. Each limit applies per
+# user for requests with an access token and per client IP otherwise.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', 'true').lower() in ('1', 'true')
+THROTTLE_RATES = {
+    'default': '300/min',
+    'register': '10/min',
+    'login': '30/min',
+    'token_refresh': '60/min',
+    'user_search': '30/min',
+    'nearby_friends': '30/min',
+    'append_trail': '60/min',
+    'location_trail': '120/min',
+    'send_friend_request': '20/min',
+    'ping_history': '60/min',
+    'send_ping': '60/min',
+    'broadcast_ping': '10/min',
+    'batch': '120/min',
+}
+
+# Ping analytics (api.rollups): days reported by default and at most.
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+# Per-request profiling (api.profiling): the share of requests profiled
+# without being asked (staff can always ask with `X-Profile: 1`), where
+# profiles are written, and how many are kept there.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = Path(os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles'))
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 200))
+
+# Response compression (api.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = 5
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.PresenceJWTAuthentication',
     ),
 }
 
+# Written at build time by `manage.py build_openapi_schema`, served by api.schema.
+OPENAPI_SCHEMA_PATH = Path(os.environ.get('OPENAPI_SCHEMA_PATH', BASE_DIR / 'static' / 'openapi.yaml'))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Django Backend API',
     'DESCRIPTION': 'API documentation for the Django Backend project',
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
     'COMPONENT_SPLIT_REQUEST': True,
+    'PREPROCESSING_HOOKS': ['api.schema.apply_deferred_schemas'],
 }
 
 from datetime import timedelta
+# Refresh tokens are rotated on every use and revoked through the cache
+# (api.tokens), so CACHES must be shared between workers in production.
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.RotatingTokenRefreshSerializer',
 }
 
 # CORS Settings for Flutter development
@@ -169,6 +365,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -16,16 +16,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from api.schema import schema_view, swagger_view, redoc_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # API endpoints
     path('api/', include('api.urls')),
-    # OpenAPI Schema
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    # OpenAPI Schema (prebuilt by `manage.py build_openapi_schema`)
+    path('api/schema/', schema_view, name='schema'),
     # Swagger UI
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('api/docs/', swagger_view, name='swagger-ui'),
     # Redoc UI
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/redoc/', redoc_view, name='redoc'),
 ]
@@ -0,0 +1,45 @@
+"""
+Shared bootstrap for the benchmark scripts in this package.
+
+Each script runs against a throwaway SQLite database so it never touches the
+DATABASE_URL configured in backend/.env unless one is passed explicitly. Run them from the `django/` folder:
+
+    python -m benchmarks.<name>
+"""
+import os
+import tempfile
+
+
+def setup(database_url=None, **env):
+    if database_url is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='ping-bench-'), 'bench.sqlite3')
+        database_url = f'sqlite:///{db_path}'
+    os.environ['DATABASE_URL'] = database_url
+    # The benchmarks hammer single endpoints from one client on purpose.
+    os.environ.setdefault('THROTTLE_ENABLED', 'false')
+    os.environ.update(env)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+    import django
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    django.setup()
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+
+
+def make_users(count, prefix='user'):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    return [
+        User.objects.create_user(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password='bench-pass')
+        for i in range(count)
+    ]
+
+
+def auth_header(user):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
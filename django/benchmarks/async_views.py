@@ -0,0 +1,114 @@
+"""
+Sync (DRF) vs native async ping views under uvicorn.
+
+Starts `uvicorn backend.asgi:application` twice against the same database,
+once with ASYNC_PING_VIEWS off and once on, and drives both with the same
+concurrent mix of ping sends, delivery acks and history reads. Requires
+the uvicorn and httpx packages.
+
+    python -m benchmarks.async_views --requests 2000 --concurrency 64
+
+SQLite serialises writers, so for numbers that mean anything pass a
+Postgres --database-url.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from ._django import setup, make_users, auth_header
+
+PORT = 8765
+
+
+def prepare(pairs):
+    from api.models import Friendship
+
+    users = make_users(pairs * 2)
+    clients = []
+    for sender, receiver in zip(users[::2], users[1::2]):
+        Friendship.objects.create(sender=sender, receiver=receiver, status='accepted', receiver_is_vip=True)
+        clients.append((auth_header(sender)['HTTP_AUTHORIZATION'], receiver.id, auth_header(receiver)['HTTP_AUTHORIZATION']))
+    return clients
+
+
+async def drive(clients, total, concurrency):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(http):
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            sender_auth, receiver_id, receiver_auth = clients[i % len(clients)]
+            started = time.perf_counter()
+            if i % 3 == 0:
+                response = await http.get('/api/pings/history/', headers={'Authorization': receiver_auth})
+            else:
+                response = await http.post(
+                    '/api/pings/send/',
+                    json={'receiver': receiver_id, 'ping_type': 'status', 'message': 'On my way'},
+                    headers={'Authorization': sender_auth},
+                )
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=30) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def run_server(async_views):
+    env = {**os.environ, 'ASYNC_PING_VIEWS': '1' if async_views else '0'}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--port', str(PORT), '--log-level', 'warning'],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f'http://127.0.0.1:{PORT}/api/pings/history/')
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    setup(args.database_url)
+    clients = prepare(args.pairs)
+
+    print(f"{'views':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for async_views in (False, True):
+        server = run_server(async_views)
+        try:
+            latencies, errors, elapsed = asyncio.run(drive(clients, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        q = statistics.quantiles(latencies, n=100)
+        print(
+            f"{'async' if async_views else 'sync':<8}{len(latencies) / elapsed:>9.0f}"
+            f'{q[49] * 1000:>9.1f}{q[94] * 1000:>9.1f}{q[98] * 1000:>9.1f}{errors:>8}'
+        )
+
+
+if __name__ == '__main__':
+    main()
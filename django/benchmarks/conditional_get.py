@@ -0,0 +1,48 @@
+"""
+Queries and bytes saved by a no-change poll of the list endpoints.
+
+For every endpoint the mobile app re-polls this prints the cost of a cold
+fetch, the same fetch compressed, and a revalidation with If-None-Match.
+"""
+from ._django import setup, make_users, auth_header
+
+setup()
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Friendship, Ping
+
+ENDPOINTS = ['/api/friends/', '/api/friends/requests/', '/api/pings/history/', '/api/user/profile/']
+
+
+def measure(client, path, headers):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path, **headers)
+    return response, len(queries), len(response.content)
+
+
+def main():
+    me, *others = make_users(61)
+    for friend in others[:50]:
+        Friendship.objects.create(sender=me, receiver=friend, status='accepted')
+    for stranger in others[50:]:
+        Friendship.objects.create(sender=stranger, receiver=me, status='pending')
+    for i in range(50):
+        Ping.objects.create(sender=others[i % 50], receiver=me, ping_type='emergency', message='Help ' * 10)
+
+    client = Client()
+    headers = auth_header(me)
+    print(f"{'endpoint':<26}{'full q':>8}{'full B':>9}{'gzip B':>9}{'304 q':>8}{'304 B':>8}")
+    for path in ENDPOINTS:
+        response, full_queries, full_bytes = measure(client, path, headers)
+        _, _, compressed_bytes = measure(client, path, {**headers, 'HTTP_ACCEPT_ENCODING': 'gzip, br'})
+        etag = response['ETag']
+        cached, cached_queries, cached_bytes = measure(client, path, {**headers, 'HTTP_IF_NONE_MATCH': etag})
+        assert cached.status_code == 304, cached.status_code
+        print(f'{path:<26}{full_queries:>8}{full_bytes:>9}{compressed_bytes:>9}{cached_queries:>8}{cached_bytes:>8}')
+
+
+if __name__ == '__main__':
+    main()
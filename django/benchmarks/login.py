@@ -0,0 +1,98 @@
+"""
+Login cost: the email lookup and the password hash.
+
+First times the user lookup alone, as login used to do it (unindexed
+`email=` scan, then a second query for the profile) and as it does now (the
+case-insensitive unique index, profile joined in). Then drives the login
+endpoint with hashes stored at each PBKDF2 iteration count to show how
+PASSWORD_PBKDF2_ITERATIONS moves throughput.
+
+    python -m benchmarks.login --users 20000 --iterations 1000000 600000 260000
+"""
+import argparse
+import time
+
+from ._django import setup
+
+
+def populate(count):
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from api.models import UserProfile
+
+    User = get_user_model()
+    password = make_password('bench-pass')
+    User.objects.bulk_create(
+        [User(username=f'user{i}', email=f'User{i}@example.com', password=password) for i in range(count)],
+        batch_size=1000,
+    )
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=pk) for pk in User.objects.values_list('pk', flat=True)], batch_size=1000
+    )
+
+
+def time_lookups(lookup, emails):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for email in emails:
+            lookup(email)
+        elapsed = time.perf_counter() - started
+    return elapsed / len(emails), len(queries) / len(emails)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--iterations', type=int, nargs='+', default=[1000000, 600000, 260000])
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import get_hasher
+    from django.test import Client
+    from api.serializers import users_by_email
+
+    User = get_user_model()
+    populate(args.users)
+    step = max(1, args.users // args.lookups)
+    emails = [f'user{i}@example.com' for i in range(0, args.users, step)]
+    exact = [f'User{i}@example.com' for i in range(0, args.users, step)]
+
+    def before(email):
+        user = User.objects.get(email=email)
+        return user.profile.status
+
+    def after(email):
+        user = users_by_email(email).select_related('profile').first()
+        return user.profile.status
+
+    print(f'{args.users} users')
+    print(f"{'lookup':<10}{'ms':>8}{'queries':>9}")
+    for label, lookup, addresses in (('before', before, exact), ('after', after, emails)):
+        seconds, queries = time_lookups(lookup, addresses)
+        print(f'{label:<10}{seconds * 1000:>8.2f}{queries:>9.1f}')
+
+    hasher = get_hasher()
+    client = Client()
+    print(f"{'iterations':>10}{'logins/s':>10}")
+    for iterations in args.iterations:
+        # What PASSWORD_PBKDF2_ITERATIONS sets; stored hashes then follow it.
+        hasher.iterations = iterations
+        User.objects.filter(username='user0').update(password=hasher.encode('bench-pass', hasher.salt()))
+        started = time.perf_counter()
+        for _ in range(args.logins):
+            response = client.post(
+                '/api/auth/login/', {'email': 'user0@example.com', 'password': 'bench-pass'},
+                content_type='application/json',
+            )
+            assert response.status_code == 200, response.content
+        print(f'{iterations:>10}{args.logins / (time.perf_counter() - started):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Ping write throughput: one INSERT and commit per ping vs group commit.
+
+Offers pings at a fixed rate (open loop) from a pool of request threads and
+reports the rate actually committed and the per-ping latency, once with
+`ping.save()` and once through the ingest buffer (api/ingest.py). Both paths
+do the same side work (sync log rows, ETag bumps). Validation and HTTP are
+left out so only the write path is measured.
+
+    python -m benchmarks.ping_ingest --rates 1000 5000 10000 --seconds 3
+
+SQLite allows one writer at a time; pass a Postgres --database-url for
+numbers that carry over to production.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ._django import setup, make_users
+
+
+def offer(write, pairs, rate, seconds, concurrency):
+    from django.db import close_old_connections
+    from api.models import Ping
+
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def request(i, due):
+        nonlocal errors
+        sender, receiver = pairs[i % len(pairs)]
+        try:
+            write(Ping(sender=sender, receiver=receiver, ping_type='status', message='On my way'))
+        except Exception:
+            with lock:
+                errors += 1
+        else:
+            with lock:
+                latencies.append(time.perf_counter() - due)
+        finally:
+            close_old_connections()
+
+    total = rate * seconds
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            due = started + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(request, i, due)
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 5000, 10000])
+    parser.add_argument('--seconds', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--pairs', type=int, default=100)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    setup(args.database_url)
+    from api import ingest
+
+    users = make_users(args.pairs * 2)
+    pairs = list(zip(users[::2], users[1::2]))
+
+    def single(ping):
+        ping.save()
+
+    print(f"{'offered/s':>10}  {'mode':<8}{'committed/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for rate in args.rates:
+        for mode, write in (('single', single), ('group', ingest.save)):
+            throughput, latencies, errors = offer(write, pairs, rate, args.seconds, args.concurrency)
+            q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+            print(f'{rate:>10}  {mode:<8}{throughput:>12.0f}{q[49] * 1000:>9.1f}{q[98] * 1000:>9.1f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Nearby-friends lookups over a million located pings.
+
+Spreads --points pings from --users senders to the first user over a region
+about the size of Germany, makes that user friends with --friends of the
+senders, then times:
+- the user's received pings within the radius of a point, found by a
+  latitude/longitude bounding box (what the columns allowed before) and by
+  the geohash ranges of api.geo.cover(), one index range scan each;
+- api.geo.friends_near(), the query behind /api/pings/<pk>/nearby/;
+- the haversine refinement over --refine points, vectorized and as a loop.
+
+    python -m benchmarks.proximity --points 1000000 --radius 5000
+"""
+import argparse
+import random
+import time
+
+from ._django import setup
+
+REGION = ((47.3, 55.0), (5.9, 15.0))
+
+
+def populate(users, friends, points):
+    from django.contrib.auth import get_user_model
+    from api.models import Friendship, Ping
+
+    User = get_user_model()
+    User.objects.bulk_create([User(username=f'user{i}', email=f'user{i}@example.com') for i in range(users)], batch_size=1000)
+    ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    Friendship.objects.bulk_create(
+        [Friendship(sender_id=ids[0], receiver_id=friend_id, status='accepted') for friend_id in ids[1:friends + 1]]
+    )
+    (lat_low, lat_high), (lon_low, lon_high) = REGION
+    for start in range(0, points, 10000):
+        Ping.objects.bulk_create([
+            Ping(
+                sender_id=random.choice(ids), receiver_id=ids[0], message='',
+                latitude=round(random.uniform(lat_low, lat_high), 6), longitude=round(random.uniform(lon_low, lon_high), 6),
+            )
+            for _ in range(min(10000, points - start))
+        ])
+    return ids[0]
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--friends', type=int, default=200)
+    parser.add_argument('--radius', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--refine', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup()
+    from api import geo
+    from api.models import Ping
+
+    random.seed(0)
+    started = time.perf_counter()
+    user_id = populate(args.users, args.friends, args.points)
+    print(f'{args.points} pings from {args.users} users, {args.friends} friends, seeded in {time.perf_counter() - started:.0f}s')
+
+    (lat_low, lat_high), (lon_low, lon_high) = REGION
+    centers = [(random.uniform(lat_low, lat_high), random.uniform(lon_low, lon_high)) for _ in range(args.queries)]
+    lat_margin = args.radius / geo.METERS_PER_DEGREE
+    lon_margin = lat_margin / 0.6  # cos(53 degrees)
+
+    received = Ping.objects.filter(receiver_id=user_id).order_by()
+
+    def bounding_box():
+        return [
+            received.filter(
+                latitude__range=(lat - lat_margin, lat + lat_margin), longitude__range=(lon - lon_margin, lon + lon_margin)
+            ).count()
+            for lat, lon in centers
+        ]
+
+    def geohash_cells():
+        counts = []
+        for lat, lon in centers:
+            first, *rest = [received.filter(geohash__range=cell).values('pk') for cell in geo.cover(lat, lon, args.radius)]
+            counts.append(first.union(*rest, all=True).count())
+        return counts
+
+    def nearby_friends():
+        return [len(geo.friends_near(user_id, lat, lon, args.radius)) for lat, lon in centers]
+
+    print(f"{'query':<16}{'ms':>10}{'rows':>10}")
+    for label, function in (('bounding box', bounding_box), ('geohash cells', geohash_cells), ('friends_near', nearby_friends)):
+        ms, rows = timed(function, 1)
+        print(f'{label:<16}{ms / len(centers):>10.2f}{sum(rows) / len(centers):>10.1f}')
+
+    lats = [random.uniform(lat_low, lat_high) for _ in range(args.refine)]
+    lons = [random.uniform(lon_low, lon_high) for _ in range(args.refine)]
+    print(f"{'haversine':<16}{'ms':>10}  ({args.refine} points)")
+    numpy, geo.numpy = geo.numpy, None
+    loop_ms, _ = timed(lambda: geo.haversine_m(52.52, 13.405, lats, lons), 3)
+    geo.numpy = numpy
+    print(f"{'loop':<16}{loop_ms:>10.2f}")
+    if numpy is None:
+        print(f"{'numpy':<16}{'(not installed)':>10}")
+    else:
+        vector_ms, _ = timed(lambda: geo.haversine_m(52.52, 13.405, lats, lons), 3)
+        print(f"{'numpy':<16}{vector_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
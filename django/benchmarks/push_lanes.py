@@ -0,0 +1,83 @@
+"""
+Emergency push latency while the low-priority lane is saturated.
+
+Floods the push scheduler with status pushes to many devices, then sends
+emergency pings one at a time and measures enqueue-to-provider latency
+against the local fake FCM server (api/fake_push.py). Runs once with the
+configured lanes and once with every ping type on one lane, for contrast.
+Requires the httpx package.
+
+    python -m benchmarks.push_lanes --flood-users 50 --devices 50 --emergencies 20
+"""
+import argparse
+import statistics
+import time
+
+from api.fake_push import FakePushServer
+
+from ._django import setup, make_users
+
+
+def prepare(flood_users, devices):
+    from api.models import DeviceToken
+
+    users = make_users(flood_users + 1)
+    receiver, flooded = users[0], users[1:]
+    DeviceToken.objects.bulk_create(
+        [DeviceToken(user=receiver, token='emergency-device')] +
+        [DeviceToken(user=user, token=f'device-{user.id}-{i}') for user in flooded for i in range(devices)]
+    )
+    return receiver, flooded
+
+
+def run(scheduler, server, receiver, flooded, emergencies):
+    for user in flooded:
+        scheduler.enqueue([user.id], {'type': 'status', 'user_id': user.id}, 'status')
+    backlog = scheduler.depth()
+
+    for i in range(emergencies):
+        scheduler.enqueue([receiver.id], {'type': 'ping', 'seq': i, 'sent_at': time.time()}, 'emergency')
+        time.sleep(0.05)
+
+    latencies = {}
+    while len(latencies) < emergencies:
+        time.sleep(0.05)
+        latencies = {
+            body['message']['data']['seq']: received - float(body['message']['data']['sent_at'])
+            for token, body, received in list(server.messages) if token == 'emergency-device'
+        }
+    while any(any(lane.values()) for lane in scheduler.depth().values()):
+        time.sleep(0.05)
+    server.messages.clear()
+    return list(latencies.values()), backlog
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flood-users', type=int, default=50)
+    parser.add_argument('--devices', type=int, default=50, help="Devices per flooded user.")
+    parser.add_argument('--emergencies', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.01, help="Fake provider latency per message, in seconds.")
+    args = parser.parse_args()
+
+    server = FakePushServer(latency=args.latency).start()
+    setup(PUSH_BACKEND='api.push.FCMPushBackend', FCM_ENDPOINT=server.endpoint)
+    from django.conf import settings
+    from api.push_queue import PushScheduler
+
+    receiver, flooded = prepare(args.flood_users, args.devices)
+    print(f'{args.flood_users * args.devices} status pushes queued ahead of {args.emergencies} emergency pings')
+    print(f"{'lanes':<12}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}  low-lane backlog")
+    for label, lanes in (('separate', settings.PUSH_LANES), ('shared', {})):
+        scheduler = PushScheduler(settings.PUSH_LANE_WORKERS, lanes)
+        latencies, backlog = run(scheduler, server, receiver, flooded, args.emergencies)
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{label:<12}{statistics.median(latencies) * 1000:>9.1f}{p95 * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}"
+            f"  {backlog['low']['ready']} jobs"
+        )
+
+
+if __name__ == '__main__':
+    main()
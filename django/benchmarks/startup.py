@@ -0,0 +1,63 @@
+"""
+Worker cold start: `django.setup()` plus the first authenticated request.
+
+Each run is a fresh interpreter, like a newly autoscaled worker. Prints the
+median over --runs and which docs-only modules ended up imported, so a
+regression that drags drf-spectacular back onto the request path shows up.
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from ._django import setup, make_users, auth_header
+
+CHILD = r'''
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+response = Client().get('/api/friends/', HTTP_AUTHORIZATION=os.environ['BENCH_AUTH'])
+assert response.status_code == 200, response.status_code
+finished = time.perf_counter()
+print(json.dumps({
+    'setup': setup_done - started,
+    'first_request': finished - setup_done,
+    'modules': len(sys.modules),
+    'docs_modules': sorted(m for m in ('drf_spectacular.openapi', 'drf_spectacular.views', 'yaml') if m in sys.modules),
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    user, = make_users(1)
+    env = {**os.environ, 'BENCH_AUTH': auth_header(user)['HTTP_AUTHORIZATION']}
+
+    runs = [
+        json.loads(subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, check=True, text=True).stdout)
+        for _ in range(args.runs)
+    ]
+    setup_ms = statistics.median(run['setup'] for run in runs) * 1000
+    first_ms = statistics.median(run['first_request'] for run in runs) * 1000
+    print(f'django.setup()   {setup_ms:8.1f} ms')
+    print(f'first request    {first_ms:8.1f} ms')
+    print(f'total            {setup_ms + first_ms:8.1f} ms')
+    print(f"modules loaded   {runs[0]['modules']:8d}")
+    print(f"docs modules     {', '.join(runs[0]['docs_modules']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Refresh throughput with single-use refresh tokens (api/tokens.py).
+
+Refreshes a chain of tokens per user through TokenRefreshView, once with
+SimpleJWT's stock serializer (one user query per refresh, nothing revoked)
+and once with the rotating serializer, which revokes every token it
+replaces. Also reports the cost of the revocation check each authenticated
+request now pays, and how many revocation entries are left once the
+refresh tokens have expired.
+
+    python -m benchmarks.token_refresh --users 50 --refreshes 2000
+"""
+import argparse
+import time
+
+from ._django import setup, make_users
+
+
+def refresh_chain(view, factory, refresh_tokens, total):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    chains = list(refresh_tokens)
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(total):
+            slot = i % len(chains)
+            request = factory.post('/api/auth/refresh/', {'refresh': chains[slot]}, content_type='application/json')
+            response = view(request)
+            assert response.status_code == 200, response.data
+            chains[slot] = response.data.get('refresh', chains[slot])
+    elapsed = time.perf_counter() - started
+    return total / elapsed, len(queries) / total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--refreshes', type=int, default=2000)
+    parser.add_argument('--checks', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup()
+    from datetime import timedelta
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from rest_framework_simplejwt.views import TokenRefreshView
+    from api import tokens
+
+    users = make_users(args.users)
+    factory = RequestFactory()
+    print(f"{'serializer':<12}{'refreshes/s':>12}{'queries':>9}")
+    for label, serializer in (
+        ('stock', 'rest_framework_simplejwt.serializers.TokenRefreshSerializer'),
+        ('rotating', api_settings.TOKEN_REFRESH_SERIALIZER),
+    ):
+        cache.clear()
+        view = TokenRefreshView.as_view(_serializer_class=serializer)
+        refresh_tokens = [str(tokens.for_user(user)) for user in users]
+        throughput, queries = refresh_chain(view, factory, refresh_tokens, args.refreshes)
+        print(f'{label:<12}{throughput:>12.0f}{queries:>9.1f}')
+
+    access = AccessToken(str(tokens.for_user(users[0]).access_token))
+    started = time.perf_counter()
+    for _ in range(args.checks):
+        tokens.check(access)
+    per_check = (time.perf_counter() - started) / args.checks
+    print(f'revocation check: {per_check * 1e6:.1f} us, no queries')
+
+    # The revoked JTIs live only as long as the tokens they revoke.
+    revoked = sum(1 for key in cache._cache if ':token:revoked:' in key)
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME
+    print(f'revocation entries after the run: {revoked}, all gone within {lifetime // timedelta(hours=1)} h')
+
+
+if __name__ == '__main__':
+    main()
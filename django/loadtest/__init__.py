@@ -0,0 +1,19 @@
+"""
+Load-test harness: a fleet of simulated mobile clients for capacity planning.
+
+Each client logs in through auth/login/, then loops over weighted actions
+like the app does: polling the friend list and ping history (with
+If-None-Match), sending pings of a configured type mix, acking the pings it
+received and sending heartbeats. The fleet, the action weights and the ping
+mix come from a TOML file (see loadtest/mixes/). Requires the httpx package.
+
+Run from the `django/` folder, against a server using the same database:
+
+    python -m loadtest seed --config loadtest/mixes/steady.toml
+    python -m loadtest run --config loadtest/mixes/steady.toml --base-url http://127.0.0.1:8000
+
+`seed` creates the fleet's accounts and friendships through the ORM, with the
+DATABASE_URL from the environment or backend/.env. Start the server with
+THROTTLE_ENABLED=false unless the limits themselves are under test: the whole
+fleet logs in from one IP.
+"""
@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from . import config as fleet_config
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description="Simulated mobile client fleet.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_parser = commands.add_parser('seed', help="Create the fleet's accounts and friendships.")
+    seed_parser.add_argument('--config', required=True)
+    run_parser = commands.add_parser('run', help="Run the fleet against a server and report per endpoint.")
+    run_parser.add_argument('--config', required=True)
+    run_parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    run_parser.add_argument('--json', help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    try:
+        config = fleet_config.load(args.config)
+    except (OSError, ValueError) as exc:
+        sys.exit(f'{args.config}: {exc}')
+
+    if args.command == 'seed':
+        from .seed import seed
+
+        created, friendships = seed(config)
+        print(f"{config['fleet']['clients']} clients ({created} new), {friendships} new friendships")
+        return
+
+    from .fleet import run_fleet
+
+    fleet = config['fleet']
+    print(
+        f"{fleet['clients']} clients against {args.base_url}: "
+        f"{fleet['ramp_up_seconds']} s ramp-up, {fleet['duration_seconds']} s steady"
+    )
+    stats, elapsed = asyncio.run(run_fleet(config, args.base_url))
+    rows = stats.report(elapsed)
+    print(f"{'endpoint':<28}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'4xx %':>7}{'429 %':>7}{'err %':>7}")
+    for row in rows:
+        print(
+            f"{row['endpoint']:<28}{row['requests']:>9}{row['throughput']:>8.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+            f"{row['rejected_rate'] * 100:>7.1f}{row['throttled_rate'] * 100:>7.1f}{row['error_rate'] * 100:>7.1f}"
+        )
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': config, 'elapsed_seconds': elapsed, 'endpoints': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
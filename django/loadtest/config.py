@@ -0,0 +1,44 @@
+import tomllib
+
+ACTIONS = ('poll_friends', 'poll_history', 'send_ping', 'ack_deliveries', 'heartbeat')
+PING_TYPES = ('status', 'battery', 'emergency')
+
+DEFAULTS = {
+    'fleet': {
+        'clients': 50,
+        'ramp_up_seconds': 10,
+        'duration_seconds': 60,
+        'think_time_seconds': [2.0, 8.0],
+        'connections': 100,
+        'email': 'loadtest{i}@example.com',
+        'password': 'loadtest-pass',
+    },
+    'seed': {
+        'friends_per_client': 8,
+        'vip_ratio': 0.8,
+    },
+    'actions': dict.fromkeys(ACTIONS, 1),
+    'ping_types': dict.fromkeys(PING_TYPES, 1),
+}
+
+
+def load(path):
+    """The TOML file at `path` over DEFAULTS; raises ValueError if it is inconsistent."""
+    with open(path, 'rb') as f:
+        data = tomllib.load(f)
+    config = {section: {**values, **data.get(section, {})} for section, values in DEFAULTS.items()}
+    unknown = set(data) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    for section, names in (('actions', ACTIONS), ('ping_types', PING_TYPES)):
+        weights = config[section]
+        if set(weights) - set(names):
+            raise ValueError(f"Unknown {section}: {', '.join(sorted(set(weights) - set(names)))}")
+        if not any(weights.values()) or min(weights.values()) < 0:
+            raise ValueError(f"{section} needs non-negative weights, at least one of them positive.")
+    low, high = config['fleet']['think_time_seconds']
+    if not 0 <= low <= high:
+        raise ValueError("think_time_seconds must be [low, high] with 0 <= low <= high.")
+    if config['seed']['friends_per_client'] >= config['fleet']['clients']:
+        raise ValueError("friends_per_client must be below the number of clients.")
+    return config
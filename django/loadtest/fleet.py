@@ -0,0 +1,183 @@
+"""
+The simulated clients and the statistics they report.
+"""
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+MESSAGES = {
+    'status': 'On my way',
+    'battery': 'My battery is running low',
+    'emergency': 'I need help',
+}
+
+
+class Stats:
+    """Latency and outcome per endpoint, keyed like 'GET friends/'."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))  # endpoint -> '2xx'/'304'/'4xx'/'429'/'5xx'/'failed'
+
+    def record(self, endpoint, seconds, outcome):
+        self.latencies[endpoint].append(seconds)
+        self.outcomes[endpoint][outcome] += 1
+
+    def report(self, elapsed):
+        rows = []
+        for endpoint in sorted(self.latencies):
+            latencies = self.latencies[endpoint]
+            outcomes = self.outcomes[endpoint]
+            q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(latencies),
+                'throughput': len(latencies) / elapsed,
+                'p50_ms': q[49] * 1000,
+                'p95_ms': q[94] * 1000,
+                'p99_ms': q[98] * 1000,
+                'rejected_rate': outcomes['4xx'] / len(latencies),
+                'throttled_rate': outcomes['429'] / len(latencies),
+                'error_rate': (outcomes['5xx'] + outcomes['failed']) / len(latencies),
+                'outcomes': dict(outcomes),
+            })
+        return rows
+
+
+def outcome(status_code):
+    if status_code in (304, 429):
+        return str(status_code)
+    return f'{status_code // 100}xx'
+
+
+def weighted(weights):
+    names = [name for name, weight in weights.items() if weight > 0]
+    return random.choices(names, weights=[weights[name] for name in names])[0]
+
+
+class MobileClient:
+    """One app install: logs in, then polls, pings and acks like the real client."""
+
+    def __init__(self, index, config, http, stats):
+        self.config = config
+        self.email = config['fleet']['email'].format(i=index)
+        self.username = self.email.split('@')[0]
+        self.http = http
+        self.stats = stats
+        self.access = self.refresh = None
+        self.etags = {}
+        self.friend_ids = []
+        self.unacked = set()
+
+    async def request(self, endpoint, method, path, retry_auth=True, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if self.access:
+            headers['Authorization'] = f'Bearer {self.access}'
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(endpoint, time.perf_counter() - started, 'failed')
+            return None
+        self.stats.record(endpoint, time.perf_counter() - started, outcome(response.status_code))
+        if response.status_code == 401 and retry_auth and self.refresh:
+            # Access token expired: refresh once, as the app does, and retry.
+            if await self.refresh_tokens():
+                return await self.request(endpoint, method, path, retry_auth=False, headers=headers, **kwargs)
+        return response
+
+    async def login(self):
+        self.access = None
+        response = await self.request(
+            'POST auth/login/', 'POST', '/api/auth/login/',
+            json={'email': self.email, 'password': self.config['fleet']['password']},
+        )
+        if response is None or response.status_code != 200:
+            return False
+        data = response.json()
+        self.access, self.refresh = data['access'], data['refresh']
+        return True
+
+    async def refresh_tokens(self):
+        access, self.access = self.access, None
+        response = await self.request('POST auth/refresh/', 'POST', '/api/auth/refresh/', json={'refresh': self.refresh})
+        if response is None or response.status_code != 200:
+            self.access = access
+            return False
+        data = response.json()
+        self.access, self.refresh = data['access'], data.get('refresh', self.refresh)
+        return True
+
+    async def poll(self, endpoint, path):
+        """GET with the last ETag, like the app's pollers. Returns the body if it changed."""
+        headers = {'If-None-Match': self.etags[path]} if path in self.etags else {}
+        response = await self.request(endpoint, 'GET', path, headers=headers)
+        if response is None or response.status_code != 200:
+            return None
+        if 'ETag' in response.headers:
+            self.etags[path] = response.headers['ETag']
+        return response.json()
+
+    async def poll_friends(self):
+        friends = await self.poll('GET friends/', '/api/friends/')
+        if friends is not None:
+            self.friend_ids = [friend['id'] for friend in friends]
+
+    async def poll_history(self):
+        pings = await self.poll('GET pings/history/', '/api/pings/history/')
+        if pings is not None:
+            self.unacked = {
+                ping['id'] for ping in pings if ping['receiver_name'] == self.username and ping['status'] == 'sent'
+            }
+
+    async def send_ping(self):
+        if not self.friend_ids:
+            return await self.poll_friends()
+        ping_type = weighted(self.config['ping_types'])
+        body = {'receiver': random.choice(self.friend_ids), 'ping_type': ping_type, 'message': MESSAGES[ping_type]}
+        if ping_type == 'battery':
+            body['battery_level'] = random.randint(1, 15)
+        if ping_type == 'emergency':
+            body['latitude'] = round(random.uniform(-60, 60), 6)
+            body['longitude'] = round(random.uniform(-180, 180), 6)
+        await self.request('POST pings/send/', 'POST', '/api/pings/send/', json=body)
+
+    async def ack_deliveries(self):
+        if not self.unacked:
+            return await self.poll_history()
+        for ping_id in list(self.unacked)[:5]:
+            self.unacked.discard(ping_id)
+            await self.request('POST pings/:id/delivered/', 'POST', f'/api/pings/{ping_id}/delivered/')
+
+    async def heartbeat(self):
+        await self.request('POST user/heartbeat/', 'POST', '/api/user/heartbeat/')
+
+    async def run(self, start_at, stop_at):
+        await asyncio.sleep(max(0, start_at - time.monotonic()))
+        if not await self.login():
+            return
+        await self.poll_friends()
+        low, high = self.config['fleet']['think_time_seconds']
+        while time.monotonic() < stop_at:
+            await asyncio.sleep(random.uniform(low, high))
+            if time.monotonic() >= stop_at:
+                break
+            await getattr(self, weighted(self.config['actions']))()
+
+
+async def run_fleet(config, base_url):
+    fleet = config['fleet']
+    stats = Stats()
+    limits = httpx.Limits(max_connections=fleet['connections'])
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        started = time.monotonic()
+        stop_at = started + fleet['ramp_up_seconds'] + fleet['duration_seconds']
+        step = fleet['ramp_up_seconds'] / fleet['clients']
+        clients = [MobileClient(i, config, http, stats) for i in range(fleet['clients'])]
+        await asyncio.gather(*(client.run(started + i * step, stop_at) for i, client in enumerate(clients)))
+        elapsed = time.monotonic() - started
+    return stats, elapsed
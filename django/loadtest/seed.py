@@ -0,0 +1,63 @@
+"""
+Creates the fleet's accounts and friendships directly through the ORM.
+
+Clients sit on a ring and each is friends with the `friends_per_client / 2`
+clients on either side of it, so all have the same number of friends. Rows
+are bulk inserted: no sync log or ETag bumps, which fresh accounts do not
+need.
+Accounts that already exist are reused, so seeding twice is harmless.
+"""
+import os
+import random
+
+
+def seed(config):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+    from django.db.models import Q
+
+    from api.models import Friendship, UserProfile
+
+    User = get_user_model()
+    fleet, settings = config['fleet'], config['seed']
+    emails = [fleet['email'].format(i=i) for i in range(fleet['clients'])]
+    password = make_password(fleet['password'])
+
+    with transaction.atomic():
+        existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        User.objects.bulk_create(
+            [User(username=email.split('@')[0], email=email, password=password) for email in emails if email not in existing],
+            batch_size=1000,
+        )
+        ids = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+        user_ids = [ids[email] for email in emails]
+        with_profile = set(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in user_ids if user_id not in with_profile], batch_size=1000
+        )
+
+        linked = {
+            frozenset(pair) for pair in Friendship.objects.filter(
+                Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids)
+            ).values_list('sender_id', 'receiver_id')
+        }
+        friendships = []
+        for i, sender_id in enumerate(user_ids):
+            for offset in range(1, settings['friends_per_client'] // 2 + 1):
+                receiver_id = user_ids[(i + offset) % len(user_ids)]
+                if frozenset((sender_id, receiver_id)) in linked:
+                    continue
+                linked.add(frozenset((sender_id, receiver_id)))
+                vip = random.random() < settings['vip_ratio']
+                friendships.append(Friendship(
+                    sender_id=sender_id, receiver_id=receiver_id, status='accepted',
+                    sender_is_vip=vip, receiver_is_vip=vip,
+                ))
+        Friendship.objects.bulk_create(friendships, batch_size=1000)
+
+    return len(user_ids) - len(existing), len(friendships)